@@ -19,6 +19,7 @@
 
 import argparse
 import os
+import sys
 import time
 
 import arrow
@@ -37,12 +38,14 @@ from pyvoltha.common.utils.nethelpers import get_my_primary_local_ipv4, \
     get_my_primary_interface
 from pyvoltha.common.utils.registry import registry, IComponent
 from pyvoltha.adapters.kafka.adapter_proxy import AdapterProxy
-from pyvoltha.adapters.kafka.adapter_request_facade import AdapterRequestFacade
 from pyvoltha.adapters.kafka.core_proxy import CoreProxy
 from pyvoltha.adapters.kafka.kafka_inter_container_library import IKafkaMessagingProxy, \
     get_messaging_proxy
 from pyvoltha.adapters.kafka.kafka_proxy import KafkaProxy, get_kafka_proxy
 from openolt import OpenoltAdapter
+from openolt_request_facade import OpenOltRequestFacade
+from openolt_shard import OpenoltShardedAdapter, OpenOltShardWorker, \
+    shard_topic
 #from voltha_protos import third_party
 from voltha_protos.adapter_pb2 import AdapterConfig
 
@@ -68,6 +71,32 @@ defs = dict(
     backend=os.environ.get('BACKEND', 'none'),
     retry_interval=os.environ.get('RETRY_INTERVAL', 2),
     heartbeat_topic=os.environ.get('HEARTBEAT_TOPIC', "adapters.heartbeat"),
+    indication_lanes=os.environ.get('INDICATION_LANES',
+                                    'high:10000:block,'
+                                    'alarm:2000:drop_oldest,'
+                                    'stats:1000:coalesce'),
+    indication_batch_size=int(os.environ.get('INDICATION_BATCH_SIZE', 100)),
+    metrics_interval=int(os.environ.get('METRICS_INTERVAL', 60)),
+    grpc_timeout=int(os.environ.get('GRPC_TIMEOUT', 30)),
+    olt_connect_max_delay=int(os.environ.get('OLT_CONNECT_MAX_DELAY', 120)),
+    olt_bringup_concurrency=int(os.environ.get('OLT_BRINGUP_CONCURRENCY', 8)),
+    shards=int(os.environ.get('SHARDS', 0)),
+    indication_capture_dir=os.environ.get('INDICATION_CAPTURE_DIR', ''),
+    onu_discovery_ttl=int(os.environ.get('ONU_DISCOVERY_TTL', 300)),
+    onu_discovery_max=int(os.environ.get('ONU_DISCOVERY_MAX', 8192)),
+    onu_activation_concurrency=int(os.environ.get(
+        'ONU_ACTIVATION_CONCURRENCY', 8)),
+    onu_activation_rate=float(os.environ.get('ONU_ACTIVATION_RATE', 16)),
+    omci_onu_window=int(os.environ.get('OMCI_ONU_WINDOW', 2)),
+    omci_pon_window=int(os.environ.get('OMCI_PON_WINDOW', 64)),
+    omci_timeout=float(os.environ.get('OMCI_TIMEOUT', 10)),
+    stream_batch_window=float(os.environ.get('STREAM_BATCH_WINDOW', 0.002)),
+    stream_batch_size=int(os.environ.get('STREAM_BATCH_SIZE', 64)),
+    flow_batch_window=float(os.environ.get('FLOW_BATCH_WINDOW', 0.005)),
+    flow_batch_size=int(os.environ.get('FLOW_BATCH_SIZE', 128)),
+    packet_in_rates=os.environ.get('PACKET_IN_RATES',
+                                   'eapol:20:50,lldp:5:10,ipv4:50:200,'
+                                   'ipv6:50:200,arp:20:50,default:20:50'),
 )
 
 
@@ -225,6 +254,208 @@ def parse_args():
                         default=defs['core_topic'],
                         help=_help)
 
+    _help = ('priority lanes buffering indications between the gRPC '
+             'indications thread and the reactor, per OLT, from highest to '
+             'lowest priority, as <lane>:<capacity>:<policy>[,...] with '
+             'policy one of block, drop_oldest, drop_newest, coalesce '
+             '(default: %s)' % defs['indication_lanes'])
+    parser.add_argument('--indication_lanes',
+                        dest='indication_lanes',
+                        action='store',
+                        default=defs['indication_lanes'],
+                        help=_help)
+
+    _help = ('maximum number of indications handled per reactor tick, '
+             'per OLT (default: %s)' % defs['indication_batch_size'])
+    parser.add_argument('--indication_batch_size',
+                        dest='indication_batch_size',
+                        action='store',
+                        type=int,
+                        default=defs['indication_batch_size'],
+                        help=_help)
+
+    _help = ('interval in seconds at which per OLT adapter metrics are '
+             'logged, 0 to disable (default: %s)' % defs['metrics_interval'])
+    parser.add_argument('--metrics_interval',
+                        dest='metrics_interval',
+                        action='store',
+                        type=int,
+                        default=defs['metrics_interval'],
+                        help=_help)
+
+    _help = ('default deadline in seconds of the gRPC calls to the OLTs '
+             '(default: %s)' % defs['grpc_timeout'])
+    parser.add_argument('--grpc_timeout',
+                        dest='grpc_timeout',
+                        action='store',
+                        type=int,
+                        default=defs['grpc_timeout'],
+                        help=_help)
+
+    _help = ('maximum backoff delay in seconds between two attempts to '
+             'connect to an OLT before giving up (default: %s)'
+             % defs['olt_connect_max_delay'])
+    parser.add_argument('--olt_connect_max_delay',
+                        dest='olt_connect_max_delay',
+                        action='store',
+                        type=int,
+                        default=defs['olt_connect_max_delay'],
+                        help=_help)
+
+    _help = ('maximum number of OLTs brought up concurrently '
+             '(default: %s)' % defs['olt_bringup_concurrency'])
+    parser.add_argument('--olt_bringup_concurrency',
+                        dest='olt_bringup_concurrency',
+                        action='store',
+                        type=int,
+                        default=defs['olt_bringup_concurrency'],
+                        help=_help)
+
+    _help = ('number of worker processes the OLT device handlers are '
+             'spread across, 0 to run them all in this process '
+             '(default: %s)' % defs['shards'])
+    parser.add_argument('--shards',
+                        dest='shards',
+                        action='store',
+                        type=int,
+                        default=defs['shards'],
+                        help=_help)
+
+    _help = ('directory where the indications received from each OLT are '
+             'recorded, in <device id>.ind, for offline replay. Empty to '
+             'disable (default: %s)' % defs['indication_capture_dir'])
+    parser.add_argument('--indication_capture_dir',
+                        dest='indication_capture_dir',
+                        action='store',
+                        default=defs['indication_capture_dir'],
+                        help=_help)
+
+    _help = ('seconds during which the repeated discovery indications of '
+             'an ONU are suppressed once one has been handled '
+             '(default: %s)' % defs['onu_discovery_ttl'])
+    parser.add_argument('--onu_discovery_ttl',
+                        dest='onu_discovery_ttl',
+                        action='store',
+                        type=int,
+                        default=defs['onu_discovery_ttl'],
+                        help=_help)
+
+    _help = ('maximum number of ONU serial numbers remembered per OLT to '
+             'suppress repeated discovery indications (default: %s)'
+             % defs['onu_discovery_max'])
+    parser.add_argument('--onu_discovery_max',
+                        dest='onu_discovery_max',
+                        action='store',
+                        type=int,
+                        default=defs['onu_discovery_max'],
+                        help=_help)
+
+    _help = ('maximum number of ONU activations in progress at once, per '
+             'PON (default: %s)' % defs['onu_activation_concurrency'])
+    parser.add_argument('--onu_activation_concurrency',
+                        dest='onu_activation_concurrency',
+                        action='store',
+                        type=int,
+                        default=defs['onu_activation_concurrency'],
+                        help=_help)
+
+    _help = ('maximum number of ONU activations started per second, per '
+             'PON, 0 for no limit (default: %s)'
+             % defs['onu_activation_rate'])
+    parser.add_argument('--onu_activation_rate',
+                        dest='onu_activation_rate',
+                        action='store',
+                        type=float,
+                        default=defs['onu_activation_rate'],
+                        help=_help)
+
+    _help = ('maximum number of OMCI requests awaiting a response, per '
+             'ONU (default: %s)' % defs['omci_onu_window'])
+    parser.add_argument('--omci_onu_window',
+                        dest='omci_onu_window',
+                        action='store',
+                        type=int,
+                        default=defs['omci_onu_window'],
+                        help=_help)
+
+    _help = ('maximum number of OMCI requests awaiting a response, per '
+             'PON (default: %s)' % defs['omci_pon_window'])
+    parser.add_argument('--omci_pon_window',
+                        dest='omci_pon_window',
+                        action='store',
+                        type=int,
+                        default=defs['omci_pon_window'],
+                        help=_help)
+
+    _help = ('seconds after which an OMCI request without response no '
+             'longer counts against the windows (default: %s)'
+             % defs['omci_timeout'])
+    parser.add_argument('--omci_timeout',
+                        dest='omci_timeout',
+                        action='store',
+                        type=float,
+                        default=defs['omci_timeout'],
+                        help=_help)
+
+    _help = ('seconds during which OMCI messages and packet-outs are '
+             'collected into one streaming call, when the OLT supports it. '
+             '0 to send each in its own call (default: %s)'
+             % defs['stream_batch_window'])
+    parser.add_argument('--stream_batch_window',
+                        dest='stream_batch_window',
+                        action='store',
+                        type=float,
+                        default=defs['stream_batch_window'],
+                        help=_help)
+
+    _help = ('maximum number of OMCI messages or packet-outs sent in one '
+             'streaming call (default: %s)' % defs['stream_batch_size'])
+    parser.add_argument('--stream_batch_size',
+                        dest='stream_batch_size',
+                        action='store',
+                        type=int,
+                        default=defs['stream_batch_size'],
+                        help=_help)
+
+    _help = ('seconds to wait for more flows to add or remove before sending '
+             'them in one FlowAddBatch or FlowRemoveBatch call, 0 to send '
+             'each flow in its own call (default: %s)'
+             % defs['flow_batch_window'])
+    parser.add_argument('--flow_batch_window',
+                        dest='flow_batch_window',
+                        action='store',
+                        type=float,
+                        default=defs['flow_batch_window'],
+                        help=_help)
+
+    _help = ('maximum number of flows sent in one batch call (default: %s)'
+             % defs['flow_batch_size'])
+    parser.add_argument('--flow_batch_size',
+                        dest='flow_batch_size',
+                        action='store',
+                        type=int,
+                        default=defs['flow_batch_size'],
+                        help=_help)
+
+    _help = ('packet-in rate limits per logical port, as '
+             '<class>:<packets per second>:<burst>[,...] with class one of '
+             'eapol, lldp, ipv4, ipv6, arp or default for the others. A '
+             'rate of 0 disables the limit (default: %s)'
+             % defs['packet_in_rates'])
+    parser.add_argument('--packet_in_rates',
+                        dest='packet_in_rates',
+                        action='store',
+                        default=defs['packet_in_rates'],
+                        help=_help)
+
+    # Internal, set by the sharding router on its worker processes
+    parser.add_argument('--shard_index',
+                        dest='shard_index',
+                        action='store',
+                        type=int,
+                        default=None,
+                        help=argparse.SUPPRESS)
+
     args = parser.parse_args()
 
     # post-processing
@@ -293,6 +524,12 @@ class Main(object):
 
         self.core_topic = args.core_topic
         self.listening_topic = args.name
+        self.group_id_prefix = args.instance_id
+        if args.shard_index is not None:
+            # Shard worker, talking to the core on its own topic
+            self.listening_topic = shard_topic(args.name, args.shard_index)
+            self.group_id_prefix = shard_topic(args.instance_id,
+                                               args.shard_index)
         self.startup_components()
 
         if not args.no_heartbeat:
@@ -368,14 +605,22 @@ class Main(object):
                 core_topic=self.core_topic,
                 my_listening_topic=self.listening_topic)
 
-            self.adapter = OpenoltAdapter(core_proxy=self.core_proxy,
-                                          adapter_proxy=self.adapter_proxy,
-                                          config=config)
+            if self.args.shards > 1 and self.args.shard_index is None:
+                self.adapter = OpenoltShardedAdapter(
+                    core_proxy=self.core_proxy,
+                    adapter_proxy=self.adapter_proxy,
+                    config=config,
+                    shards=self.args.shards,
+                    argv=sys.argv[1:])
+            else:
+                self.adapter = OpenoltAdapter(core_proxy=self.core_proxy,
+                                              adapter_proxy=self.adapter_proxy,
+                                              config=config)
 
             self.adapter.start()
 
-            openolt_request_handler = AdapterRequestFacade(adapter=self.adapter,
-                                                           core_proxy=self.core_proxy)
+            openolt_request_handler = OpenOltRequestFacade(
+                adapter=self.adapter, core_proxy=self.core_proxy)
 
             yield registry.register(
                 'kafka_adapter_proxy',
@@ -383,8 +628,8 @@ class Main(object):
                     kafka_host_port=self.args.kafka_adapter,
                     # TODO: Add KV Store object reference
                     kv_store=self.args.backend,
-                    default_topic=self.args.name,
-                    group_id_prefix=self.args.instance_id,
+                    default_topic=self.listening_topic,
+                    group_id_prefix=self.group_id_prefix,
                     # Needs to assign a real class
                     target_cls=openolt_request_handler
 
@@ -394,8 +639,13 @@ class Main(object):
             self.core_proxy.kafka_proxy = get_messaging_proxy()
             self.adapter_proxy.kafka_proxy = get_messaging_proxy()
 
-            # retry for ever
-            res = yield self._register_with_core(-1)
+            if self.args.shard_index is not None:
+                # The router registers with the core and forwards us the
+                # requests for our devices
+                OpenOltShardWorker(self.adapter).start()
+            else:
+                # retry for ever
+                res = yield self._register_with_core(-1)
 
             self.log.info('started-internal-services')
 
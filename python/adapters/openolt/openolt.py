@@ -21,6 +21,7 @@ import structlog
 
 from zope.interface import implementer
 from twisted.internet import reactor
+from twisted.internet.defer import DeferredSemaphore
 from pyvoltha.adapters.iadapter import IAdapterInterface
 from pyvoltha.common.utils.registry import registry
 from voltha_protos.common_pb2 import LogLevel
@@ -76,6 +77,9 @@ class OpenoltAdapter(object):
         log.debug('openolt.__init__', core_proxy=core_proxy, adapter_proxy=adapter_proxy)
         self.devices = dict()  # device_id -> OpenoltDevice()
         self.interface = registry('main').get_args().interface
+        # Limits the number of OLTs being brought up at the same time
+        self.bringup_semaphore = DeferredSemaphore(
+            registry('main').get_args().olt_bringup_concurrency)
         self.logical_device_id_to_root_device_id = dict()
         self.num_devices = 0
 
@@ -121,7 +125,8 @@ class OpenoltAdapter(object):
             'core_proxy': self.core_proxy,
             'adapter_proxy': self.adapter_proxy,
             'device': device,
-            'device_num': self.num_devices + 1
+            'device_num': self.num_devices + 1,
+            'bringup_semaphore': self.bringup_semaphore
         }
         try:
             self.devices[device.id] = OpenoltDevice(**kwargs)
@@ -141,7 +146,8 @@ class OpenoltAdapter(object):
             'adapter_proxy': self.adapter_proxy,
             'device': device,
             'device_num': self.num_devices + 1,
-            'reconciliation': True
+            'reconciliation': True,
+            'bringup_semaphore': self.bringup_semaphore
         }
         try:
             reconciled_device = OpenoltDevice(**kwargs)
@@ -167,17 +173,17 @@ class OpenoltAdapter(object):
     def disable_device(self, device):
         log.info('disable-device', device=device)
         handler = self.devices[device.id]
-        handler.disable()
+        return handler.disable()
 
     def reenable_device(self, device):
         log.info('reenable-device', device=device)
         handler = self.devices[device.id]
-        handler.reenable()
+        return handler.reenable()
 
     def reboot_device(self, device):
         log.info('reboot_device', device=device)
         handler = self.devices[device.id]
-        handler.reboot()
+        return handler.reboot()
 
     def download_image(self, device, request):
         log.info('image_download - Not implemented yet', device=device,
@@ -244,8 +250,8 @@ class OpenoltAdapter(object):
                   flows_to_remove=flows_to_remove)
         assert len(groups) == 0, "Cannot yet deal with groups"
         handler = self.devices[device_id]
-        handler.update_logical_flows(flows_to_add, flows_to_remove,
-                                     device_rules_map)
+        return handler.update_logical_flows(flows_to_add, flows_to_remove,
+                                            device_rules_map)
 
     def update_pm_config(self, device, pm_configs):
         log.info('update_pm_config - Not implemented yet', device=device,
@@ -257,7 +263,7 @@ class OpenoltAdapter(object):
                   proxy_address=proxy_address,
                   proxied_msg=msg)
         handler = self.devices[proxy_address.device_id]
-        handler.send_proxied_message(proxy_address, msg)
+        return handler.send_proxied_message(proxy_address, msg)
 
     def receive_proxied_message(self, proxy_address, msg):
         log.debug('receive_proxied_message - Not implemented',
@@ -280,7 +286,7 @@ class OpenoltAdapter(object):
         try:
             device_id = ldi_to_di(logical_device_id)
             handler = self.devices[device_id]
-            handler.packet_out(egress_port_no, msg)
+            return handler.packet_out(egress_port_no, msg)
         except Exception as e:
             log.error('packet-out:exception', e=e.message)
 
@@ -400,7 +406,7 @@ class OpenoltAdapter(object):
                  child_device=child_device)
         handler = self.devices[parent_device_id]
         if handler is not None:
-            handler.delete_child_device(child_device)
+            return handler.delete_child_device(child_device)
         else:
             log.error('Could not find matching handler',
                       looking_for_device_id=parent_device_id,
@@ -411,7 +417,7 @@ class OpenoltAdapter(object):
         log.info('collect_stats', device_id=device_id)
         handler = self.devices[device_id]
         if handler is not None:
-            handler.trigger_statistics_collection()
+            return handler.trigger_statistics_collection()
         else:
             log.error('Could not find matching handler',
                       looking_for_device_id=device_id,
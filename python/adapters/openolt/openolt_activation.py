@@ -0,0 +1,129 @@
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredSemaphore, inlineCallbacks, \
+    maybeDeferred, returnValue, succeed
+from twisted.internet.task import deferLater
+
+# Time to activate buckets in seconds, from 10ms to 2mn
+ACTIVATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                      30.0, 60.0, 120.0)
+
+
+class OpenOltPonActivations(object):
+    """
+    Activation state of a single PON: the semaphore bounding the concurrent
+    activations and the next start slot for pacing.
+    """
+
+    def __init__(self, intf_id, concurrency):
+        self.intf_id = intf_id
+        self.semaphore = DeferredSemaphore(concurrency)
+        self.next_slot = 0.0
+        self.pending = set()
+
+
+class OpenOltActivationPipeline(object):
+    """
+    Runs ONU activations, per PON, with at most concurrency of them in
+    progress at once, and their starts spaced to at most rate per second
+    (0 for no pacing). PONs are independent of each other.
+
+    An activation is any callable returning a value or a Deferred, e.g.
+
+        yield pipeline.submit(intf_id, serial_number_str,
+                              self.activate_onu, intf_id, onu_id, ...)
+
+    The time from submission to completion of each activation is observed in
+    the onu_activation_time histogram, the part of it spent waiting for a
+    slot in onu_activation_wait.
+    """
+
+    def __init__(self, log, metrics, concurrency, rate):
+        self.log = log
+        self.metrics = metrics
+        self.concurrency = max(1, concurrency)
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.pons = dict()
+
+    def pon(self, intf_id):
+        pon = self.pons.get(intf_id)
+        if pon is None:
+            pon = self.pons[intf_id] = OpenOltPonActivations(
+                intf_id, self.concurrency)
+        return pon
+
+    def pending(self, intf_id, serial_number):
+        pon = self.pons.get(intf_id)
+        return pon is not None and serial_number in pon.pending
+
+    def submit(self, intf_id, serial_number, activation, *args, **kwargs):
+        """
+        Queues the activation of the ONU serial_number on PON intf_id.
+        Returns a Deferred firing with the activation result. An ONU already
+        queued or being activated on that PON is not queued again, the
+        returned Deferred fires with None.
+        """
+        pon = self.pon(intf_id)
+        if serial_number in pon.pending:
+            self.metrics.incr('onu_activation_duplicate')
+            self.log.debug('onu-activation-already-pending', intf_id=intf_id,
+                           serial_number=serial_number)
+            return succeed(None)
+
+        pon.pending.add(serial_number)
+        self._update_gauges()
+        return pon.semaphore.run(self._run, pon, serial_number, time.time(),
+                                 activation, *args, **kwargs)
+
+    @inlineCallbacks
+    def _run(self, pon, serial_number, submitted, activation, *args,
+             **kwargs):
+        try:
+            delay = self._reserve_slot(pon)
+            if delay > 0:
+                yield deferLater(reactor, delay, lambda: None)
+
+            started = time.time()
+            self.metrics.observe('onu_activation_wait', started - submitted,
+                                 ACTIVATION_BUCKETS)
+            result = yield maybeDeferred(activation, *args, **kwargs)
+            self.metrics.incr('onu_activation_succeeded')
+            returnValue(result)
+        except Exception:
+            self.metrics.incr('onu_activation_failed')
+            raise
+        finally:
+            self.metrics.observe('onu_activation_time',
+                                 time.time() - submitted, ACTIVATION_BUCKETS)
+            pon.pending.discard(serial_number)
+            self._update_gauges()
+
+    def _reserve_slot(self, pon):
+        if self.interval <= 0:
+            return 0
+        now = time.time()
+        slot = max(now, pon.next_slot)
+        pon.next_slot = slot + self.interval
+        return slot - now
+
+    def _update_gauges(self):
+        self.metrics.set_gauge(
+            'onu_activation_pending',
+            sum(len(pon.pending) for pon in self.pons.itervalues()))
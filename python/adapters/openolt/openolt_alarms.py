@@ -65,6 +65,9 @@ class OpenOltAlarmMgr(object):
             self.log.exception("alarmhandler-init-error", errmsg=initerr.message)
             raise Exception(initerr)
 
+    def register_indication_handlers(self, router):
+        router.register('alarm_ind', self.process_alarms)
+
     def process_alarms(self, alarm_ind):
         try:
             self.log.debug('alarm-indication', alarm=alarm_ind, device_id=self.device_id)
@@ -13,16 +13,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import os
 import threading
 import binascii
 import grpc
+import random
 import socket
 import re
 import structlog
 import time
 from twisted.internet import reactor
-from twisted.internet.defer import inlineCallbacks, returnValue
-from scapy.layers.l2 import Ether, Dot1Q
+from twisted.internet.defer import inlineCallbacks, returnValue, \
+    DeferredSemaphore
 from transitions import Machine
 
 from voltha_protos import openolt_pb2_grpc, openolt_pb2
@@ -35,12 +37,25 @@ from voltha_protos.openflow_13_pb2 import OFPPS_LIVE, OFPPF_FIBER, \
     OFPC_GROUP_STATS, OFPC_PORT_STATS, OFPC_TABLE_STATS, OFPC_FLOW_STATS, \
     ofp_switch_features, ofp_port, ofp_port_stats, ofp_desc
 from pyvoltha.common.utils.registry import registry
+from pyvoltha.common.utils.asleep import asleep
 from voltha_protos.common_pb2 import AdminState, OperStatus, ConnectStatus
 from voltha_protos.device_pb2 import Port, Device
 from voltha_protos.inter_container_pb2 import SwitchCapability, PortCapability, \
     InterAdapterMessageType, InterAdapterOmciMessage
 from voltha_protos.logical_device_pb2 import LogicalDevice, LogicalPort
 
+from openolt_grpc import OpenOltAsyncStub, OpenOltBatchSender, \
+    OpenOltFlowBatchSender
+from openolt_activation import OpenOltActivationPipeline
+from openolt_indication_capture import OpenOltIndicationRecorder
+from openolt_indications import OpenOltDiscoveryFilter, \
+    OpenOltIndicationQueue, OpenOltIndicationRouter
+from openolt_metrics import OpenOltMetrics
+from openolt_omci import OpenOltOmciTracker, OmciDropped
+from openolt_onu_registry import OpenOltOnuRegistry
+from openolt_packet import HexDump, OpenOltPacketInLimiter, \
+    OpenOltPacketOutEncoder
+
 
 class OpenoltDevice(object):
     """
@@ -97,9 +112,17 @@ class OpenoltDevice(object):
         self.stats_mgr_class = kwargs['support_classes']['stats_mgr']
         self.bw_mgr_class = kwargs['support_classes']['bw_mgr']
 
-        self.seen_discovery_indications = []
+        # Shared by all the devices of the adapter, limits how many OLTs are
+        # brought up concurrently
+        self.bringup_semaphore = kwargs.get('bringup_semaphore') or \
+            DeferredSemaphore(1)
+
         self.stub = None
+        self.async_stub = None
         self.connected = False
+        # Set once a bring up is done, whether it succeeded or gave up
+        self.connect_done = threading.Event()
+        self.stopped = False
         is_reconciliation = kwargs.get('reconciliation', False)
         self.device_id = self.device.id
         self.host_and_port = self.device.host_and_port
@@ -110,6 +133,43 @@ class OpenoltDevice(object):
 
         self.log.info('openolt-device-init')
 
+        self.args = registry('main').get_args()
+        self.metrics = OpenOltMetrics(self.log)
+        self.metrics.start_reporting(self.args.metrics_interval)
+        self.indication_queue = None
+        # The platform is only known once connected
+        self.onu_registry = OpenOltOnuRegistry(self.log, self.metrics,
+                                               self.core_proxy,
+                                               self.device_id, None)
+        self.flow_mgr = None
+        self.packet_out_encoder = None
+        self.omci_sender = None
+        self.onu_packet_sender = None
+        self.uplink_packet_sender = None
+        self.discovery_filter = OpenOltDiscoveryFilter(
+            self.log, self.metrics, self.args.onu_discovery_ttl,
+            self.args.onu_discovery_max)
+        self.activation_pipeline = OpenOltActivationPipeline(
+            self.log, self.metrics, self.args.onu_activation_concurrency,
+            self.args.onu_activation_rate)
+        self.omci_tracker = OpenOltOmciTracker(
+            self.log, self.metrics, self.args.omci_onu_window,
+            self.args.omci_pon_window, self.args.omci_timeout)
+        self.packet_in_limiter = OpenOltPacketInLimiter(
+            self.log, self.metrics, self.args.packet_in_rates)
+        self.packet_in_limiter.start_reporting(self.args.metrics_interval)
+        self.indication_router = OpenOltIndicationRouter(self.log,
+                                                         self.metrics)
+        self.indication_router.register('olt_ind', self.olt_indication)
+        self.indication_router.register('intf_ind', self.intf_indication)
+        self.indication_router.register('intf_oper_ind',
+                                        self.intf_oper_indication)
+        self.indication_router.register('onu_disc_ind',
+                                        self.onu_discovery_indication)
+        self.indication_router.register('onu_ind', self.onu_indication)
+        self.indication_router.register('omci_ind', self.omci_indication)
+        self.indication_router.register('pkt_ind', self.packet_indication)
+
         # default device id and device serial number. If device_info provides better results, they will be updated
         self.dpid = kwargs.get('dp_id')
         self.serial_number = self.host_and_port  # FIXME
@@ -241,26 +301,64 @@ class OpenoltDevice(object):
         self.log.debug("do_state_connected")
         
         self.stub = openolt_pb2_grpc.OpenoltStub(self.channel)
+        self.async_stub = OpenOltAsyncStub(
+            self.stub, default_timeout=self.args.grpc_timeout,
+            metrics=self.metrics)
 
-        delay = 1
-        while True:
-            try:
-                self.device_info = self.stub.GetDeviceInfo(openolt_pb2.Empty())
-                break
-            except Exception as e:
-                reraise = True
-                if delay > 120:
-                    self.log.error("gRPC failure too many times")
-                else:
-                    self.log.warn("gRPC failure, retry in %ds: %s"
-                                  % (delay, repr(e)))
-                    time.sleep(delay)
+        self.connected = False
+        try:
+            # Retry with exponential backoff and jitter, without holding a
+            # bring-up slot while waiting
+            delay = 1
+            while not self.stopped:
+                yield self.bringup_semaphore.acquire()
+                try:
+                    self.device_info = yield self.async_stub.GetDeviceInfo(
+                        openolt_pb2.Empty())
+                    break
+                except Exception as e:
+                    self.bringup_semaphore.release()
+                    if delay > self.args.olt_connect_max_delay:
+                        self.log.error("gRPC failure too many times")
+                        raise
+                    retry_in = delay * random.uniform(0.5, 1.5)
+                    self.log.warn("gRPC failure, retry in %.1fs: %s"
+                                  % (retry_in, repr(e)))
+                    yield asleep(retry_in)
                     delay += delay
-                    reraise = False
+            else:
+                self.log.info('bring-up-cancelled')
+                return
 
-                if reraise:
-                    raise
+            try:
+                yield self.setup_connected_device()
+            finally:
+                self.bringup_semaphore.release()
+        finally:
+            self.connect_done.set()
+
+    def batch_sender(self, unary):
+        # Batches through the streaming variant of the RPC if the agent
+        # supports it
+        stream = unary + 'Stream'
+        return OpenOltBatchSender(
+            self.log, self.metrics, self.async_stub, unary, stream,
+            self.args.stream_batch_window, self.args.stream_batch_size,
+            enabled=stream in self.optional_rpcs())
+
+    def flow_batch_sender(self, unary):
+        return OpenOltFlowBatchSender(
+            self.log, self.metrics, self.async_stub, unary,
+            self.args.flow_batch_window, self.args.flow_batch_size,
+            enabled=unary + 'Batch' in self.optional_rpcs())
+
+    def optional_rpcs(self):
+        # DeviceInfo has no optional_rpcs with the protos of requirements.txt,
+        # the agent then offers none of them
+        return getattr(self.device_info, 'optional_rpcs', ())
 
+    @inlineCallbacks
+    def setup_connected_device(self):
         self.log.info('Device connected', device_info=self.device_info)
 
         # self.create_logical_device(device_info)
@@ -290,10 +388,18 @@ class OpenoltDevice(object):
                                                     self.extra_args,
                                                     self.device_info)
         self.platform = self.platform_class(self.log, self.resource_mgr)
-        self.flow_mgr = self.flow_mgr_class(self.core_proxy, self.log,
-                                            self.stub, self.device_id,
-                                            self.logical_device_id,
-                                            self.platform, self.resource_mgr)
+        # The ONUs are looked up again from the core after a reconnection
+        self.onu_registry.clear()
+        self.onu_registry.platform = self.platform
+        self.packet_out_encoder = OpenOltPacketOutEncoder(self.platform)
+        self.omci_sender = self.batch_sender('OmciMsgOut')
+        self.onu_packet_sender = self.batch_sender('OnuPacketOut')
+        self.uplink_packet_sender = self.batch_sender('UplinkPacketOut')
+        self.flow_mgr = self.flow_mgr_class(
+            self.core_proxy, self.log, self.async_stub, self.device_id,
+            self.logical_device_id, self.platform, self.resource_mgr,
+            flow_add_sender=self.flow_batch_sender('FlowAdd'),
+            flow_remove_sender=self.flow_batch_sender('FlowRemove'))
         
         self.alarm_mgr = self.alarm_mgr_class(self.log, self.core_proxy,
                                               self.device_id,
@@ -301,6 +407,8 @@ class OpenoltDevice(object):
                                               self.platform,
                                               self.serial_number)
         self.stats_mgr = self.stats_mgr_class(self, self.log, self.platform)
+        self.stats_mgr.register_indication_handlers(self.indication_router)
+        self.alarm_mgr.register_indication_handlers(self.indication_router)
         self.bw_mgr = self.bw_mgr_class(self.log, self.core_proxy)
         
         self.connected = True
@@ -335,6 +443,10 @@ class OpenoltDevice(object):
         yield self.adapter_agent.update_child_devices_state(
             self.device_id, oper_status=oper_state,
             connect_status=connect_state)
+        self.onu_registry.update_all_connect_status(connect_state)
+        # The ONUs are rediscovered once the OLT is back
+        self.discovery_filter.clear()
+        self.omci_tracker.reset()
         # Device Ports
         device_ports = yield self.adapter_agent.get_ports(self.device_id,
                                                     Port.ETHERNET_NNI)
@@ -372,59 +484,64 @@ class OpenoltDevice(object):
     def indications_thread(self):
         self.log.debug('starting-indications-thread')
         self.log.debug('connecting to olt', device_id=self.device_id)
-        self.channel_ready_future.result()  # blocking call
+        try:
+            self.channel_ready_future.result()  # blocking call
+        except grpc.FutureCancelledError:
+            self.log.info('olt-connection-cancelled', device_id=self.device_id)
+            return
         self.log.info('connected to olt', device_id=self.device_id)
-        self.go_state_connected()
-
-        # TODO: thread timing issue.  stub isnt ready yet from above go_state_connected (which doesnt block)
-        # Don't continue until connected is done
-        while (not self.connected):
-            time.sleep(0.5)
+        self.connect_done.clear()
+        reactor.callFromThread(self.go_state_connected)
+
+        # Don't continue until the bring up running in the reactor is done,
+        # and leave if it gave up or the device was deleted meanwhile
+        self.connect_done.wait()
+        if self.stopped or not self.connected:
+            self.log.info('indications-thread-exit', device_id=self.device_id,
+                          connected=self.connected)
+            return
 
         self.indications = self.stub.EnableIndication(openolt_pb2.Empty())
 
+        # A new queue per connection, the previous one may still hold
+        # indications of the lost connection
+        if self.indication_queue is not None:
+            self.indication_queue.close()
+        self.indication_queue = indication_queue = self.new_indication_queue()
+
+        recorder = None
+        if self.args.indication_capture_dir:
+            recorder = OpenOltIndicationRecorder(os.path.join(
+                self.args.indication_capture_dir,
+                '{}.ind'.format(self.device_id)))
+            self.log.info('recording-indications', path=recorder.path)
+
         while True:
             try:
                 # get the next indication from olt
                 ind = next(self.indications)
             except Exception as e:
                 self.log.warn('gRPC connection lost', error=e)
+                indication_queue.close()
+                if recorder is not None:
+                    recorder.close()
                 reactor.callFromThread(self.go_state_down)
                 reactor.callFromThread(self.go_state_init)
                 break
             else:
                 self.log.debug("rx indication", indication=ind)
-
-                # indication handlers run in the main event loop
-                if ind.HasField('olt_ind'):
-                    reactor.callFromThread(self.olt_indication, ind.olt_ind)
-                elif ind.HasField('intf_ind'):
-                    reactor.callFromThread(self.intf_indication, ind.intf_ind)
-                elif ind.HasField('intf_oper_ind'):
-                    reactor.callFromThread(self.intf_oper_indication,
-                                           ind.intf_oper_ind)
-                elif ind.HasField('onu_disc_ind'):
-                    reactor.callFromThread(self.onu_discovery_indication,
-                                           ind.onu_disc_ind)
-                elif ind.HasField('onu_ind'):
-                    reactor.callFromThread(self.onu_indication, ind.onu_ind)
-                elif ind.HasField('omci_ind'):
-                    reactor.callFromThread(self.omci_indication, ind.omci_ind)
-                elif ind.HasField('pkt_ind'):
-                    reactor.callFromThread(self.packet_indication, ind.pkt_ind)
-                elif ind.HasField('port_stats'):
-                    reactor.callFromThread(
-                        self.stats_mgr.port_statistics_indication,
-                        ind.port_stats)
-                elif ind.HasField('flow_stats'):
-                    reactor.callFromThread(
-                        self.stats_mgr.flow_statistics_indication,
-                        ind.flow_stats)
-                elif ind.HasField('alarm_ind'):
-                    reactor.callFromThread(self.alarm_mgr.process_alarms,
-                                           ind.alarm_ind)
-                else:
-                    self.log.warn('unknown indication type')
+                self.metrics.incr('indications_received')
+                if recorder is not None:
+                    recorder.record(time.time(), ind)
+                indication_queue.put(ind)
+
+    def new_indication_queue(self):
+        # indication handlers run in the main event loop, fed in batches
+        # through bounded priority lanes
+        return OpenOltIndicationQueue(
+            self.log, self.metrics, self.indication_router.dispatch,
+            lanes=self.args.indication_lanes,
+            batch_size=self.args.indication_batch_size)
 
     def olt_indication(self, olt_indication):
         if olt_indication.oper_state == "up":
@@ -465,6 +582,18 @@ class OpenoltDevice(object):
             # FIXME - handle PON oper state change
             pass
 
+    @inlineCallbacks
+    def onu_state_update(self, onu_device, oper_status=None,
+                         connect_status=None):
+        # Update the core and keep the registry connect status in step with
+        # it, the OMCI requests are sent on it
+        yield self.core_proxy.device_state_update(
+            onu_device.id, oper_status=oper_status,
+            connect_status=connect_status)
+        if connect_status is not None:
+            self.onu_registry.update_connect_status(onu_device.id,
+                                                    connect_status)
+
     @inlineCallbacks
     def onu_discovery_indication(self, onu_disc_indication):
         intf_id = onu_disc_indication.intf_id
@@ -475,12 +604,10 @@ class OpenoltDevice(object):
         self.log.debug("onu discovery indication", intf_id=intf_id,
                        serial_number=serial_number_str)
 
-        if serial_number_str in self.seen_discovery_indications:
+        if self.discovery_filter.seen(serial_number_str):
             self.log.debug("skipping-seen-onu-discovery-indication", intf_id=intf_id,
                            serial_number=serial_number_str)
             return
-        else:
-            self.seen_discovery_indications.append(serial_number_str)
 
         # Post ONU Discover alarm  20180809_0805
         try:
@@ -491,28 +618,22 @@ class OpenoltDevice(object):
                                errmsg=disc_alarm_error.message)
             # continue for now.
 
-        onu_device = yield self.core_proxy.get_child_device(
-           self.device_id,
-           serial_number=serial_number_str)
+        onu_device = yield self.onu_registry.get_current_child_device(
+            serial_number=serial_number_str)
 
         if onu_device is None:
             try:
-                onu_id = self.resource_mgr.get_onu_id(intf_id)
-                if onu_id is None:
-                    raise Exception("onu-id-unavailable")
-
-                self.add_onu_device(
-                    intf_id,
-                    self.platform.intf_id_to_port_no(intf_id, Port.PON_OLT),
-                    onu_id, serial_number)
-                self.activate_onu(intf_id, onu_id, serial_number,
-                                  serial_number_str)
+                yield self.activation_pipeline.submit(
+                    intf_id, serial_number_str, self.activate_new_onu,
+                    intf_id, serial_number, serial_number_str)
             except Exception as e:
                 self.log.exception('onu-activation-failed', e=e)
+                self.discovery_filter.discard(serial_number_str)
 
         else:
             if onu_device.connect_status != ConnectStatus.REACHABLE:
-                yield self.core_proxy.device_state_update(onu_device.id, connect_status=ConnectStatus.REACHABLE)
+                yield self.onu_state_update(
+                    onu_device, connect_status=ConnectStatus.REACHABLE)
 
             onu_id = onu_device.proxy_address.onu_id
             if onu_device.oper_status == OperStatus.DISCOVERED \
@@ -531,14 +652,17 @@ class OpenoltDevice(object):
                               reboot probably, activate onu", intf_id=intf_id,
                               onu_id=onu_id, serial_number=serial_number_str)
 
-                yield self.core_proxy.device_state_update(onu_device.id, oper_status=OperStatus.DISCOVERED)
+                yield self.onu_state_update(
+                    onu_device, oper_status=OperStatus.DISCOVERED)
 
                 try:
-                    self.activate_onu(intf_id, onu_id, serial_number,
-                                      serial_number_str)
+                    yield self.activation_pipeline.submit(
+                        intf_id, serial_number_str, self.activate_onu,
+                        intf_id, onu_id, serial_number, serial_number_str)
                 except Exception as e:
                     self.log.error('onu-activation-error',
                                    serial_number=serial_number_str, error=e)
+                    self.discovery_filter.discard(serial_number_str)
             else:
                 self.log.warn('unexpected state', onu_id=onu_id,
                               onu_device_oper_state=onu_device.oper_status)
@@ -557,14 +681,11 @@ class OpenoltDevice(object):
             serial_number_str = None
 
         if serial_number_str is not None:
-            onu_device = yield self.core_proxy.get_child_device(
-                self.device_id,
+            onu_device = yield self.onu_registry.get_current_child_device(
                 serial_number=serial_number_str)
         else:
-            onu_device = yield self.core_proxy.get_child_device(
-                self.device_id,
-                parent_port_no=self.platform.intf_id_to_port_no(
-                    onu_indication.intf_id, Port.PON_OLT),
+            onu_device = yield self.onu_registry.get_current_child_device(
+                intf_id=onu_indication.intf_id,
                 onu_id=onu_indication.onu_id)
 
         if onu_device is None:
@@ -610,13 +731,17 @@ class OpenoltDevice(object):
         if onu_indication.oper_state == 'down':
 
             if onu_device.connect_status != ConnectStatus.UNREACHABLE:
-                yield self.core_proxy.device_state_update(onu_device.id, connect_status=ConnectStatus.UNREACHABLE)
+                yield self.onu_state_update(
+                    onu_device, connect_status=ConnectStatus.UNREACHABLE)
 
             # Move to discovered state
             self.log.debug('onu-oper-state-is-down')
+            self.omci_tracker.reset_onu(onu_indication.intf_id,
+                                        onu_indication.onu_id)
 
             if onu_device.oper_status != OperStatus.DISCOVERED:
-                yield self.core_proxy.device_state_update(onu_device.id, oper_status=OperStatus.DISCOVERED)
+                yield self.onu_state_update(
+                    onu_device, oper_status=OperStatus.DISCOVERED)
 
             self.log.debug('inter-adapter-send-onu-ind', onu_indication=onu_indication)
 
@@ -632,7 +757,8 @@ class OpenoltDevice(object):
         elif onu_indication.oper_state == 'up':
 
             if onu_device.connect_status != ConnectStatus.REACHABLE:
-                yield self.core_proxy.device_state_update(onu_device.id, connect_status=ConnectStatus.REACHABLE)
+                yield self.onu_state_update(
+                    onu_device, connect_status=ConnectStatus.REACHABLE)
 
             if onu_device.oper_status != OperStatus.DISCOVERED:
                 self.log.debug("ignore onu indication",
@@ -695,10 +821,16 @@ class OpenoltDevice(object):
         self.log.debug("omci indication", intf_id=omci_indication.intf_id,
                        onu_id=omci_indication.onu_id)
 
-        onu_device = yield self.core_proxy.get_child_device(
-            self.device_id, onu_id=omci_indication.onu_id,
-            parent_port_no=self.platform.intf_id_to_port_no(
-                omci_indication.intf_id, Port.PON_OLT), )
+        self.omci_tracker.response(omci_indication.intf_id,
+                                   omci_indication.onu_id,
+                                   omci_indication.pkt)
+
+        onu_device = yield self.onu_registry.get_child_device(
+            intf_id=omci_indication.intf_id, onu_id=omci_indication.onu_id)
+        if onu_device is None:
+            self.log.error('onu-not-found', intf_id=omci_indication.intf_id,
+                           onu_id=omci_indication.onu_id)
+            return
 
         omci_msg = InterAdapterOmciMessage(message=omci_indication.pkt)
 
@@ -750,70 +882,51 @@ class OpenoltDevice(object):
                 pkt_indication.intf_id,
                 Port.ETHERNET_NNI)
 
-        pkt = Ether(pkt_indication.pkt)
+        if not self.packet_in_limiter.allow(logical_port_num,
+                                            pkt_indication.pkt):
+            return
 
         self.log.debug("packet indication",
                        logical_device_id=self.logical_device_id,
                        logical_port_no=logical_port_num)
 
+        # The frame is passed on as received, without parsing it
         yield self.adapter_agent.send_packet_in(
             logical_device_id=self.logical_device_id,
             logical_port_no=logical_port_num,
-            packet=str(pkt))
+            packet=pkt_indication.pkt)
 
+    @inlineCallbacks
     def packet_out(self, egress_port, msg):
-        pkt = Ether(msg)
         self.log.debug('packet out', egress_port=egress_port,
                        device_id=self.device_id,
                        logical_device_id=self.logical_device_id,
-                       packet=str(pkt).encode("HEX"))
+                       packet=HexDump(msg))
 
-        # Find port type
-        egress_port_type = self.platform.intf_id_to_port_type_name(egress_port)
+        egress_port_type, packet = self.packet_out_encoder.encode(
+            egress_port, msg)
         if egress_port_type == Port.ETHERNET_UNI:
-
-            if pkt.haslayer(Dot1Q):
-                outer_shim = pkt.getlayer(Dot1Q)
-                if isinstance(outer_shim.payload, Dot1Q):
-                    # If double tag, remove the outer tag
-                    payload = (
-                            Ether(src=pkt.src, dst=pkt.dst, type=outer_shim.type) /
-                            outer_shim.payload
-                    )
-                else:
-                    payload = pkt
-            else:
-                payload = pkt
-
-            send_pkt = binascii.unhexlify(str(payload).encode("HEX"))
-
             self.log.debug(
                 'sending-packet-to-ONU', egress_port=egress_port,
-                intf_id=self.platform.intf_id_from_uni_port_num(egress_port),
-                onu_id=self.platform.onu_id_from_port_num(egress_port),
+                intf_id=packet.intf_id, onu_id=packet.onu_id,
                 uni_id=self.platform.uni_id_from_port_num(egress_port),
-                port_no=egress_port,
-                packet=str(payload).encode("HEX"))
+                port_no=egress_port, packet=HexDump(packet.pkt))
 
-            onu_pkt = openolt_pb2.OnuPacket(
-                intf_id=self.platform.intf_id_from_uni_port_num(egress_port),
-                onu_id=self.platform.onu_id_from_port_num(egress_port),
-                port_no=egress_port,
-                pkt=send_pkt)
-
-            self.stub.OnuPacketOut(onu_pkt)
+            try:
+                yield self.onu_packet_sender.send(packet)
+            except grpc.RpcError as grpc_e:
+                self.log.error('packet-out-to-onu-failed',
+                               egress_port=egress_port, grpc_error=grpc_e)
 
         elif egress_port_type == Port.ETHERNET_NNI:
             self.log.debug('sending-packet-to-uplink', egress_port=egress_port,
-                           packet=str(pkt).encode("HEX"))
-
-            send_pkt = binascii.unhexlify(str(pkt).encode("HEX"))
+                           packet=HexDump(packet.pkt))
 
-            uplink_pkt = openolt_pb2.UplinkPacket(
-                intf_id=self.platform.intf_id_from_nni_port_num(egress_port),
-                pkt=send_pkt)
-
-            self.stub.UplinkPacketOut(uplink_pkt)
+            try:
+                yield self.uplink_packet_sender.send(packet)
+            except grpc.RpcError as grpc_e:
+                self.log.error('packet-out-to-uplink-failed',
+                               egress_port=egress_port, grpc_error=grpc_e)
 
         else:
             self.log.warn('Packet-out-to-this-interface-type-not-implemented',
@@ -830,8 +943,12 @@ class OpenoltDevice(object):
                 self.log.debug('inter-adapter-recv-omci', omci_msg=omci_msg)
 
                 onu_device_id = request.header.to_device_id
-                onu_device = yield self.core_proxy.get_device(onu_device_id)
-                self.send_proxied_message(onu_device, omci_msg.message)
+                onu_device = yield self.onu_registry.get_device(
+                    onu_device_id)
+                # Not waited on, the request may wait for an OMCI window slot
+                # up to the OMCI timeout
+                d = self.send_proxied_message(onu_device, omci_msg.message)
+                d.addErrback(self._omci_send_failed, onu_device)
 
             else:
                 self.log.error("inter-adapter-unhandled-type", request=request)
@@ -839,6 +956,18 @@ class OpenoltDevice(object):
         except Exception as e:
             self.log.exception("error-processing-inter-adapter-message", e=e)
 
+    def _omci_send_failed(self, failure, onu_device):
+        if failure.check(OmciDropped):
+            self.log.debug('omci-message-dropped',
+                           intf_id=onu_device.proxy_address.channel_id,
+                           onu_id=onu_device.proxy_address.onu_id)
+        else:
+            self.log.error('omci-message-send-failed',
+                           intf_id=onu_device.proxy_address.channel_id,
+                           onu_id=onu_device.proxy_address.onu_id,
+                           error=failure.getErrorMessage())
+
+    @inlineCallbacks
     def send_proxied_message(self, onu_device, msg):
 
         if onu_device.connect_status != ConnectStatus.REACHABLE:
@@ -850,7 +979,8 @@ class OpenoltDevice(object):
 
         omci = openolt_pb2.OmciMsg(intf_id=onu_device.proxy_address.channel_id,
                                    onu_id=onu_device.proxy_address.onu_id, pkt=str(msg))
-        self.stub.OmciMsgOut(omci)
+        yield self.omci_tracker.send(omci.intf_id, omci.onu_id, omci.pkt,
+                                     lambda: self.omci_sender.send(omci))
 
         self.log.debug("omci-message-sent", intf_id=onu_device.proxy_address.channel_id,
                                    onu_id=onu_device.proxy_address.onu_id, pkt=str(msg))
@@ -863,7 +993,7 @@ class OpenoltDevice(object):
         serial_number_str = self.stringify_serial_number(serial_number)
 
         # TODO NEW CORE dont hardcode child device type.  find some way of determining by vendor in serial number
-        yield self.core_proxy.child_device_detected(
+        onu_device = yield self.core_proxy.child_device_detected(
             parent_device_id=self.device_id,
             parent_port_no=port_no,
             child_device_type='brcm_openomci_onu',
@@ -872,6 +1002,8 @@ class OpenoltDevice(object):
             serial_number=serial_number_str,
             onu_id=onu_id
         )
+        if onu_device is not None:
+            self.onu_registry.add(onu_device)
 
         self.log.debug("onu-added", onu_id=onu_id, port_no=port_no, serial_number=serial_number_str)
 
@@ -903,11 +1035,18 @@ class OpenoltDevice(object):
 
     def get_ofp_port_info(self, device, port_no):
         self.log.info('get_ofp_port_info', port_no=port_no, device_id=device.id)
+        return self.ofp_port_capability(device, port_no)
+
+    @staticmethod
+    def ofp_port_capability(device, port_no):
+        # Only depends on the port number, the sharded adapter answers it
+        # without asking the worker owning the device
         cap = OFPPF_1GB_FD | OFPPF_FIBER
         return PortCapability(
             port=LogicalPort(
                 ofp_port=ofp_port(
-                    hw_addr=mac_str_to_tuple(self._get_mac_form_port_no(port_no)),
+                    hw_addr=mac_str_to_tuple(
+                        OpenoltDevice._get_mac_form_port_no(port_no)),
                     config=0,
                     state=OFPPS_LIVE,
                     curr=cap,
@@ -960,7 +1099,8 @@ class OpenoltDevice(object):
         self.adapter_agent.add_logical_port(self.logical_device_id,
                                             logical_port)
 
-    def _get_mac_form_port_no(self, port_no):
+    @staticmethod
+    def _get_mac_form_port_no(port_no):
         mac = ''
         for i in range(4):
             mac = ':%02x' % ((port_no >> (i * 8)) & 0xff) + mac
@@ -980,6 +1120,7 @@ class OpenoltDevice(object):
 
         yield self.core_proxy.port_created(self.device_id, port)
 
+    @inlineCallbacks
     def delete_logical_port(self, child_device):
         logical_ports = self.proxy.get('/logical_devices/{}/ports'.format(
             self.logical_device_id))
@@ -988,7 +1129,7 @@ class OpenoltDevice(object):
                 self.log.debug('delete-logical-port',
                                onu_device_id=child_device.id,
                                logical_port=logical_port)
-                self.flow_mgr.clear_flows_and_scheduler_for_logical_port(
+                yield self.flow_mgr.clear_flows_and_scheduler_for_logical_port(
                     child_device, logical_port)
                 self.adapter_agent.delete_logical_port(
                     self.logical_device_id, logical_port)
@@ -1010,6 +1151,7 @@ class OpenoltDevice(object):
         self.log.debug('No updates here now, all is done in logical flows '
                        'update')
 
+    @inlineCallbacks
     def update_logical_flows(self, flows_to_add, flows_to_remove,
                              device_rules_map):
         if not self.is_state_up():
@@ -1026,21 +1168,9 @@ class OpenoltDevice(object):
         self.log.debug('logical flows update', flows_to_add=flows_to_add,
                        flows_to_remove=flows_to_remove)
 
-        for flow in flows_to_add:
-
-            try:
-                self.flow_mgr.add_flow(flow)
-            except Exception as e:
-                self.log.error('failed to add flow', flow=flow, e=e)
-
-        for flow in flows_to_remove:
-
-            try:
-                self.flow_mgr.remove_flow(flow)
-            except Exception as e:
-                self.log.error('failed to remove flow', flow=flow, e=e)
-
-        self.flow_mgr.repush_all_different_flows()
+        self.flow_mgr.index_logical_flows(flows_to_add, flows_to_remove)
+        yield self.flow_mgr.update_flows(flows_to_add, flows_to_remove)
+        yield self.flow_mgr.repush_all_different_flows()
 
     # There has to be a better way to do this
     def ip_hex(self, ip):
@@ -1075,13 +1205,14 @@ class OpenoltDevice(object):
             vendor_specific=binascii.unhexlify(serial_number_str[4:]))
         return serial_number
 
+    @inlineCallbacks
     def disable(self):
         self.log.debug('sending-deactivate-olt-message',
                        device_id=self.device_id)
 
         try:
             # Send grpc call
-            self.stub.DisableOlt(openolt_pb2.Empty())
+            yield self.async_stub.DisableOlt(openolt_pb2.Empty())
             # The resulting indication will bring the OLT down
             # self.go_state_down()
             self.log.info('openolt device disabled')
@@ -1092,6 +1223,16 @@ class OpenoltDevice(object):
         self.log.info('deleting-olt', device_id=self.device_id,
                       logical_device_id=self.logical_device_id)
 
+        # Releases an indications thread still waiting for the bring up
+        self.stopped = True
+        self.channel_ready_future.cancel()
+        self.connect_done.set()
+
+        self.metrics.stop_reporting()
+        self.packet_in_limiter.stop_reporting()
+        if self.indication_queue is not None:
+            self.indication_queue.close()
+
         # Clears up the data from the resource manager KV store
         # for the device
         del self.resource_mgr
@@ -1108,17 +1249,31 @@ class OpenoltDevice(object):
         else:
             self.log.info('successfully-deleted-olt', device_id=self.device_id)
 
+    @inlineCallbacks
     def reenable(self):
         self.log.debug('reenabling-olt', device_id=self.device_id)
 
         try:
-            self.stub.ReenableOlt(openolt_pb2.Empty())
+            yield self.async_stub.ReenableOlt(openolt_pb2.Empty())
 
         except Exception as e:
             self.log.error('Failure to reenable openolt device', error=e)
         else:
             self.log.info('openolt device reenabled')
 
+    @inlineCallbacks
+    def activate_new_onu(self, intf_id, serial_number, serial_number_str):
+        onu_id = self.resource_mgr.get_onu_id(intf_id)
+        if onu_id is None:
+            raise Exception("onu-id-unavailable")
+
+        yield self.add_onu_device(
+            intf_id, self.platform.intf_id_to_port_no(intf_id, Port.PON_OLT),
+            onu_id, serial_number)
+        yield self.activate_onu(intf_id, onu_id, serial_number,
+                                serial_number_str)
+
+    @inlineCallbacks
     def activate_onu(self, intf_id, onu_id, serial_number,
                      serial_number_str):
         pir = self.bw_mgr.pir(serial_number_str)
@@ -1127,7 +1282,7 @@ class OpenoltDevice(object):
                        serial_number=serial_number, pir=pir)
         onu = openolt_pb2.Onu(intf_id=intf_id, onu_id=onu_id,
                               serial_number=serial_number, pir=pir)
-        self.stub.ActivateOnu(onu)
+        yield self.async_stub.ActivateOnu(onu)
         self.log.info('onu-activated', serial_number=serial_number_str)
 
     @inlineCallbacks
@@ -1142,20 +1297,29 @@ class OpenoltDevice(object):
                                                    child_device)
         except Exception as e:
             self.log.error('adapter_agent error', error=e)
+        self.onu_registry.remove(child_device.id)
+        self.discovery_filter.discard(child_device.serial_number)
+        self.omci_tracker.reset_onu(child_device.proxy_address.channel_id,
+                                    child_device.proxy_address.onu_id)
         try:
-            self.delete_logical_port(child_device)
+            yield self.delete_logical_port(child_device)
         except Exception as e:
             self.log.error('logical_port delete error', error=e)
         try:
-            self.delete_port(child_device.serial_number)
+            yield self.delete_port(child_device.serial_number)
         except Exception as e:
             self.log.error('port delete error', error=e)
+        if self.flow_mgr is None:
+            # Not connected yet, nothing was reserved on the OLT for the ONU
+            self.log.info('onu-deleted-before-connect',
+                          onu_device_id=child_device.id)
+            return
         serial_number = self.destringify_serial_number(
             child_device.serial_number)
         # TODO FIXME - For each uni.
         # TODO FIXME - Flows are not deleted
         uni_id = 0  # FIXME
-        self.flow_mgr.delete_tech_profile_instance(
+        yield self.flow_mgr.delete_tech_profile_instance(
             child_device.proxy_address.channel_id,
             child_device.proxy_address.onu_id,
             uni_id
@@ -1169,20 +1333,22 @@ class OpenoltDevice(object):
         onu = openolt_pb2.Onu(intf_id=child_device.proxy_address.channel_id,
                               onu_id=child_device.proxy_address.onu_id,
                               serial_number=serial_number)
-        self.stub.DeleteOnu(onu)
+        yield self.async_stub.DeleteOnu(onu)
 
+    @inlineCallbacks
     def reboot(self):
         self.log.debug('rebooting openolt device', device_id=self.device_id)
         try:
-            self.stub.Reboot(openolt_pb2.Empty())
+            yield self.async_stub.Reboot(openolt_pb2.Empty())
         except Exception as e:
             self.log.error('something went wrong with the reboot', error=e)
         else:
             self.log.info('device rebooted')
 
+    @inlineCallbacks
     def trigger_statistics_collection(self):
         try:
-            self.stub.CollectStatistics(openolt_pb2.Empty())
+            yield self.async_stub.CollectStatistics(openolt_pb2.Empty())
         except Exception as e:
             self.log.error('Error while triggering statistics collection',
                            error=e)
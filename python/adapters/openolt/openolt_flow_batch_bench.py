@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Flow batching benchmark, against the mock agent.
+
+Provisions the subscriber flows of openolt_flow_bench all at once, as after
+an OLT reboot, with OpenOltFlowMgr.update_flows, then removes them the same
+way. The flow manager talks gRPC to an in-process
+OpenOltMockAgent through OpenOltAsyncStub, first with unary FlowAdd and
+FlowRemove calls, then with FlowAddBatch and FlowRemoveBatch.
+
+--rtt is injected as the latency of every flow and tcont RPC, batch ones
+included, and stands for the round trip to the OLT. The mock agent serves
+one call at a time by default, as an OLT applying its flows in order would,
+--workers lets it serve more.
+
+Usage:
+
+    openolt_flow_batch_bench.py --pon_ports 4 --onus_per_pon 31 --rtt 0.002
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import grpc
+import structlog
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks
+
+from voltha_protos import openolt_pb2_grpc
+
+from openolt_flow_bench import LOG_LEVELS, OpenOltFlowBench
+from openolt_grpc import OpenOltAsyncStub, OpenOltFlowBatchSender
+from openolt_metrics import OpenOltMetrics
+from openolt_mock_agent import OpenOltMockAgent
+
+UNARY_FLOW_RPCS = ('FlowAdd', 'FlowRemove')
+BATCH_FLOW_RPCS = ('FlowAddBatch', 'FlowRemoveBatch')
+RTT_RPCS = UNARY_FLOW_RPCS + BATCH_FLOW_RPCS + ('CreateTconts',
+                                                'RemoveTconts')
+
+
+class OpenOltFlowBatchBench(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.agent = OpenOltMockAgent(
+            pon_ports=args.pon_ports, onus_per_pon=args.onus_per_pon,
+            unis_per_onu=args.unis_per_onu, disc_rate=0,
+            latency={rpc: args.rtt for rpc in RTT_RPCS})
+        self.port = None
+        self.channel = None
+        self.results = []
+
+    @inlineCallbacks
+    def run(self):
+        self.port = self.agent.start(workers=self.args.workers)
+        self.channel = grpc.insecure_channel('localhost:{}'.format(self.port))
+        try:
+            for batch in (False, True):
+                yield self.run_mode(batch)
+        finally:
+            self.channel.close()
+            self.agent.stop()
+
+    @inlineCallbacks
+    def run_mode(self, batch):
+        args = self.args
+        bench = OpenOltFlowBench(pon_ports=args.pon_ports,
+                                 onus_per_pon=args.onus_per_pon,
+                                 unis_per_onu=args.unis_per_onu,
+                                 gemports=args.gemports,
+                                 log_level=args.log_level)
+        metrics = OpenOltMetrics(bench.log)
+        async_stub = OpenOltAsyncStub(
+            openolt_pb2_grpc.OpenoltStub(self.channel), metrics=metrics)
+        window = args.window if batch else 0
+        bench.flow_mgr = bench.mk_flow_mgr(
+            async_stub,
+            flow_add_sender=OpenOltFlowBatchSender(
+                bench.log, metrics, async_stub, 'FlowAdd', window,
+                args.batch_size),
+            flow_remove_sender=OpenOltFlowBatchSender(
+                bench.log, metrics, async_stub, 'FlowRemove', window,
+                args.batch_size))
+
+        flows = [flow for subscriber_flows in bench.subscribers
+                 for flow in subscriber_flows]
+        mode = 'batch' if batch else 'unary'
+        flow_rpcs = BATCH_FLOW_RPCS if batch else UNARY_FLOW_RPCS
+        for subscriber_flows in bench.subscribers:
+            bench.provision(subscriber_flows)
+        yield self.run_phase(
+            mode, 'add', lambda flows: bench.flow_mgr.update_flows(flows, []),
+            flows, flow_rpcs)
+        device_flows = len(self.agent.flows)
+
+        for subscriber_flows in bench.subscribers:
+            bench.unprovision(subscriber_flows)
+        yield self.run_phase(
+            mode, 'remove',
+            lambda flows: bench.flow_mgr.update_flows([], flows), flows,
+            flow_rpcs)
+        self.results[-2]['device_flows'] = device_flows
+        self.results[-1]['device_flows'] = len(self.agent.flows)
+
+    @inlineCallbacks
+    def run_phase(self, mode, name, operation, flows, flow_rpcs):
+        before = dict(self.agent.calls)
+        start = time.time()
+        yield operation(flows)
+        duration = time.time() - start
+        calls = dict((method, count - before.get(method, 0))
+                     for (method, count) in self.agent.calls.iteritems()
+                     if count != before.get(method, 0))
+        self.results.append({
+            'mode': mode,
+            'phase': name,
+            'flows': len(flows),
+            'duration': duration,
+            'flows_per_sec': len(flows) / duration if duration else None,
+            'flow_rpcs': sum(count for (method, count) in calls.iteritems()
+                             if method in flow_rpcs),
+            'calls': calls,
+        })
+
+    def report(self):
+        columns = ('mode', 'phase', 'flows', 'duration', 'flows_per_sec',
+                   'flow_rpcs', 'device_flows')
+        print(' '.join('{:>14}'.format(column) for column in columns))
+        for result in self.results:
+            print(' '.join('{:>14}'.format(
+                '{:.3f}'.format(result[column])
+                if isinstance(result[column], float) else result[column])
+                for column in columns))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='OpenOLT flow batching benchmark, against the mock agent')
+    parser.add_argument('--pon_ports', type=int, default=4,
+                        help='number of PON ports (default: %(default)s)')
+    parser.add_argument('--onus_per_pon', type=int, default=31,
+                        help='number of ONUs per PON (default: %(default)s)')
+    parser.add_argument('--unis_per_onu', type=int, default=1,
+                        help='number of UNIs per ONU (default: %(default)s)')
+    parser.add_argument('--gemports', type=int, default=1,
+                        help='number of gemports per UNI (default: '
+                             '%(default)s)')
+    parser.add_argument('--rtt', type=float, default=0.002,
+                        help='round trip to the OLT in seconds (default: '
+                             '%(default)s)')
+    parser.add_argument('--window', type=float, default=0.005,
+                        help='flow batch window in seconds (default: '
+                             '%(default)s)')
+    parser.add_argument('--batch_size', type=int, default=128,
+                        help='maximum flows per batch (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='mock agent gRPC worker threads (default: '
+                             '%(default)s)')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    parser.add_argument('--log_level', default='error',
+                        choices=sorted(LOG_LEVELS.keys()),
+                        help='flow manager log level (default: %(default)s)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # The mock agent logs through the default structlog configuration
+    structlog.configure(logger_factory=structlog.PrintLoggerFactory(
+        sys.stderr))
+    bench = OpenOltFlowBatchBench(args)
+
+    def done(_):
+        if args.json:
+            print(json.dumps(bench.results, indent=2))
+        else:
+            bench.report()
+
+    def failed(failure):
+        failure.printTraceback()
+
+    def start():
+        d = bench.run()
+        d.addCallbacks(done, failed)
+        d.addBoth(lambda _: reactor.stop())
+
+    reactor.callWhenRunning(start)
+    reactor.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,714 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Flow manager throughput benchmark.
+
+Generates the logical flows ONOS (OltPipeline) pushes for each subscriber
+UNI and drives them through OpenOltFlowMgr.add_flow, then remove_flow:
+
+ - EAPOL trap (table 0)
+ - DHCP trap (table 0)
+ - HSIA upstream, table 0 (vlan rewrite, goto 1) and table 1 (push s-tag)
+ - HSIA downstream, table 0 (pop s-tag, metadata, goto 1) and table 1
+
+The OLT, the core and the KV store are replaced with in-memory doubles that
+count what the flow manager asks of them: gRPC calls, core calls and KV
+reads/writes/deletes. The KV double keeps the PONResourceManager path layout
+and JSON encoding, so the KV operation counts match the real backend's.
+
+Usage:
+
+    openolt_flow_bench.py --pon_ports 16 --onus_per_pon 31 --unis_per_onu 4
+
+Subscribers are provisioned one after the other, so the logical flow table
+grows during the add phase and shrinks during the remove phase, as it does
+on a live system. With --repush, the missing flows are repushed after each
+subscriber, as update_logical_flows does after each update, and all the
+flows are reconciled once between the phases, as after the OLT went down
+and came back. With --plan, the
+flows of a subscriber are added, then removed, as one OpenOltFlowUpdatePlan
+as update_logical_flows does, instead of one flow at a time; the latency of
+a flow is then that of its subscriber's update.
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections import Counter
+
+import structlog
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, succeed
+from twisted.internet.task import deferLater
+
+import pyvoltha.common.openflow.utils as fd
+from pyvoltha.adapters.common.pon_resource_manager.resource_manager import \
+    PONResourceManager
+from voltha_protos import openolt_pb2
+from voltha_protos.device_pb2 import Device, Port
+from voltha_protos.logical_device_pb2 import LogicalPort
+from voltha_protos.openflow_13_pb2 import ofp_port
+
+from openolt_flow_mgr import OpenOltFlowMgr, EAP_ETH_TYPE
+from openolt_platform import OpenOltPlatform
+from openolt_resource_manager import OpenOltResourceMgr
+
+DEVICE_ID = 'bench-olt'
+LOGICAL_DEVICE_ID = 'bench-logical-olt'
+NNI_PORT_NO = 1 << 16
+# As sent by ONOS, OFPP_CONTROLLER in the protos is limited to int32
+CONTROLLER_PORT = 0xfffffffd
+S_TAG_BASE = 100
+C_TAG_BASE = 10
+IPV4_ETH_TYPE = 0x0800
+UDP_PROTO = 17
+
+LOG_LEVELS = {'debug': 10, 'info': 20, 'warn': 30, 'warning': 30,
+              'error': 40, 'exception': 40, 'critical': 50}
+
+
+def level_filter(level):
+    minimum = LOG_LEVELS[level]
+
+    def processor(logger, method_name, event_dict):
+        if LOG_LEVELS.get(method_name, 0) < minimum:
+            raise structlog.DropEvent
+        return event_dict
+
+    return processor
+
+
+class CountingKvStore(object):
+    """
+    In-memory KV store, counting the operations issued against it. Offers
+    both the ResourceKvStore interface and the dict-style access of the
+    config backends.
+    """
+
+    def __init__(self):
+        self.data = dict()
+        self.ops = Counter()
+
+    def get_from_kv_store(self, path):
+        self.ops['read'] += 1
+        return self.data.get(path)
+
+    def update_to_kv_store(self, path, value):
+        self.ops['write'] += 1
+        self.data[path] = value
+        return True
+
+    def remove_from_kv_store(self, path):
+        self.ops['delete'] += 1
+        return self.data.pop(path, None) is not None
+
+    def __getitem__(self, path):
+        value = self.get_from_kv_store(path)
+        if value is None:
+            raise KeyError(path)
+        return value
+
+    def __setitem__(self, path, value):
+        self.update_to_kv_store(path, value)
+
+    def __delitem__(self, path):
+        self.remove_from_kv_store(path)
+
+
+class BenchTechProfileInstance(object):
+
+    class Scheduler(object):
+        def __init__(self, alloc_id):
+            self.alloc_id = alloc_id
+
+    class GemPort(object):
+        def __init__(self, gemport_id):
+            self.gemport_id = gemport_id
+
+    def __init__(self, alloc_id, gemport_ids):
+        self.us_scheduler = self.Scheduler(alloc_id)
+        self.upstream_gem_port_attribute_list = [
+            self.GemPort(gemport_id) for gemport_id in gemport_ids]
+
+
+class BenchTechProfile(object):
+    """
+    Tech profile instances stored as JSON in the KV store, one per UNI.
+    """
+
+    def __init__(self, resource_mgr, gemports):
+        self.resource_mgr = resource_mgr
+        self.kv_store = resource_mgr.kv_store
+        self.gemports = gemports
+
+    def get_tp_path(self, table_id, uni_port_name):
+        return '{}/{}/{}'.format(self.resource_mgr.technology, table_id,
+                                 uni_port_name)
+
+    def get_tech_profile_instance(self, table_id, uni_port_name):
+        value = self.kv_store.get_from_kv_store(
+            self.get_tp_path(table_id, uni_port_name))
+        if value is None:
+            return None
+        instance = json.loads(value)
+        return BenchTechProfileInstance(instance['alloc_id'],
+                                        instance['gemport_ids'])
+
+    def create_tech_profile_instance(self, table_id, uni_port_name, intf_id):
+        alloc_id = self.resource_mgr.get_resource_id(
+            intf_id, PONResourceManager.ALLOC_ID)[0]
+        gemport_ids = self.resource_mgr.get_resource_id(
+            intf_id, PONResourceManager.GEMPORT_ID, self.gemports)
+        self.kv_store.update_to_kv_store(
+            self.get_tp_path(table_id, uni_port_name),
+            json.dumps({'alloc_id': alloc_id, 'gemport_ids': gemport_ids}))
+        return BenchTechProfileInstance(alloc_id, gemport_ids)
+
+    def delete_tech_profile_instance(self, tp_path):
+        return self.kv_store.remove_from_kv_store(tp_path)
+
+    def get_us_scheduler(self, tech_profile_instance):
+        return openolt_pb2.Scheduler(direction=openolt_pb2.UPSTREAM)
+
+    def get_ds_scheduler(self, tech_profile_instance):
+        return openolt_pb2.Scheduler(direction=openolt_pb2.DOWNSTREAM)
+
+    def get_tconts(self, tech_profile_instance, us_scheduler=None,
+                   ds_scheduler=None):
+        return [openolt_pb2.Tcont(
+            direction=openolt_pb2.UPSTREAM,
+            alloc_id=tech_profile_instance.us_scheduler.alloc_id,
+            scheduler=us_scheduler)]
+
+
+class BenchPonResourceMgr(object):
+    """
+    PONResourceManager over a CountingKvStore, with the same KV path layout
+    and read-modify-write of the id pools on every allocation.
+    """
+
+    FLOW_ID_INFO_PATH = '{}/{}/flow_id_info/{}'
+
+    def __init__(self, technology, device_id, kv_store, device_info,
+                 gemports):
+        self.technology = technology
+        self.device_id = device_id
+        self.kv_store = kv_store
+        self.pools = {
+            PONResourceManager.ONU_ID: (device_info.onu_id_start,
+                                        device_info.onu_id_end),
+            PONResourceManager.ALLOC_ID: (device_info.alloc_id_start,
+                                          device_info.alloc_id_end),
+            PONResourceManager.GEMPORT_ID: (device_info.gemport_id_start,
+                                            device_info.gemport_id_end),
+            PONResourceManager.FLOW_ID: (device_info.flow_id_start,
+                                         device_info.flow_id_end),
+        }
+        self.tech_profile = BenchTechProfile(self, gemports)
+
+    def _pool_path(self, resource_type):
+        # All pools are shared by all the PON interfaces
+        return '{}/{}_pool/0'.format(self.device_id, resource_type.lower())
+
+    def _map_path(self, pon_intf_onu_id, resource):
+        return '{}/{}/{}'.format(self.device_id, str(pon_intf_onu_id),
+                                 resource)
+
+    def _get_json(self, path, default=None):
+        value = self.kv_store.get_from_kv_store(path)
+        return json.loads(value) if value is not None else default
+
+    def _put_json(self, path, value):
+        self.kv_store.update_to_kv_store(path, json.dumps(value))
+
+    def assert_resource_limits(self, id, resource_type):
+        pass
+
+    def clear_device_resource_pool(self):
+        pass
+
+    def get_resource_id(self, pon_intf_id, resource_type, num_of_id=1):
+        path = self._pool_path(resource_type)
+        start, end = self.pools[resource_type]
+        pool = self._get_json(path, {'next': start, 'free': []})
+        ids = []
+        for _ in xrange(num_of_id):
+            if pool['free']:
+                ids.append(pool['free'].pop())
+            elif pool['next'] <= end:
+                ids.append(pool['next'])
+                pool['next'] += 1
+            else:
+                return None
+        self._put_json(path, pool)
+        if resource_type in (PONResourceManager.ONU_ID,
+                             PONResourceManager.FLOW_ID):
+            return ids[0]
+        return ids
+
+    def free_resource_id(self, pon_intf_id, resource_type, release_content):
+        path = self._pool_path(resource_type)
+        pool = self._get_json(path)
+        if pool is None:
+            return False
+        if isinstance(release_content, list):
+            pool['free'].extend(release_content)
+        else:
+            pool['free'].append(release_content)
+        self._put_json(path, pool)
+        return True
+
+    def init_resource_map(self, pon_intf_onu_id):
+        for resource in ('alloc_ids', 'gemport_ids'):
+            self._put_json(self._map_path(pon_intf_onu_id, resource), [])
+
+    def remove_resource_map(self, pon_intf_onu_id):
+        for resource in ('alloc_ids', 'gemport_ids'):
+            self.kv_store.remove_from_kv_store(
+                self._map_path(pon_intf_onu_id, resource))
+        for flow_id in self.get_current_flow_ids_for_onu(pon_intf_onu_id) \
+                or []:
+            self.remove_flow_id_info(pon_intf_onu_id, flow_id)
+        self.kv_store.remove_from_kv_store(
+            self._map_path(pon_intf_onu_id, 'flow_ids'))
+
+    def get_current_alloc_ids_for_onu(self, pon_intf_onu_id):
+        return self._get_json(self._map_path(pon_intf_onu_id, 'alloc_ids'))
+
+    def get_current_gemport_ids_for_onu(self, pon_intf_onu_id):
+        return self._get_json(self._map_path(pon_intf_onu_id, 'gemport_ids'))
+
+    def get_current_flow_ids_for_onu(self, pon_intf_onu_id):
+        return self._get_json(self._map_path(pon_intf_onu_id, 'flow_ids'))
+
+    def update_alloc_ids_for_onu(self, pon_intf_onu_id, alloc_ids):
+        self._put_json(self._map_path(pon_intf_onu_id, 'alloc_ids'),
+                       alloc_ids)
+
+    def update_gemport_ids_for_onu(self, pon_intf_onu_id, gemport_ids):
+        self._put_json(self._map_path(pon_intf_onu_id, 'gemport_ids'),
+                       gemport_ids)
+
+    def update_flow_id_for_onu(self, pon_intf_onu_id, flow_id, add=True):
+        path = self._map_path(pon_intf_onu_id, 'flow_ids')
+        flow_ids = self._get_json(path, [])
+        if add:
+            if flow_id not in flow_ids:
+                flow_ids.append(flow_id)
+        elif flow_id in flow_ids:
+            flow_ids.remove(flow_id)
+        self._put_json(path, flow_ids)
+
+    def get_flow_id_info(self, pon_intf_onu_id, flow_id):
+        return self._get_json(self.FLOW_ID_INFO_PATH.format(
+            self.device_id, str(pon_intf_onu_id), flow_id))
+
+    def update_flow_id_info_for_onu(self, pon_intf_onu_id, flow_id,
+                                    flow_data):
+        self._put_json(self.FLOW_ID_INFO_PATH.format(
+            self.device_id, str(pon_intf_onu_id), flow_id), flow_data)
+
+    def remove_flow_id_info(self, pon_intf_onu_id, flow_id):
+        self.kv_store.remove_from_kv_store(self.FLOW_ID_INFO_PATH.format(
+            self.device_id, str(pon_intf_onu_id), flow_id))
+
+
+def mk_resource_mgr(device_info, kv_store, gemports):
+    """
+    OpenOltResourceMgr with its PON resource managers and KV store replaced
+    by in-memory doubles.
+    """
+    resource_mgr = OpenOltResourceMgr.__new__(OpenOltResourceMgr)
+    resource_mgr.log = structlog.get_logger(id=DEVICE_ID)
+    resource_mgr.device_id = DEVICE_ID
+    resource_mgr.device_info = device_info
+    resource_mgr.kv_store = kv_store
+    resource_mgr.gemport_to_onu_uni = dict()
+    resource_mgr.flow_cache = None
+    resource_mgr.flow_updates = 0
+
+    arange = device_info.ranges.add()
+    arange.technology = device_info.technology
+    arange.intf_ids.extend(range(device_info.pon_ports))
+
+    pon_resource_mgr = BenchPonResourceMgr(device_info.technology, DEVICE_ID,
+                                           kv_store, device_info, gemports)
+    resource_mgr.resource_mgrs = {intf_id: pon_resource_mgr
+                                  for intf_id in arange.intf_ids}
+    return resource_mgr
+
+
+class BenchStub(object):
+    """
+    Asynchronous Openolt stub answering every call with Empty, after an
+    optional latency.
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.calls = Counter()
+
+    def __getattr__(self, name):
+        def call(request, timeout=None):
+            self.calls[name] += 1
+            if self.latency:
+                return deferLater(reactor, self.latency, openolt_pb2.Empty)
+            return succeed(openolt_pb2.Empty())
+
+        return call
+
+
+class BenchAdapterAgent(object):
+    """
+    Core side of the flow manager: child devices, ports and logical ports.
+    Like the CoreProxy, it offers no way to read the logical flow table.
+    """
+
+    def __init__(self, platform):
+        self.platform = platform
+        self.calls = Counter()
+
+    @staticmethod
+    def child_device_id(intf_id, onu_id):
+        return 'onu-{}-{}'.format(intf_id, onu_id)
+
+    def mk_child_device(self, intf_id, onu_id):
+        return Device(id=self.child_device_id(intf_id, onu_id),
+                      type='brcm_openomci_onu',
+                      parent_id=DEVICE_ID,
+                      parent_port_no=self.platform.intf_id_to_port_no(
+                          intf_id, Port.PON_OLT),
+                      proxy_address=Device.ProxyAddress(
+                          device_id=DEVICE_ID, channel_id=intf_id,
+                          onu_id=onu_id))
+
+    def get_child_device(self, parent_device_id, onu_id=None,
+                         parent_port_no=None, serial_number=None):
+        self.calls['get_child_device'] += 1
+        intf_id = self.platform.intf_id_from_pon_port_no(parent_port_no)
+        return succeed(self.mk_child_device(intf_id, onu_id))
+
+    def get_device(self, device_id):
+        self.calls['get_device'] += 1
+        _, intf_id, onu_id = device_id.split('-')
+        return succeed(self.mk_child_device(int(intf_id), int(onu_id)))
+
+    def get_ports(self, device_id, port_type):
+        self.calls['get_ports'] += 1
+        if port_type == Port.ETHERNET_NNI:
+            return succeed([Port(port_no=NNI_PORT_NO, label='nni-{}'.format(
+                NNI_PORT_NO), type=Port.ETHERNET_NNI)])
+        _, intf_id, onu_id = device_id.split('-')
+        return succeed([
+            Port(port_no=port_no, label='uni-{}'.format(port_no),
+                 type=Port.ETHERNET_UNI)
+            for port_no in [int(intf_id) << 11 | int(onu_id) << 4 | uni_id
+                            for uni_id in xrange(
+                                OpenOltPlatform.MAX_UNIS_PER_ONU)]])
+
+    def get_logical_port(self, logical_device_id, port_id):
+        self.calls['get_logical_port'] += 1
+        port_type, port_no = port_id.split('-')
+        port_no = int(port_no)
+        if port_type == 'nni':
+            return LogicalPort(id=port_id, device_id=DEVICE_ID,
+                               root_port=True, ofp_port=ofp_port(
+                                   port_no=port_no, name=port_id))
+        return LogicalPort(
+            id=port_id, root_port=False,
+            device_id=self.child_device_id(
+                self.platform.intf_id_from_uni_port_num(port_no),
+                self.platform.onu_id_from_port_num(port_no)),
+            ofp_port=ofp_port(port_no=port_no, name=port_id))
+
+    def publish_inter_adapter_message(self, device_id, msg):
+        self.calls['publish_inter_adapter_message'] += 1
+
+
+def mk_subscriber_flows(uni_port_no, c_tag, s_tag, cookie_base):
+    """
+    The logical flows ONOS installs for one subscriber UNI.
+    """
+    metadata = c_tag << 32 | uni_port_no
+    flows = [
+        # EAPOL trap
+        fd.mk_flow_stat(
+            priority=10000, table_id=0, cookie=cookie_base + 1,
+            match_fields=[fd.in_port(uni_port_no),
+                          fd.eth_type(EAP_ETH_TYPE)],
+            actions=[fd.output(CONTROLLER_PORT)]),
+        # DHCP trap
+        fd.mk_flow_stat(
+            priority=10000, table_id=0, cookie=cookie_base + 2,
+            match_fields=[fd.in_port(uni_port_no),
+                          fd.eth_type(IPV4_ETH_TYPE),
+                          fd.ip_proto(UDP_PROTO),
+                          fd.udp_src(68), fd.udp_dst(67)],
+            actions=[fd.output(CONTROLLER_PORT)]),
+        # HSIA upstream, c-tag on the ONU, then s-tag on the OLT
+        fd.mk_flow_stat(
+            priority=1000, table_id=0, cookie=cookie_base + 3,
+            match_fields=[fd.in_port(uni_port_no), fd.vlan_vid(0x1000)],
+            actions=[fd.set_field(fd.vlan_vid(0x1000 | c_tag))],
+            next_table_id=1),
+        fd.mk_flow_stat(
+            priority=1000, table_id=1, cookie=cookie_base + 4,
+            match_fields=[fd.in_port(uni_port_no),
+                          fd.vlan_vid(0x1000 | c_tag)],
+            actions=[fd.push_vlan(0x8100),
+                     fd.set_field(fd.vlan_vid(0x1000 | s_tag)),
+                     fd.output(NNI_PORT_NO)]),
+        # HSIA downstream, s-tag popped on the OLT, then c-tag on the ONU
+        fd.mk_flow_stat(
+            priority=1000, table_id=0, cookie=cookie_base + 5,
+            match_fields=[fd.in_port(NNI_PORT_NO),
+                          fd.vlan_vid(0x1000 | s_tag),
+                          fd.metadata(metadata)],
+            actions=[fd.pop_vlan()],
+            next_table_id=1),
+        fd.mk_flow_stat(
+            priority=1000, table_id=1, cookie=cookie_base + 6,
+            match_fields=[fd.in_port(NNI_PORT_NO),
+                          fd.vlan_vid(0x1000 | c_tag)],
+            actions=[fd.set_field(fd.vlan_vid(0x1000)),
+                     fd.output(uni_port_no)]),
+    ]
+    return flows
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(pct / 100.0 * len(samples)))]
+
+
+class OpenOltFlowBench(object):
+
+    def __init__(self, pon_ports=16, onus_per_pon=31, unis_per_onu=1,
+                 gemports=1, rpc_latency=0, repush=False, plan=False,
+                 log_level='error'):
+        self.log = structlog.wrap_logger(
+            structlog.PrintLogger(sys.stderr),
+            processors=[level_filter(log_level),
+                        structlog.processors.KeyValueRenderer()])
+
+        self.device_info = openolt_pb2.DeviceInfo(
+            vendor='BENCH', model='bench', technology='xgspon',
+            pon_ports=pon_ports, onu_id_start=1, onu_id_end=255,
+            alloc_id_start=1024, alloc_id_end=16383,
+            gemport_id_start=1024, gemport_id_end=65535,
+            flow_id_start=1, flow_id_end=16383)
+        self.kv_store = CountingKvStore()
+        self.resource_mgr = mk_resource_mgr(self.device_info, self.kv_store,
+                                            gemports)
+        self.platform = OpenOltPlatform(self.log, self.resource_mgr)
+        self.adapter_agent = BenchAdapterAgent(self.platform)
+        self.repush = repush
+        self.plan = plan
+        self.stub = BenchStub(rpc_latency)
+        self.flow_mgr = self.mk_flow_mgr(self.stub)
+
+        # ONU ids must fit the logical port number encoding
+        onus_per_pon = min(onus_per_pon, OpenOltPlatform.MAX_ONUS_PER_PON - 1)
+        unis_per_onu = min(unis_per_onu, OpenOltPlatform.MAX_UNIS_PER_ONU)
+        self.subscribers = []
+        for intf_id in xrange(pon_ports):
+            for onu_id in xrange(1, onus_per_pon + 1):
+                for uni_id in xrange(unis_per_onu):
+                    index = len(self.subscribers)
+                    self.subscribers.append(mk_subscriber_flows(
+                        intf_id << 11 | onu_id << 4 | uni_id,
+                        c_tag=C_TAG_BASE + index % 4000,
+                        s_tag=S_TAG_BASE + index // 4000,
+                        cookie_base=index << 8))
+
+    def mk_flow_mgr(self, stub, **kwargs):
+        return OpenOltFlowMgr(self.adapter_agent, self.log, stub, DEVICE_ID,
+                              LOGICAL_DEVICE_ID, self.platform,
+                              self.resource_mgr, **kwargs)
+
+    def counts(self):
+        return {
+            'rpc': sum(self.stub.calls.values()),
+            'kv_read': self.kv_store.ops['read'],
+            'kv_write': self.kv_store.ops['write'],
+            'kv_delete': self.kv_store.ops['delete'],
+            'core': sum(self.adapter_agent.calls.values()),
+        }
+
+    @inlineCallbacks
+    def run_phase(self, name, operation, on_subscriber,
+                  after_subscriber=None, per_subscriber=False):
+        before = self.counts()
+        latencies = []
+        start = time.time()
+        for subscriber_flows in self.subscribers:
+            on_subscriber(subscriber_flows)
+            if per_subscriber:
+                subscriber_start = time.time()
+                yield operation(subscriber_flows)
+                latencies.extend([time.time() - subscriber_start] *
+                                 len(subscriber_flows))
+            for flow in subscriber_flows if not per_subscriber else ():
+                flow_start = time.time()
+                yield operation(flow)
+                latencies.append(time.time() - flow_start)
+            if after_subscriber is not None:
+                yield after_subscriber()
+        duration = time.time() - start
+        self.add_result(name, latencies, duration, before, self.counts())
+
+    @inlineCallbacks
+    def run_reconcile(self):
+        # As after the OLT went down: the device flows are forgotten and the
+        # next repush adds every indexed logical flow again
+        self.flow_mgr.reset_flows()
+        before = self.counts()
+        start = time.time()
+        yield self.flow_mgr.repush_all_different_flows()
+        duration = time.time() - start
+        self.add_result('reconcile',
+                        [duration] * len(self.flow_mgr.logical_flows),
+                        duration, before, self.counts())
+
+    def add_result(self, name, latencies, duration, before, after):
+        latencies.sort()
+        subscribers = float(len(self.subscribers))
+        result = {
+            'phase': name,
+            'flows': len(latencies),
+            'duration': duration,
+            'flows_per_sec': len(latencies) / duration if duration else None,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+        }
+        for key in after:
+            result['{}_per_subscriber'.format(key)] = \
+                (after[key] - before[key]) / subscribers
+        self.log.info('bench-phase-done', **result)
+        self.results.append(result)
+
+    def provision(self, subscriber_flows):
+        # The core adds a subscriber's flows to the logical flow table
+        # before pushing them to the device
+        self.flow_mgr.index_logical_flows(subscriber_flows, [])
+
+    def unprovision(self, subscriber_flows):
+        self.flow_mgr.index_logical_flows([], subscriber_flows)
+
+    @inlineCallbacks
+    def run(self):
+        self.results = []
+        # update_logical_flows repushes the missing flows after each update
+        repush = self.flow_mgr.repush_all_different_flows \
+            if self.repush else None
+        if self.plan:
+            yield self.run_phase(
+                'add', lambda flows: self.flow_mgr.update_flows(flows, []),
+                self.provision, repush, per_subscriber=True)
+            if self.repush:
+                yield self.run_reconcile()
+            yield self.run_phase(
+                'remove', lambda flows: self.flow_mgr.update_flows([], flows),
+                self.unprovision, repush, per_subscriber=True)
+        else:
+            yield self.run_phase('add', self.flow_mgr.add_and_track_flow,
+                                 self.provision, repush)
+            if self.repush:
+                yield self.run_reconcile()
+            yield self.run_phase('remove', self.flow_mgr.remove_flow,
+                                 self.unprovision, repush)
+
+    def report(self):
+        print('subscribers: {}, rpcs: {}, decompositions: {} hits, {} '
+              'misses'.format(len(self.subscribers), dict(self.stub.calls),
+                              self.flow_mgr.decompositions.hits,
+                              self.flow_mgr.decompositions.misses))
+        columns = ('phase', 'flows', 'flows_per_sec', 'p50_ms', 'p99_ms',
+                   'rpc_per_subscriber', 'kv_read_per_subscriber',
+                   'kv_write_per_subscriber', 'kv_delete_per_subscriber',
+                   'core_per_subscriber')
+        print(' '.join('{:>24}'.format(column) for column in columns))
+        for result in self.results:
+            print(' '.join('{:>24}'.format(
+                '{:.3f}'.format(result[column])
+                if isinstance(result[column], float) else result[column])
+                for column in columns))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='OpenOLT flow manager throughput benchmark')
+    parser.add_argument('--pon_ports', type=int, default=16,
+                        help='number of PON ports (default: %(default)s)')
+    parser.add_argument('--onus_per_pon', type=int, default=31,
+                        help='number of ONUs per PON (default: %(default)s)')
+    parser.add_argument('--unis_per_onu', type=int, default=1,
+                        help='number of UNIs per ONU (default: %(default)s)')
+    parser.add_argument('--gemports', type=int, default=1,
+                        help='number of gemports per UNI (default: '
+                             '%(default)s)')
+    parser.add_argument('--rpc_latency', type=float, default=0,
+                        help='simulated gRPC latency in seconds (default: '
+                             '%(default)s)')
+    parser.add_argument('--repush', action='store_true',
+                        help='repush the missing flows after each '
+                             'subscriber, as update_logical_flows does')
+    parser.add_argument('--plan', action='store_true',
+                        help='add and remove the flows of a subscriber as '
+                             'one flow update plan')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    parser.add_argument('--log_level', default='error',
+                        choices=sorted(LOG_LEVELS.keys()),
+                        help='flow manager log level (default: %(default)s)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    bench = OpenOltFlowBench(pon_ports=args.pon_ports,
+                             onus_per_pon=args.onus_per_pon,
+                             unis_per_onu=args.unis_per_onu,
+                             gemports=args.gemports,
+                             rpc_latency=args.rpc_latency,
+                             repush=args.repush,
+                             plan=args.plan,
+                             log_level=args.log_level)
+
+    def done(_):
+        if args.json:
+            print(json.dumps(bench.results, indent=2))
+        else:
+            bench.report()
+
+    def failed(failure):
+        failure.printTraceback()
+
+    def start():
+        d = bench.run()
+        d.addCallbacks(done, failed)
+        d.addBoth(lambda _: reactor.stop())
+
+    reactor.callWhenRunning(start)
+    reactor.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Flow store cookie microbenchmark.
+
+Compares the md5 of the JSON classifier, the flow store cookie of previous
+releases, with the field tuple cookie of OpenOltFlowMgr, for the classifiers
+the flow manager derives for a subscriber:
+
+ - EAPOL trap, upstream and downstream
+ - DHCP trap
+ - HSIA upstream and downstream
+ - LLDP trap on the NNI
+
+Usage:
+
+    openolt_flow_cookie_bench.py --iterations 100000
+"""
+
+import argparse
+import time
+
+from openolt_flow_mgr import OpenOltFlowMgr, is_legacy_flow_store_cookie, \
+    ETH_TYPE, IP_PROTO, IN_PORT, VLAN_VID, VLAN_PCP, UDP_SRC, UDP_DST, \
+    METADATA, PACKET_TAG_TYPE, SINGLE_TAG, DOUBLE_TAG, EAP_ETH_TYPE, \
+    LLDP_ETH_TYPE
+
+UNI_PORT_NO = 3 << 11 | 5 << 4
+NNI_PORT_NO = 1 << 16
+GEMPORT_ID = 1024
+
+
+def mk_classifiers():
+    return [
+        ('eapol-upstream', {ETH_TYPE: EAP_ETH_TYPE, IN_PORT: UNI_PORT_NO,
+                            PACKET_TAG_TYPE: SINGLE_TAG, VLAN_VID: 4091},
+         GEMPORT_ID),
+        ('eapol-downstream', {ETH_TYPE: EAP_ETH_TYPE, IN_PORT: NNI_PORT_NO,
+                              PACKET_TAG_TYPE: DOUBLE_TAG, VLAN_VID: 4000,
+                              METADATA: 4091},
+         GEMPORT_ID),
+        ('dhcp', {ETH_TYPE: 0x0800, IP_PROTO: 17, IN_PORT: UNI_PORT_NO,
+                  UDP_SRC: 68, UDP_DST: 67, PACKET_TAG_TYPE: SINGLE_TAG},
+         GEMPORT_ID),
+        ('hsia-upstream', {IN_PORT: UNI_PORT_NO, VLAN_VID: 0, VLAN_PCP: 0,
+                           PACKET_TAG_TYPE: SINGLE_TAG},
+         GEMPORT_ID),
+        ('hsia-downstream', {IN_PORT: NNI_PORT_NO, VLAN_VID: 4000,
+                             METADATA: 100, VLAN_PCP: 0,
+                             PACKET_TAG_TYPE: DOUBLE_TAG},
+         GEMPORT_ID),
+        ('lldp', {ETH_TYPE: LLDP_ETH_TYPE, PACKET_TAG_TYPE: 'untagged'},
+         None),
+    ]
+
+
+def measure(fn, iterations):
+    start = time.time()
+    for _ in xrange(iterations):
+        fn()
+    return (time.time() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='OpenOLT flow store cookie microbenchmark')
+    parser.add_argument('--iterations', type=int, default=100000,
+                        help='cookies derived per case and method '
+                             '(default: %(default)s)')
+    args = parser.parse_args()
+
+    legacy_cookie = OpenOltFlowMgr._get_legacy_flow_store_cookie
+    cookie = OpenOltFlowMgr._get_flow_store_cookie
+
+    cases = mk_classifiers()
+    legacy_cookies = set(legacy_cookie(c, g) for (_, c, g) in cases)
+    cookies = set(cookie(c, g) for (_, c, g) in cases)
+    if len(legacy_cookies) != len(cases) or len(cookies) != len(cases):
+        raise AssertionError('cookies are not unique')
+    if not all(is_legacy_flow_store_cookie(c) for c in legacy_cookies) or \
+            any(is_legacy_flow_store_cookie(c) for c in cookies):
+        raise AssertionError('legacy cookies are not told apart')
+
+    print('{:<20} {:>12} {:>12} {:>8}  {}'.format(
+        'case', 'legacy_us', 'cookie_us', 'speedup', 'cookie'))
+    for (name, classifier, gemport_id) in cases:
+        legacy_time = measure(lambda: legacy_cookie(classifier, gemport_id),
+                              args.iterations)
+        cookie_time = measure(lambda: cookie(classifier, gemport_id),
+                              args.iterations)
+        print('{:<20} {:>12.2f} {:>12.2f} {:>7.1f}x  {}'.format(
+            name, legacy_time * 1e6, cookie_time * 1e6,
+            legacy_time / cookie_time, cookie(classifier, gemport_id)))
+
+
+if __name__ == '__main__':
+    main()
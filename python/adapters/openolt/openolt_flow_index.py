@@ -0,0 +1,198 @@
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from collections import OrderedDict
+
+import pyvoltha.common.openflow.utils as fd
+from voltha_protos.device_pb2 import Port
+
+EAP_ETH_TYPE = 0x888e
+
+
+class OpenOltLogicalFlowIndex(object):
+    """
+    The logical flows of the OLT, indexed for the lookups the flow manager
+    does on every flow add:
+
+      next flows         by (table_id, in_port, output port)
+      EAPOL flows        by the (intf_id, onu_id, uni_id) of their in_port
+      flows to the NNI   by in_port
+
+    Flows are kept in the order they were added in, each index returns
+    them in that order. The index is maintained incrementally with
+    update(), as the core adds and removes logical flows. It only holds the
+    flows the core sent since the flow manager was created: the core proxy
+    cannot read the whole logical flow table to rebuild it.
+    """
+
+    def __init__(self, platform):
+        self.platform = platform
+        # flow id -> (flow, index keys)
+        self.flows = OrderedDict()
+        self.next_flows = dict()
+        self.eap_flows = dict()
+        self.nni_flows = dict()
+
+    def __len__(self):
+        return len(self.flows)
+
+    def __contains__(self, flow_id):
+        return flow_id in self.flows
+
+    def __iter__(self):
+        return (flow for (flow, _) in self.flows.itervalues())
+
+    def get(self, flow_id):
+        entry = self.flows.get(flow_id)
+        return entry[0] if entry is not None else None
+
+    def update(self, flows_to_add=(), flows_to_remove=()):
+        for flow in flows_to_remove:
+            self.remove(flow)
+        for flow in flows_to_add:
+            self.add(flow)
+
+    def add(self, flow):
+        if flow.id in self.flows:
+            self.remove(flow)
+
+        in_port = None
+        eap = False
+        for field in fd.get_ofb_fields(flow):
+            if field.type == fd.IN_PORT:
+                in_port = field.port
+            elif field.type == fd.ETH_TYPE and \
+                    field.eth_type == EAP_ETH_TYPE:
+                eap = True
+        out_port = fd.get_out_port(flow)
+
+        keys = [(self.next_flows, (flow.table_id, in_port, out_port))]
+        if eap and in_port is not None:
+            keys.append((self.eap_flows, (
+                self.platform.intf_id_from_uni_port_num(in_port),
+                self.platform.onu_id_from_port_num(in_port),
+                self.platform.uni_id_from_port_num(in_port))))
+        if out_port is not None and \
+                self.platform.intf_id_to_port_type_name(out_port) == \
+                Port.ETHERNET_NNI:
+            keys.append((self.nni_flows, in_port))
+
+        for (index, key) in keys:
+            index.setdefault(key, OrderedDict())[flow.id] = flow
+        self.flows[flow.id] = (flow, keys)
+
+    def remove(self, flow):
+        entry = self.flows.pop(flow.id, None)
+        if entry is None:
+            return
+        for (index, key) in entry[1]:
+            flows = index[key]
+            del flows[flow.id]
+            if not flows:
+                del index[key]
+
+    def next_flow(self, table_id, in_port, out_port):
+        """
+        Returns the flow of table table_id matching in_port and outputting
+        to out_port with the highest priority, the first added among equals.
+        """
+        flows = self.next_flows.get((table_id, in_port, out_port))
+        if not flows:
+            return None
+        return max(flows.itervalues(), key=lambda f: f.priority)
+
+    def eap_flow(self, intf_id, onu_id, uni_id):
+        flows = self.eap_flows.get((intf_id, onu_id, uni_id))
+        if not flows:
+            return None
+        return next(flows.itervalues())
+
+    def flows_to_nni(self, in_port):
+        return self.nni_flows.get(in_port, {}).values()
+
+
+class OpenOltFlowDecomposition(object):
+    """
+    What OpenOltFlowMgr.add_flow derives from a logical flow: its flow type
+    (one of the openolt_flow_mgr *_FLOW_TYPE), the classifier and action
+    dicts, and the (port_no, intf_id, onu_id, uni_id) access tuple. For a
+    flow whose output comes from a flow of the next table, next_flow_key is
+    the (table_id, in_port, output port) of that flow.
+    """
+
+    __slots__ = ('flow_type', 'classifier', 'action', 'access',
+                 'next_flow_key')
+
+    def __init__(self, flow_type, classifier=None, action=None, access=None,
+                 next_flow_key=None):
+        self.flow_type = flow_type
+        self.classifier = classifier
+        self.action = action
+        self.access = access
+        self.next_flow_key = next_flow_key
+
+
+class OpenOltFlowDecompositionCache(object):
+    """
+    The decompositions of the logical flows, by flow id. An entry is only
+    used for a flow with the same content as the one it was derived from.
+
+    Entries are evicted with invalidate() when their flow is removed or
+    replaced, and when a flow of the next table they were derived from is
+    added or removed.
+    """
+
+    def __init__(self):
+        # flow id -> (flow content, OpenOltFlowDecomposition)
+        self.entries = dict()
+        # next flow key -> ids of the flows derived from it
+        self.dependents = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, flow):
+        entry = self.entries.get(flow.id)
+        if entry is not None and entry[0] == flow.SerializeToString():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, flow, decomposition):
+        self.evict(flow.id)
+        self.entries[flow.id] = (flow.SerializeToString(), decomposition)
+        if decomposition.next_flow_key is not None:
+            self.dependents.setdefault(decomposition.next_flow_key,
+                                       set()).add(flow.id)
+
+    def evict(self, flow_id):
+        entry = self.entries.pop(flow_id, None)
+        if entry is None or entry[1].next_flow_key is None:
+            return
+        dependents = self.dependents.get(entry[1].next_flow_key)
+        if dependents is not None:
+            dependents.discard(flow_id)
+            if not dependents:
+                del self.dependents[entry[1].next_flow_key]
+
+    def invalidate(self, flow):
+        self.evict(flow.id)
+        key = (flow.table_id, fd.get_in_port(flow), fd.get_out_port(flow))
+        for flow_id in list(self.dependents.get(key, ())):
+            self.evict(flow_id)
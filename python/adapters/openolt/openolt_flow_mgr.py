@@ -14,7 +14,10 @@
 # limitations under the License.
 #
 import copy
+from collections import OrderedDict
+from functools import partial
 from twisted.internet import reactor
+from twisted.internet.defer import DeferredList, inlineCallbacks, returnValue
 import grpc
 from google.protobuf.json_format import MessageToDict
 import hashlib
@@ -30,9 +33,25 @@ from pyvoltha.common.utils.registry import registry
 
 from pyvoltha.common.tech_profile.tech_profile import DEFAULT_TECH_PROFILE_TABLE_ID
 
+from openolt_flow_index import OpenOltLogicalFlowIndex, \
+    OpenOltFlowDecomposition, OpenOltFlowDecompositionCache
+from openolt_flow_plan import OpenOltFlowUpdatePlan
+from openolt_flow_store import OpenOltDeviceFlowStore
+
 # Flow categories
 HSIA_FLOW = "HSIA_FLOW"
 
+# Flow types, as classified by add_flow
+EAPOL_FLOW_TYPE = 'eapol'
+DHCP_FLOW_TYPE = 'dhcp'
+IGMP_FLOW_TYPE = 'igmp'
+LLDP_FLOW_TYPE = 'lldp'
+HSIA_UPSTREAM_FLOW_TYPE = 'hsia_upstream'
+HSIA_DOWNSTREAM_FLOW_TYPE = 'hsia_downstream'
+ONU_FLOW_TYPE = 'onu'          # taken care of by the ONU
+UNHANDLED_FLOW_TYPE = 'unhandled'
+INVALID_FLOW_TYPE = 'invalid'
+
 EAP_ETH_TYPE = 0x888e
 LLDP_ETH_TYPE = 0x88cc
 
@@ -67,31 +86,182 @@ POP_VLAN = 'pop_vlan'
 PUSH_VLAN = 'push_vlan'
 TRAP_TO_HOST = 'trap_to_host'
 
+# The classifier fields of a flow store cookie, in cookie order
+FLOW_STORE_COOKIE_FIELDS = (ETH_TYPE, IP_PROTO, IN_PORT, VLAN_VID, VLAN_PCP,
+                            UDP_SRC, UDP_DST, IPV4_SRC, IPV4_DST, METADATA,
+                            PACKET_TAG_TYPE)
+FLOW_STORE_COOKIE_FIELD_SET = frozenset(FLOW_STORE_COOKIE_FIELDS)
+# The fields, then the gemport
+FLOW_STORE_COOKIE_FORMAT = ','.join(['%s'] * (len(FLOW_STORE_COOKIE_FIELDS)
+                                              + 1))
+
+
+def is_legacy_flow_store_cookie(cookie):
+    """
+    Whether a stored flow store cookie is an md5 cookie of a previous
+    release, which has no field separator.
+    """
+    return ',' not in cookie
+
 
 class OpenOltFlowMgr(object):
 
     def __init__(self, adapter_agent, log, stub, device_id, logical_device_id,
-                 platform, resource_mgr):
+                 platform, resource_mgr, flow_add_sender=None,
+                 flow_remove_sender=None):
         self.adapter_agent = adapter_agent
         self.log = log
         self.stub = stub
+        # OpenOltFlowBatchSender batching the FlowAdd and FlowRemove calls,
+        # the unary calls are used without them
+        self.flow_add_sender = flow_add_sender
+        self.flow_remove_sender = flow_remove_sender
         self.device_id = device_id
         self.logical_device_id = logical_device_id
         self.nni_intf_id = None
         self.platform = platform
         #self.logical_flows_proxy = registry('core').get_proxy(
         #    '/logical_devices/{}/flows'.format(self.logical_device_id))
-        self.logical_flows_proxy = adapter_agent
+        self.logical_flows = OpenOltLogicalFlowIndex(platform)
+        self.decompositions = OpenOltFlowDecompositionCache()
 	#self.flows_proxy = registry('core').get_proxy(
         #    '/devices/{}/flows'.format(self.device_id))
         #self.root_proxy = registry('core').get_proxy('/')
+        self.device_flows = OpenOltDeviceFlowStore(log)
+        # Whether the next repush compares all the logical flows with the
+        # device ones, after a (re)connection or a reboot of the OLT
+        self.reconcile_flows = True
+        # Ids of the logical flows whose device flows could not all be added,
+        # to retry
+        self.missing_flows = set()
         self.resource_mgr = resource_mgr
         self.tech_profile = dict()
         self._populate_tech_profile_per_pon_port()
         self.retry_add_flow_list = []
 
-    def add_flow(self, flow):
+    def index_logical_flows(self, flows_to_add, flows_to_remove):
+        """
+        Updates the logical flows the flow manager looks up (next table
+        flows, EAPOL and subscriber flows) with the changes made by the
+        core, before they are pushed to the device.
+        """
+        self.logical_flows.update(flows_to_add, flows_to_remove)
+        for flow in flows_to_remove:
+            self.missing_flows.discard(flow.id)
+            self.decompositions.invalidate(flow)
+        for flow in flows_to_add:
+            self.decompositions.invalidate(flow)
+
+    def add_flows(self, flows):
+        """
+        Adds logical flows, those of different ONUs concurrently so that
+        their device flows can be batched, those of an ONU in order.
+        """
+        return self._run_per_onu(flows, self.add_and_track_flow,
+                                 'failed to add flow')
+
+    def update_flows(self, flows_to_add, flows_to_remove):
+        """
+        Adds and removes logical flows as one OpenOltFlowUpdatePlan.
+        """
+        return OpenOltFlowUpdatePlan(self, flows_to_add,
+                                     flows_to_remove).run()
+
+    @inlineCallbacks
+    def add_and_track_flow(self, flow, tconts=None):
+        # A logical flow is missing from the device if adding it fails, or
+        # if adding one of its device flows fails, see add_flow_to_device
+        self.missing_flows.discard(flow.id)
+        try:
+            yield self.add_flow(flow, tconts)
+        except Exception:
+            self.missing_flows.add(flow.id)
+            raise
+
+    def remove_flows(self, flows):
+        return self._run_per_onu(flows, self.remove_flow,
+                                 'failed to remove flow')
+
+    def _run_per_onu(self, flows, operation, error):
+        onus = OrderedDict()
+        for flow in flows:
+            onus.setdefault(self._flow_onu(flow), []).append(flow)
+        return DeferredList([self._run_in_order(onu_flows, operation, error)
+                             for onu_flows in onus.itervalues()])
+
+    @inlineCallbacks
+    def _run_in_order(self, flows, operation, error):
+        for flow in flows:
+            try:
+                yield operation(flow)
+            except Exception as e:
+                self.log.error(error, flow=flow, e=e)
+
+    def _flow_onu(self, flow):
+        # (intf_id, onu_id) of the UNI a logical flow is for, None for the
+        # NNI only flows (e.g. LLDP trap)
+        uni = self.flow_uni(flow)
+        return uni[:2] if uni is not None else None
+
+    def flow_uni(self, flow):
+        # (intf_id, onu_id, uni_id) of the UNI a logical flow is for, None
+        # for the NNI only flows
+        for port_no in (fd.get_in_port(flow), fd.get_out_port(flow),
+                        fd.get_metadata(flow)):
+            if port_no and self.platform.intf_id_to_port_type_name(
+                    port_no) == Port.ETHERNET_UNI:
+                return (self.platform.intf_id_from_uni_port_num(port_no),
+                        self.platform.onu_id_from_port_num(port_no),
+                        self.platform.uni_id_from_port_num(port_no))
+        return None
+
+    def flow_add(self, flow):
+        if self.flow_add_sender is None:
+            return self.stub.FlowAdd(flow)
+        return self.flow_add_sender.send(flow)
+
+    def flow_remove(self, flow):
+        if self.flow_remove_sender is None:
+            return self.stub.FlowRemove(flow)
+        return self.flow_remove_sender.send(flow)
+
+    @inlineCallbacks
+    def add_flow(self, flow, tconts=None):
+        """
+        tconts optionally holds the (alloc_id, gemport ids) already set up
+        for the flow's (intf_id, onu_id, uni_id).
+        """
         self.log.debug('add flow', flow=flow)
+        decomposition = self.get_decomposition(flow)
+        if decomposition is None:
+            return
+
+        if decomposition.flow_type == ONU_FLOW_TYPE:
+            self.log.debug('being taken care of by ONU', flow=flow)
+            return
+
+        (port_no, intf_id, onu_id, uni_id) = decomposition.access
+        # The classifier and action are updated while adding the flow
+        yield self.divide_and_add_flow(intf_id, onu_id, uni_id, port_no,
+                                       dict(decomposition.classifier),
+                                       dict(decomposition.action), flow,
+                                       decomposition.flow_type,
+                                       tconts.get((intf_id, onu_id, uni_id))
+                                       if tconts is not None else None)
+
+    def get_decomposition(self, flow):
+        decomposition = self.decompositions.get(flow)
+        if decomposition is None:
+            decomposition = self.decompose_flow(flow)
+            if decomposition is not None:
+                self.decompositions.put(flow, decomposition)
+        return decomposition
+
+    def decompose_flow(self, flow):
+        """
+        Returns the OpenOltFlowDecomposition of a logical flow, None if its
+        output is in a flow of the next table not known yet.
+        """
         classifier_info = dict()
         action_info = dict()
 
@@ -148,8 +318,7 @@ class OpenOltFlowMgr(object):
                                in_port=classifier_info[IN_PORT])
             elif action.type == fd.POP_VLAN:
                 if fd.get_goto_table_id(flow) is None:
-                    self.log.debug('being taken care of by ONU', flow=flow)
-                    return
+                    return OpenOltFlowDecomposition(ONU_FLOW_TYPE)
                 action_info[POP_VLAN] = True
                 self.log.debug('action-type-pop-vlan',
                                in_port=classifier_info[IN_PORT])
@@ -180,25 +349,48 @@ class OpenOltFlowMgr(object):
                                action_type=action.type, in_port=classifier_info[IN_PORT])
 
         if fd.get_goto_table_id(flow) is not None and POP_VLAN not in action_info:
-            self.log.debug('being taken care of by ONU', flow=flow)
-            return
+            return OpenOltFlowDecomposition(ONU_FLOW_TYPE)
 
+        next_flow_key = None
         if OUTPUT not in action_info and METADATA in classifier_info:
             # find flow in the next table
             next_flow = self.find_next_flow(flow)
             if next_flow is None:
-                return
+                return None
+            next_flow_key = (next_flow.table_id, fd.get_in_port(next_flow),
+                             fd.get_out_port(next_flow))
             action_info[OUTPUT] = fd.get_out_port(next_flow)
             for field in fd.get_ofb_fields(next_flow):
                 if field.type == fd.VLAN_VID:
                     classifier_info[METADATA] = field.vlan_vid & 0xfff
 
         self.log.debug('flow-ports', classifier_inport=classifier_info[IN_PORT], action_output=action_info[OUTPUT])
-        (port_no, intf_id, onu_id, uni_id) = self.platform.extract_access_from_flow(
+        access = self.platform.extract_access_from_flow(
             classifier_info[IN_PORT], action_info[OUTPUT])
 
-        self.divide_and_add_flow(intf_id, onu_id, uni_id, port_no, classifier_info,
-                                 action_info, flow)
+        return OpenOltFlowDecomposition(
+            self.classify_flow(classifier_info, action_info), classifier_info,
+            action_info, access, next_flow_key)
+
+    @staticmethod
+    def classify_flow(classifier, action):
+        if IP_PROTO in classifier:
+            if classifier[IP_PROTO] == 17:
+                return DHCP_FLOW_TYPE
+            elif classifier[IP_PROTO] == IGMP_PROTO:
+                return IGMP_FLOW_TYPE
+            return INVALID_FLOW_TYPE
+        elif ETH_TYPE in classifier:
+            if classifier[ETH_TYPE] == EAP_ETH_TYPE:
+                return EAPOL_FLOW_TYPE
+            elif classifier[ETH_TYPE] == LLDP_ETH_TYPE:
+                return LLDP_FLOW_TYPE
+            return UNHANDLED_FLOW_TYPE
+        elif PUSH_VLAN in action:
+            return HSIA_UPSTREAM_FLOW_TYPE
+        elif POP_VLAN in action:
+            return HSIA_DOWNSTREAM_FLOW_TYPE
+        return INVALID_FLOW_TYPE
 
     def _is_uni_port(self, port_no):
         try:
@@ -212,6 +404,7 @@ class OpenOltFlowMgr(object):
             self.log.error("error-retrieving-port", e=e)
             return False, None
 
+    @inlineCallbacks
     def _clear_flow_id_from_rm(self, flow, flow_id, flow_direction):
         uni_port_no = None
         child_device_id = None
@@ -238,7 +431,7 @@ class OpenOltFlowMgr(object):
                             uni_port_no = action.output.port
 
         if child_device_id:
-            child_device = self.adapter_agent.get_device(child_device_id)
+            child_device = yield self.adapter_agent.get_device(child_device_id)
             pon_intf = child_device.proxy_address.channel_id
             onu_id = child_device.proxy_address.onu_id
             uni_id = self.platform.uni_id_from_port_num(uni_port_no) if uni_port_no is not None else None
@@ -265,22 +458,23 @@ class OpenOltFlowMgr(object):
         self.log.debug("retry-add-flow")
         if flow.id in self.retry_add_flow_list:
             self.retry_add_flow_list.remove(flow.id)
-        self.add_flow(flow)
+        if flow.id not in self.logical_flows:
+            # Removed by the core in the meantime
+            self.log.debug('retry-add-flow-removed', flow_id=flow.id)
+            return
+        return self.add_and_track_flow(flow)
 
+    @inlineCallbacks
     def remove_flow(self, flow):
         self.log.debug('trying to remove flows from logical flow :',
                        logical_flow=flow)
-        device_flows_to_remove = []
-        device_flows = self.flows_proxy.get('/').items
-        for f in device_flows:
-            if f.cookie == flow.id:
-                device_flows_to_remove.append(f)
+        device_flows_to_remove = self.device_flows.get_by_cookie(flow.id)
 
         for f in device_flows_to_remove:
             (id, direction) = self.decode_stored_id(f.id)
             flow_to_remove = openolt_pb2.Flow(flow_id=id, flow_type=direction)
             try:
-                self.stub.FlowRemove(flow_to_remove)
+                yield self.flow_remove(flow_to_remove)
             except grpc.RpcError as grpc_e:
                 if grpc_e.code() == grpc.StatusCode.NOT_FOUND:
                     self.log.debug('This flow does not exist on the switch, '
@@ -292,40 +486,34 @@ class OpenOltFlowMgr(object):
             # once we have successfully deleted the flow on the device
             # release the flow_id on resource pool and also clear any
             # data associated with the flow_id on KV store.
-            self._clear_flow_id_from_rm(f, id, direction)
+            yield self._clear_flow_id_from_rm(f, id, direction)
+            self.device_flows.remove(f)
             self.log.debug('flow removed from device', flow=f,
                            flow_key=flow_to_remove)
 
         if len(device_flows_to_remove) > 0:
-            new_flows = []
-            flows_ids_to_remove = [f.id for f in device_flows_to_remove]
-            for f in device_flows:
-                if f.id not in flows_ids_to_remove:
-                    new_flows.append(f)
-
-            self.flows_proxy.update('/', Flows(items=new_flows))
             self.log.debug('flows removed from the data store',
-                           flow_ids_removed=flows_ids_to_remove,
-                           number_of_flows_removed=(len(device_flows) - len(
-                               new_flows)), expected_flows_removed=len(
-                    device_flows_to_remove))
+                           flow_ids_removed=[f.id for f in
+                                             device_flows_to_remove])
         else:
             self.log.debug('no device flow to remove for this flow (normal '
                            'for multi table flows)', flow=flow)
 
+    @inlineCallbacks
     def _get_ofp_port_name(self, intf_id, onu_id, uni_id):
         parent_port_no = self.platform.intf_id_to_port_no(intf_id, Port.PON_OLT)
-        child_device = self.adapter_agent.get_child_device(self.device_id,
-                                                           parent_port_no=parent_port_no, onu_id=onu_id)
+        child_device = yield self.adapter_agent.get_child_device(
+            self.device_id, parent_port_no=parent_port_no, onu_id=onu_id)
         if child_device is None:
             self.log.error("could-not-find-child-device",
                            parent_port_no=intf_id, onu_id=onu_id)
-            return (None, None)
-        ports = self.adapter_agent.get_ports(child_device.id, Port.ETHERNET_UNI)
+            returnValue((None, None))
+        ports = yield self.adapter_agent.get_ports(child_device.id,
+                                                   Port.ETHERNET_UNI)
         logical_port = self.adapter_agent.get_logical_port(
             self.logical_device_id, ports[uni_id].label)
         ofp_port_name = (logical_port.ofp_port.name, logical_port.ofp_port.port_no)
-        return ofp_port_name
+        returnValue(ofp_port_name)
 
     def get_tp_path(self, intf_id, ofp_port_name):
         # FIXME Should get Table id form the flow, as of now hardcoded to
@@ -337,23 +525,32 @@ class OpenOltFlowMgr(object):
             get_tp_path(DEFAULT_TECH_PROFILE_TABLE_ID,
                         ofp_port_name)
 
+    @inlineCallbacks
     def delete_tech_profile_instance(self, intf_id, onu_id, uni_id):
         # Remove the TP instance associated with the ONU
-        ofp_port_name = self._get_ofp_port_name(intf_id, onu_id, uni_id)
+        ofp_port_name = yield self._get_ofp_port_name(intf_id, onu_id, uni_id)
         tp_path = self.get_tp_path(intf_id, ofp_port_name)
-        return self.tech_profile[intf_id].delete_tech_profile_instance(tp_path)
+        returnValue(self.tech_profile[intf_id].delete_tech_profile_instance(
+            tp_path))
 
+    @inlineCallbacks
     def divide_and_add_flow(self, intf_id, onu_id, uni_id, port_no, classifier,
-                            action, flow):
+                            action, flow, flow_type=None, tcont=None):
 
         self.log.debug('sorting flow', intf_id=intf_id, onu_id=onu_id, uni_id=uni_id, port_no=port_no,
                        classifier=classifier, action=action)
 
-        alloc_id, gem_ports = self.create_tcont_gemport(intf_id, onu_id, uni_id,
-                                                        flow.table_id)
+        if flow_type is None:
+            flow_type = self.classify_flow(classifier, action)
+
+        if tcont is None:
+            tcont = yield self.create_tcont_gemport(intf_id, onu_id, uni_id,
+                                                    flow.table_id)
+        alloc_id, gem_ports = tcont
         if alloc_id is None or gem_ports is None:
             self.log.error("alloc-id-gem-ports-unavailable", alloc_id=alloc_id,
                            gem_ports=gem_ports)
+            self.missing_flows.add(flow.id)
             return
 
         self.log.debug('Generated required alloc and gemport ids',
@@ -362,63 +559,65 @@ class OpenOltFlowMgr(object):
         # Flows can't be added specific to gemport unless p-bits are received.
         # Hence adding flows for all gemports
         for gemport_id in gem_ports:
-            if IP_PROTO in classifier:
-                if classifier[IP_PROTO] == 17:
-                    self.log.debug('dhcp flow add')
-                    self.add_dhcp_trap(intf_id, onu_id, uni_id, port_no, classifier,
-                                       action, flow, alloc_id, gemport_id)
-                elif classifier[IP_PROTO] == 2:
-                    self.log.warn('igmp flow add ignored, not implemented yet')
-                else:
-                    self.log.warn("Invalid-Classifier-to-handle",
-                                  classifier=classifier,
-                                  action=action)
-            elif ETH_TYPE in classifier:
-                if classifier[ETH_TYPE] == EAP_ETH_TYPE:
-                    self.log.debug('eapol flow add')
-                    self.add_eapol_flow(intf_id, onu_id, uni_id, port_no, flow, alloc_id,
-                                        gemport_id)
-                    vlan_id = self.get_subscriber_vlan(fd.get_in_port(flow))
-                    if vlan_id is not None:
-                        self.add_eapol_flow(
-                            intf_id, onu_id, uni_id, port_no, flow, alloc_id, gemport_id,
-                            vlan_id=vlan_id)
-                    parent_port_no = self.platform.intf_id_to_port_no(intf_id, Port.PON_OLT)
-                    onu_device = self.adapter_agent.get_child_device(self.device_id,
-                                                                     onu_id=onu_id,
-                                                                     parent_port_no=parent_port_no)
-                    (ofp_port_name, ofp_port_no) = self._get_ofp_port_name(intf_id, onu_id, uni_id)
-                    if ofp_port_name is None:
-                        self.log.error("port-name-not-found")
-                        return
-
-                    tp_path = self.get_tp_path(intf_id, ofp_port_name)
-
-                    self.log.debug('Load-tech-profile-request-to-brcm-handler',
-                                   tp_path=tp_path)
-                    msg = {'proxy_address': onu_device.proxy_address, 'uni_id': uni_id,
-                           'event': 'download_tech_profile', 'event_data': tp_path}
-
-                    # Send the event message to the ONU adapter
-                    self.adapter_agent.publish_inter_adapter_message(onu_device.id,
-                                                                     msg)
-
-                if classifier[ETH_TYPE] == LLDP_ETH_TYPE:
-                    self.log.debug('lldp flow add')
-                    nni_intf_id = self.get_nni_intf_id()
-                    self.add_lldp_flow(flow, port_no, nni_intf_id)
+            if flow_type == DHCP_FLOW_TYPE:
+                self.log.debug('dhcp flow add')
+                yield self.add_dhcp_trap(intf_id, onu_id, uni_id, port_no,
+                                         classifier, action, flow,
+                                         alloc_id, gemport_id)
+            elif flow_type == IGMP_FLOW_TYPE:
+                self.log.warn('igmp flow add ignored, not implemented yet')
+            elif flow_type == EAPOL_FLOW_TYPE:
+                self.log.debug('eapol flow add')
+                yield self.add_eapol_flow(intf_id, onu_id, uni_id, port_no,
+                                          flow, alloc_id, gemport_id)
+                vlan_id = self.get_subscriber_vlan(fd.get_in_port(flow))
+                if vlan_id is not None:
+                    yield self.add_eapol_flow(
+                        intf_id, onu_id, uni_id, port_no, flow, alloc_id, gemport_id,
+                        vlan_id=vlan_id)
+                parent_port_no = self.platform.intf_id_to_port_no(intf_id, Port.PON_OLT)
+                onu_device = yield self.adapter_agent.get_child_device(
+                    self.device_id, onu_id=onu_id,
+                    parent_port_no=parent_port_no)
+                (ofp_port_name, ofp_port_no) = \
+                    yield self._get_ofp_port_name(intf_id, onu_id, uni_id)
+                if ofp_port_name is None:
+                    self.log.error("port-name-not-found")
+                    return
 
-            elif PUSH_VLAN in action:
-                self.add_upstream_data_flow(intf_id, onu_id, uni_id, port_no, classifier,
-                                            action, flow, alloc_id, gemport_id)
-            elif POP_VLAN in action:
-                self.add_downstream_data_flow(intf_id, onu_id, uni_id, port_no, classifier,
-                                              action, flow, alloc_id, gemport_id)
-            else:
+                tp_path = self.get_tp_path(intf_id, ofp_port_name)
+
+                self.log.debug('Load-tech-profile-request-to-brcm-handler',
+                               tp_path=tp_path)
+                msg = {'proxy_address': onu_device.proxy_address, 'uni_id': uni_id,
+                       'event': 'download_tech_profile', 'event_data': tp_path}
+
+                # Send the event message to the ONU adapter
+                self.adapter_agent.publish_inter_adapter_message(onu_device.id,
+                                                                 msg)
+            elif flow_type == LLDP_FLOW_TYPE:
+                self.log.debug('lldp flow add')
+                nni_intf_id = yield self.get_nni_intf_id()
+                yield self.add_lldp_flow(flow, port_no, nni_intf_id)
+            elif flow_type == HSIA_UPSTREAM_FLOW_TYPE:
+                yield self.add_upstream_data_flow(intf_id, onu_id, uni_id,
+                                                  port_no, classifier, action,
+                                                  flow, alloc_id, gemport_id)
+            elif flow_type == HSIA_DOWNSTREAM_FLOW_TYPE:
+                yield self.add_downstream_data_flow(intf_id, onu_id, uni_id,
+                                                    port_no, classifier,
+                                                    action, flow, alloc_id,
+                                                    gemport_id)
+            elif flow_type == INVALID_FLOW_TYPE and IP_PROTO in classifier:
+                self.log.warn("Invalid-Classifier-to-handle",
+                              classifier=classifier,
+                              action=action)
+            elif flow_type == INVALID_FLOW_TYPE:
                 self.log.debug('Invalid-flow-type-to-handle',
                                classifier=classifier,
                                action=action, flow=flow)
 
+    @inlineCallbacks
     def create_tcont_gemport(self, intf_id, onu_id, uni_id, table_id):
         alloc_id, gem_port_ids = None, None
         pon_intf_onu_id = (intf_id, onu_id)
@@ -429,13 +628,14 @@ class OpenOltFlowMgr(object):
         gem_port_ids = \
             self.resource_mgr.get_current_gemport_ids_for_onu(pon_intf_onu_id)
         if alloc_id is not None and gem_port_ids is not None:
-            return alloc_id, gem_port_ids
+            returnValue((alloc_id, gem_port_ids))
 
         try:
-            (ofp_port_name, ofp_port_no) = self._get_ofp_port_name(intf_id, onu_id, uni_id)
+            (ofp_port_name, ofp_port_no) = \
+                yield self._get_ofp_port_name(intf_id, onu_id, uni_id)
             if ofp_port_name is None:
                 self.log.error("port-name-not-found")
-                return alloc_id, gem_port_ids
+                returnValue((alloc_id, gem_port_ids))
             # FIXME: If table id is <= 63 using 64 as table id
             if table_id < DEFAULT_TECH_PROFILE_TABLE_ID:
                 table_id = DEFAULT_TECH_PROFILE_TABLE_ID
@@ -468,11 +668,11 @@ class OpenOltFlowMgr(object):
                                                            us_scheduler,
                                                            ds_scheduler)
 
-            self.stub.CreateTconts(openolt_pb2.Tconts(intf_id=intf_id,
-                                                      onu_id=onu_id,
-                                                      uni_id=uni_id,
-                                                      port_no=ofp_port_no,
-                                                      tconts=tconts))
+            yield self.stub.CreateTconts(openolt_pb2.Tconts(intf_id=intf_id,
+                                                            onu_id=onu_id,
+                                                            uni_id=uni_id,
+                                                            port_no=ofp_port_no,
+                                                            tconts=tconts))
 
             # Fetch alloc id and gemports from tech profile instance
             alloc_id = tech_profile_instance.us_scheduler.alloc_id
@@ -482,7 +682,7 @@ class OpenOltFlowMgr(object):
                 gem_port_ids.append(
                     tech_profile_instance.upstream_gem_port_attribute_list[i].
                     gemport_id)
-        except BaseException as e:
+        except Exception as e:
             self.log.exception(exception=e)
 
         # Update the allocated alloc_id and gem_port_id for the ONU/UNI to KV store
@@ -500,23 +700,25 @@ class OpenOltFlowMgr(object):
             gem_port_ids, intf_id, onu_id, uni_id
         )
 
-        return alloc_id, gem_port_ids
+        returnValue((alloc_id, gem_port_ids))
 
+    @inlineCallbacks
     def add_upstream_data_flow(self, intf_id, onu_id, uni_id, port_no, uplink_classifier,
                                uplink_action, logical_flow, alloc_id,
                                gemport_id):
 
         uplink_classifier[PACKET_TAG_TYPE] = SINGLE_TAG
 
-        self.add_hsia_flow(intf_id, onu_id, uni_id, port_no, uplink_classifier,
-                           uplink_action, UPSTREAM,
-                           logical_flow, alloc_id, gemport_id)
+        yield self.add_hsia_flow(intf_id, onu_id, uni_id, port_no,
+                                 uplink_classifier, uplink_action, UPSTREAM,
+                                 logical_flow, alloc_id, gemport_id)
 
         # Secondary EAP on the subscriber vlan
         (eap_active, eap_logical_flow) = self.is_eap_enabled(intf_id, onu_id, uni_id)
         if eap_active:
-            self.add_eapol_flow(intf_id, onu_id, uni_id, port_no, eap_logical_flow, alloc_id,
-                                gemport_id, vlan_id=uplink_classifier[VLAN_VID])
+            yield self.add_eapol_flow(intf_id, onu_id, uni_id, port_no,
+                                      eap_logical_flow, alloc_id, gemport_id,
+                                      vlan_id=uplink_classifier[VLAN_VID])
 
     def add_downstream_data_flow(self, intf_id, onu_id, uni_id, port_no, downlink_classifier,
                                  downlink_action, flow, alloc_id, gemport_id):
@@ -525,10 +727,11 @@ class OpenOltFlowMgr(object):
         downlink_action[POP_VLAN] = True
         downlink_action[VLAN_VID] = downlink_classifier[VLAN_VID]
 
-        self.add_hsia_flow(intf_id, onu_id, uni_id, port_no, downlink_classifier,
-                           downlink_action, DOWNSTREAM,
-                           flow, alloc_id, gemport_id)
+        return self.add_hsia_flow(intf_id, onu_id, uni_id, port_no,
+                                  downlink_classifier, downlink_action,
+                                  DOWNSTREAM, flow, alloc_id, gemport_id)
 
+    @inlineCallbacks
     def add_hsia_flow(self, intf_id, onu_id, uni_id, port_no, classifier, action,
                       direction, logical_flow, alloc_id, gemport_id):
 
@@ -541,15 +744,17 @@ class OpenOltFlowMgr(object):
         # re-use the flow_id across both direction. The 'flow_category'
         # takes priority over flow_cookie to find any available HSIA_FLOW
         # id for the ONU.
-        flow_id = self.resource_mgr.get_flow_id(intf_id, onu_id, uni_id,
-                                                flow_store_cookie,
-                                                HSIA_FLOW)
+        flow_id = self.resource_mgr.get_flow_id(
+            intf_id, onu_id, uni_id, flow_store_cookie, HSIA_FLOW,
+            partial(self._get_legacy_flow_store_cookie, classifier,
+                    gemport_id))
         if flow_id is None:
             self.log.error("hsia-flow-unavailable")
             return
+        network_intf_id = yield self.get_nni_intf_id()
         flow = openolt_pb2.Flow(
             access_intf_id=intf_id, onu_id=onu_id, uni_id=uni_id, flow_id=flow_id,
-            flow_type=direction, alloc_id=alloc_id, network_intf_id=self.get_nni_intf_id(),
+            flow_type=direction, alloc_id=alloc_id, network_intf_id=network_intf_id,
             gemport_id=gemport_id,
             classifier=self.mk_classifier(classifier),
             action=self.mk_action(action),
@@ -557,7 +762,8 @@ class OpenOltFlowMgr(object):
             port_no=port_no,
             cookie=logical_flow.cookie)
 
-        if self.add_flow_to_device(flow, logical_flow):
+        added = yield self.add_flow_to_device(flow, logical_flow)
+        if added:
             flow_info = self._get_flow_info_as_json_blob(flow,
                                                          flow_store_cookie,
                                                          HSIA_FLOW)
@@ -565,6 +771,7 @@ class OpenOltFlowMgr(object):
                                               flow.onu_id, flow.uni_id,
                                               flow.flow_id, flow_info)
 
+    @inlineCallbacks
     def add_dhcp_trap(self, intf_id, onu_id, uni_id, port_no, classifier, action, logical_flow,
                       alloc_id, gemport_id):
 
@@ -582,19 +789,23 @@ class OpenOltFlowMgr(object):
                                                         gemport_id)
 
         flow_id = self.resource_mgr.get_flow_id(
-            intf_id, onu_id, uni_id, flow_store_cookie
+            intf_id, onu_id, uni_id, flow_store_cookie,
+            legacy_flow_store_cookie=partial(
+                self._get_legacy_flow_store_cookie, classifier, gemport_id)
         )
+        network_intf_id = yield self.get_nni_intf_id()
         dhcp_flow = openolt_pb2.Flow(
             onu_id=onu_id, uni_id=uni_id, flow_id=flow_id, flow_type=UPSTREAM,
             access_intf_id=intf_id, gemport_id=gemport_id,
-            alloc_id=alloc_id, network_intf_id=self.get_nni_intf_id(),
+            alloc_id=alloc_id, network_intf_id=network_intf_id,
             priority=logical_flow.priority,
             classifier=self.mk_classifier(classifier),
             action=self.mk_action(action),
             port_no=port_no,
             cookie=logical_flow.cookie)
 
-        if self.add_flow_to_device(dhcp_flow, logical_flow):
+        added = yield self.add_flow_to_device(dhcp_flow, logical_flow)
+        if added:
             flow_info = self._get_flow_info_as_json_blob(dhcp_flow, flow_store_cookie)
             self.update_flow_info_to_kv_store(dhcp_flow.access_intf_id,
                                               dhcp_flow.onu_id,
@@ -602,6 +813,7 @@ class OpenOltFlowMgr(object):
                                               dhcp_flow.flow_id,
                                               flow_info)
 
+    @inlineCallbacks
     def add_eapol_flow(self, intf_id, onu_id, uni_id, port_no, logical_flow, alloc_id,
                        gemport_id, vlan_id=DEFAULT_MGMT_VLAN):
 
@@ -617,12 +829,16 @@ class OpenOltFlowMgr(object):
                                                         gemport_id)
         # Add Upstream EAPOL Flow.
         uplink_flow_id = self.resource_mgr.get_flow_id(
-            intf_id, onu_id, uni_id, flow_store_cookie
+            intf_id, onu_id, uni_id, flow_store_cookie,
+            legacy_flow_store_cookie=partial(
+                self._get_legacy_flow_store_cookie, uplink_classifier,
+                gemport_id)
         )
 
+        network_intf_id = yield self.get_nni_intf_id()
         upstream_flow = openolt_pb2.Flow(
             access_intf_id=intf_id, onu_id=onu_id, uni_id=uni_id, flow_id=uplink_flow_id,
-            flow_type=UPSTREAM, alloc_id=alloc_id, network_intf_id=self.get_nni_intf_id(),
+            flow_type=UPSTREAM, alloc_id=alloc_id, network_intf_id=network_intf_id,
             gemport_id=gemport_id,
             classifier=self.mk_classifier(uplink_classifier),
             action=self.mk_action(uplink_action),
@@ -635,7 +851,8 @@ class OpenOltFlowMgr(object):
             vlan_id | 0x1000)]))
         logical_flow.match.type = OFPMT_OXM
 
-        if self.add_flow_to_device(upstream_flow, logical_flow):
+        added = yield self.add_flow_to_device(upstream_flow, logical_flow)
+        if added:
             flow_info = self._get_flow_info_as_json_blob(upstream_flow,
                                                          flow_store_cookie)
             self.update_flow_info_to_kv_store(upstream_flow.access_intf_id,
@@ -670,12 +887,15 @@ class OpenOltFlowMgr(object):
                                                             gemport_id)
 
             downlink_flow_id = self.resource_mgr.get_flow_id(
-                intf_id, onu_id, uni_id, flow_store_cookie
+                intf_id, onu_id, uni_id, flow_store_cookie,
+                legacy_flow_store_cookie=partial(
+                    self._get_legacy_flow_store_cookie, downlink_classifier,
+                    gemport_id)
             )
 
             downstream_flow = openolt_pb2.Flow(
                 access_intf_id=intf_id, onu_id=onu_id, uni_id=uni_id, flow_id=downlink_flow_id,
-                flow_type=DOWNSTREAM, alloc_id=alloc_id, network_intf_id=self.get_nni_intf_id(),
+                flow_type=DOWNSTREAM, alloc_id=alloc_id, network_intf_id=network_intf_id,
                 gemport_id=gemport_id,
                 classifier=self.mk_classifier(downlink_classifier),
                 action=self.mk_action(downlink_action),
@@ -697,7 +917,9 @@ class OpenOltFlowMgr(object):
                 fd.mk_instructions_from_actions([fd.output(
                     self.platform.mk_uni_port_num(intf_id, onu_id, uni_id))]))
 
-            if self.add_flow_to_device(downstream_flow, downstream_logical_flow):
+            added = yield self.add_flow_to_device(downstream_flow,
+                                                  downstream_logical_flow)
+            if added:
                 flow_info = self._get_flow_info_as_json_blob(downstream_flow,
                                                              flow_store_cookie)
                 self.update_flow_info_to_kv_store(downstream_flow.access_intf_id,
@@ -706,25 +928,39 @@ class OpenOltFlowMgr(object):
                                                   downstream_flow.flow_id,
                                                   flow_info)
 
+    @inlineCallbacks
     def repush_all_different_flows(self):
         # Check if the device is supposed to have flows, if so add them
         # Recover static flows after a reboot
-        logical_flows = self.logical_flows_proxy.get('/').items
-        devices_flows = self.flows_proxy.get('/').items
-        logical_flows_ids_provisioned = [f.cookie for f in devices_flows]
-        for logical_flow in logical_flows:
-            try:
-                if logical_flow.id not in logical_flows_ids_provisioned:
-                    self.add_flow(logical_flow)
-            except Exception as e:
-                self.log.exception('Problem reading this flow', e=e)
+        if self.reconcile_flows:
+            # Compare once only, even if adding the flows fails: those that
+            # fail are retried as missing flows. The logical flows are those
+            # indexed from the core updates, the core proxy cannot read the
+            # logical flow table. The decompositions stay valid: they only
+            # depend on the flows, and are evicted when those change.
+            self.reconcile_flows = False
+            self.missing_flows.clear()
+            flows = [logical_flow for logical_flow in self.logical_flows
+                     if not self.device_flows.has_cookie(logical_flow.id)]
+            self.log.info('reconciling-flows',
+                          logical_flows=len(self.logical_flows),
+                          device_flows=len(self.device_flows),
+                          flows_to_add=len(flows))
+        else:
+            # Only retry the flows that could not be added
+            flows = [self.logical_flows.get(flow_id)
+                     for flow_id in self.missing_flows
+                     if flow_id in self.logical_flows]
+        yield self.add_flows(flows)
 
     def reset_flows(self):
-        self.flows_proxy.update('/', Flows())
+        self.device_flows.clear()
+        self.reconcile_flows = True
 
     """ Add a downstream LLDP trap flow on the NNI interface
     """
 
+    @inlineCallbacks
     def add_lldp_flow(self, logical_flow, port_no, network_intf_id=0):
 
         classifier = dict()
@@ -747,8 +983,10 @@ class OpenOltFlowMgr(object):
         onu_id = -1
         uni_id = -1
         flow_store_cookie = self._get_flow_store_cookie(classifier)
-        flow_id = self.resource_mgr.get_flow_id(network_intf_id, onu_id, uni_id,
-                                                flow_store_cookie)
+        flow_id = self.resource_mgr.get_flow_id(
+            network_intf_id, onu_id, uni_id, flow_store_cookie,
+            legacy_flow_store_cookie=partial(
+                self._get_legacy_flow_store_cookie, classifier))
 
         downstream_flow = openolt_pb2.Flow(
             access_intf_id=-1,  # access_intf_id not required
@@ -766,7 +1004,8 @@ class OpenOltFlowMgr(object):
 
         self.log.debug('add lldp downstream trap', classifier=classifier,
                        action=action, flow=downstream_flow, port_no=port_no)
-        if self.add_flow_to_device(downstream_flow, logical_flow):
+        added = yield self.add_flow_to_device(downstream_flow, logical_flow)
+        if added:
             self.update_flow_info_to_kv_store(network_intf_id, onu_id, uni_id,
                                               flow_id, downstream_flow)
 
@@ -821,57 +1060,33 @@ class OpenOltFlowMgr(object):
         return action
 
     def is_eap_enabled(self, intf_id, onu_id, uni_id):
-        flows = self.logical_flows_proxy.get('/').items
-
-        for flow in flows:
-            eap_flow = False
-            eap_intf_id = None
-            eap_onu_id = None
-            eap_uni_id = None
-            for field in fd.get_ofb_fields(flow):
-                if field.type == fd.ETH_TYPE:
-                    if field.eth_type == EAP_ETH_TYPE:
-                        eap_flow = True
-                if field.type == fd.IN_PORT:
-                    eap_intf_id = self.platform.intf_id_from_uni_port_num(
-                        field.port)
-                    eap_onu_id = self.platform.onu_id_from_port_num(field.port)
-                    eap_uni_id = self.platform.uni_id_from_port_num(field.port)
-
-            if eap_flow:
-                self.log.debug('eap flow detected', onu_id=onu_id, uni_id=uni_id,
-                               intf_id=intf_id, eap_intf_id=eap_intf_id,
-                               eap_onu_id=eap_onu_id,
-                               eap_uni_id=eap_uni_id)
-            if eap_flow and intf_id == eap_intf_id and onu_id == eap_onu_id and uni_id == eap_uni_id:
-                return True, flow
+        flow = self.logical_flows.eap_flow(intf_id, onu_id, uni_id)
+        if flow is not None:
+            self.log.debug('eap flow detected', onu_id=onu_id, uni_id=uni_id,
+                           intf_id=intf_id)
+            return True, flow
 
         return False, None
 
     def get_subscriber_vlan(self, port):
         self.log.debug('looking from subscriber flow for port', port=port)
 
-        flows = self.logical_flows_proxy.get('/').items
-        for flow in flows:
-            in_port = fd.get_in_port(flow)
-            out_port = fd.get_out_port(flow)
-            if in_port == port and out_port is not None and \
-                    self.platform.intf_id_to_port_type_name(out_port) \
-                    == Port.ETHERNET_NNI:
-                fields = fd.get_ofb_fields(flow)
-                self.log.debug('subscriber flow found', fields=fields)
-                for field in fields:
-                    if field.type == OFPXMT_OFB_VLAN_VID:
-                        self.log.debug('subscriber vlan found',
-                                       vlan_id=field.vlan_vid)
-                        return field.vlan_vid & 0x0fff
+        for flow in self.logical_flows.flows_to_nni(port):
+            fields = fd.get_ofb_fields(flow)
+            self.log.debug('subscriber flow found', fields=fields)
+            for field in fields:
+                if field.type == OFPXMT_OFB_VLAN_VID:
+                    self.log.debug('subscriber vlan found',
+                                   vlan_id=field.vlan_vid)
+                    return field.vlan_vid & 0x0fff
         self.log.debug('No subscriber flow found', port=port)
         return None
 
+    @inlineCallbacks
     def add_flow_to_device(self, flow, logical_flow):
         self.log.debug('pushing flow to device', flow=flow)
         try:
-            self.stub.FlowAdd(flow)
+            yield self.flow_add(flow)
         except grpc.RpcError as grpc_e:
             if grpc_e.code() == grpc.StatusCode.ALREADY_EXISTS:
                 self.log.warn('flow already exists', e=grpc_e, flow=flow)
@@ -879,10 +1094,11 @@ class OpenOltFlowMgr(object):
                 self.log.error('failed to add flow',
                                logical_flow=logical_flow, flow=flow,
                                grpc_error=grpc_e)
-            return False
+                self.missing_flows.add(logical_flow.id)
+            returnValue(False)
         else:
             self.register_flow(logical_flow, flow)
-            return True
+            returnValue(True)
 
     def update_flow_info_to_kv_store(self, intf_id, onu_id, uni_id, flow_id, flow):
         self.resource_mgr.update_flow_id_info_for_uni(intf_id, onu_id, uni_id,
@@ -898,9 +1114,7 @@ class OpenOltFlowMgr(object):
                        flow_id=device_flow.flow_id,
                        direction=device_flow.flow_type)
         stored_flow.cookie = logical_flow.id
-        flows = self.flows_proxy.get('/')
-        flows.items.extend([stored_flow])
-        self.flows_proxy.update('/', flows)
+        self.device_flows.add(stored_flow)
 
     def find_next_flow(self, flow):
         table_id = fd.get_goto_table_id(flow)
@@ -915,18 +1129,15 @@ class OpenOltFlowMgr(object):
                 metadata = field.table_metadata & 0xFFFFFFFF
         if table_id is None:
             return None
-        flows = self.logical_flows_proxy.get('/').items
-        next_flows = []
-        for f in flows:
-            if f.table_id == table_id:
-                # FIXME
-                if fd.get_in_port(f) == fd.get_in_port(flow) and \
-                        fd.get_out_port(f) == metadata:
-                    next_flows.append(f)
-
-        if len(next_flows) == 0:
+        # FIXME
+        next_flow = self.logical_flows.next_flow(table_id,
+                                                 fd.get_in_port(flow),
+                                                 metadata)
+
+        if next_flow is None:
             self.log.warning('no next flow found, it may be a timing issue',
-                             flow=flow, number_of_flows=len(flows))
+                             flow=flow,
+                             number_of_flows=len(self.logical_flows))
             if flow.id in self.retry_add_flow_list:
                 self.log.debug('flow is already in retry list', flow_id=flow.id)
             else:
@@ -934,9 +1145,7 @@ class OpenOltFlowMgr(object):
                 reactor.callLater(5, self.retry_add_flow, flow)
             return None
 
-        next_flows.sort(key=lambda f: f.priority, reverse=True)
-
-        return next_flows[0]
+        return next_flow
 
     def update_children_flows(self, device_rules_map):
 
@@ -947,6 +1156,7 @@ class OpenOltFlowMgr(object):
                 self.root_proxy.update('/devices/{}/flow_groups'.format(
                     device_id), FlowGroups(items=groups.values()))
 
+    @inlineCallbacks
     def clear_flows_and_scheduler_for_logical_port(self, child_device, logical_port):
         ofp_port_name = logical_port.ofp_port.name
         port_no = logical_port.ofp_port.port_no
@@ -972,7 +1182,7 @@ class OpenOltFlowMgr(object):
                 flow_to_remove = openolt_pb2.Flow(flow_id=flow_id,
                                                   flow_type=direction)
                 try:
-                    self.stub.FlowRemove(flow_to_remove)
+                    yield self.flow_remove(flow_to_remove)
                 except grpc.RpcError as grpc_e:
                     if grpc_e.code() == grpc.StatusCode.NOT_FOUND:
                         self.log.debug('This flow does not exist on the switch, '
@@ -985,11 +1195,11 @@ class OpenOltFlowMgr(object):
 
         try:
             tconts = self.tech_profile[pon_port].get_tconts(tech_profile_instance)
-            self.stub.RemoveTconts(openolt_pb2.Tconts(intf_id=pon_port,
-                                                      onu_id=onu_id,
-                                                      uni_id=uni_id,
-                                                      port_no=port_no,
-                                                      tconts=tconts))
+            yield self.stub.RemoveTconts(openolt_pb2.Tconts(intf_id=pon_port,
+                                                            onu_id=onu_id,
+                                                            uni_id=uni_id,
+                                                            port_no=port_no,
+                                                            tconts=tconts))
         except grpc.RpcError as grpc_e:
             self.log.error('error-removing-tcont-scheduler-queues',
                            err=grpc_e)
@@ -1034,15 +1244,43 @@ class OpenOltFlowMgr(object):
 
         if flow_info is None:
             flow_info = list()
-            flow_info.append(json_blob)
         else:
             assert (isinstance(flow_info, list))
-            flow_info.append(json_blob)
+            # A flow added again, on a reconcile, keeps its flow id through
+            # its cookie: replace its entry so that removing it frees the id
+            flow_info = [info for info in flow_info
+                         if info.get('flow_type') != json_blob['flow_type']]
+        flow_info.append(json_blob)
 
         return flow_info
 
     @staticmethod
     def _get_flow_store_cookie(classifier, gem_port=None):
+        """
+        Returns the values of the classifier fields in
+        FLOW_STORE_COOKIE_FIELDS order, then any other field as name=value
+        sorted by name, then the gemport, comma separated. Absent fields
+        are left empty.
+        """
+        assert isinstance(classifier, dict)
+        get = classifier.get
+        values = [get(field, '') for field in FLOW_STORE_COOKIE_FIELDS]
+        # We need unique flows per gem_port
+        values.append('' if gem_port is None else gem_port)
+        if FLOW_STORE_COOKIE_FIELD_SET.issuperset(classifier):
+            return FLOW_STORE_COOKIE_FORMAT % tuple(values)
+        values[-1:-1] = ['{}={}'.format(field, classifier[field])
+                         for field in sorted(classifier)
+                         if field not in FLOW_STORE_COOKIE_FIELD_SET]
+        return ','.join(map(str, values))
+
+    @staticmethod
+    def _get_legacy_flow_store_cookie(classifier, gem_port=None):
+        """
+        The flow store cookie of the flows stored by previous releases, the
+        md5 of the JSON classifier. Only used to migrate their cookies, see
+        OpenOltResourceMgr.get_flow_id.
+        """
         assert isinstance(classifier, dict)
         # We need unique flows per gem_port
         if gem_port is not None:
@@ -1051,13 +1289,15 @@ class OpenOltFlowMgr(object):
             to_hash = dumps(classifier, sort_keys=True)
         return hashlib.md5(to_hash).hexdigest()[:12]
 
+    @inlineCallbacks
     def get_nni_intf_id(self):
         if self.nni_intf_id is not None:
-            return self.nni_intf_id
+            returnValue(self.nni_intf_id)
 
-        port_list = self.adapter_agent.get_ports(self.device_id, Port.ETHERNET_NNI)
+        port_list = yield self.adapter_agent.get_ports(self.device_id,
+                                                       Port.ETHERNET_NNI)
         logical_port = self.adapter_agent.get_logical_port(self.logical_device_id,
                                                            port_list[0].label)
         self.nni_intf_id = self.platform.intf_id_from_nni_port_num(logical_port.ofp_port.port_no)
         self.log.debug("nni-intf-d ", nni_intf_id=self.nni_intf_id)
-        return self.nni_intf_id
+        returnValue(self.nni_intf_id)
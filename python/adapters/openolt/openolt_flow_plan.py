@@ -0,0 +1,102 @@
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from collections import OrderedDict
+
+from twisted.internet.defer import DeferredList, inlineCallbacks
+
+
+class OpenOltFlowUpdatePlan(object):
+    """
+    A logical flow update of the core, planned per UNI.
+
+    The flows to add and remove are grouped by the UNI they are for, the NNI
+    only flows (e.g. LLDP trap) on their own. The tcont and gemports of a
+    UNI with flows to add are set up once for all of them. The flows of a
+    UNI are then added and removed in order, the UNIs concurrently, so
+    that their device flows go out in batches (see OpenOltFlowBatchSender).
+
+    The flow ids and flow id info of the UNIs are kept in memory during the
+    update and written to the KV store once it is done, see
+    OpenOltResourceMgr.begin_flow_update.
+    """
+
+    def __init__(self, flow_mgr, flows_to_add=(), flows_to_remove=()):
+        self.flow_mgr = flow_mgr
+        # (intf_id, onu_id, uni_id) of the UNI, None for the NNI only flows
+        # -> (flows to add, flows to remove)
+        self.unis = OrderedDict()
+        # (intf_id, onu_id, uni_id) -> (alloc_id, gemport ids)
+        self.tconts = dict()
+        for flow in flows_to_add:
+            self._uni_flows(flow)[0].append(flow)
+        for flow in flows_to_remove:
+            self._uni_flows(flow)[1].append(flow)
+
+    def _uni_flows(self, flow):
+        uni = self.flow_mgr.flow_uni(flow)
+        flows = self.unis.get(uni)
+        if flows is None:
+            flows = self.unis[uni] = ([], [])
+        return flows
+
+    @inlineCallbacks
+    def run(self):
+        resource_mgr = self.flow_mgr.resource_mgr
+        resource_mgr.begin_flow_update()
+        try:
+            yield DeferredList([
+                self.run_uni(uni, flows_to_add, flows_to_remove)
+                for (uni, (flows_to_add, flows_to_remove))
+                in self.unis.iteritems()])
+        finally:
+            resource_mgr.end_flow_update()
+
+    @inlineCallbacks
+    def run_uni(self, uni, flows_to_add, flows_to_remove):
+        flow_mgr = self.flow_mgr
+        if uni is not None:
+            yield self.setup_tcont(flows_to_add)
+
+        for flow in flows_to_add:
+            try:
+                yield flow_mgr.add_and_track_flow(flow, self.tconts)
+            except Exception as e:
+                flow_mgr.log.error('failed to add flow', flow=flow, e=e)
+        for flow in flows_to_remove:
+            try:
+                yield flow_mgr.remove_flow(flow)
+            except Exception as e:
+                flow_mgr.log.error('failed to remove flow', flow=flow, e=e)
+
+    @inlineCallbacks
+    def setup_tcont(self, flows_to_add):
+        # The tcont is set up for the first flow added through it
+        flow_mgr = self.flow_mgr
+        for flow in flows_to_add:
+            decomposition = flow_mgr.get_decomposition(flow)
+            if decomposition is None or decomposition.access is None:
+                continue
+            (_, intf_id, onu_id, uni_id) = decomposition.access
+            if (intf_id, onu_id, uni_id) in self.tconts:
+                continue
+            try:
+                self.tconts[(intf_id, onu_id, uni_id)] = \
+                    yield flow_mgr.create_tcont_gemport(intf_id, onu_id,
+                                                        uni_id, flow.table_id)
+            except Exception as e:
+                flow_mgr.log.error('failed to create tcont', intf_id=intf_id,
+                                   onu_id=onu_id, uni_id=uni_id, e=e)
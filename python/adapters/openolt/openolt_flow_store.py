@@ -0,0 +1,68 @@
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from collections import OrderedDict
+
+
+class OpenOltDeviceFlowStore(object):
+    """
+    In memory index of the flows installed on the OLT, as logical flows
+    whose id is the stored id of their device flow (see
+    OpenOltFlowMgr.generate_stored_id) and whose cookie is the id of the
+    logical flow they implement. A device flow shared by several logical
+    flows is stored once per logical flow.
+
+    Flows are indexed by (id, cookie) and by cookie, so that adding or
+    removing one does not depend on how many there are. The index is not
+    persisted: after an adapter restart it starts empty and the flows are
+    reconciled with the logical flows (see
+    OpenOltFlowMgr.repush_all_different_flows).
+    """
+
+    def __init__(self, log):
+        self.log = log
+        # (stored id, cookie) -> flow
+        self.flows = OrderedDict()
+        # cookie -> stored id -> flow
+        self.cookies = dict()
+
+    def __len__(self):
+        return len(self.flows)
+
+    def __iter__(self):
+        return self.flows.itervalues()
+
+    def add(self, flow):
+        self.flows[(flow.id, flow.cookie)] = flow
+        self.cookies.setdefault(flow.cookie, OrderedDict())[flow.id] = flow
+
+    def remove(self, flow):
+        if self.flows.pop((flow.id, flow.cookie), None) is None:
+            return
+        flows = self.cookies[flow.cookie]
+        del flows[flow.id]
+        if not flows:
+            del self.cookies[flow.cookie]
+
+    def clear(self):
+        self.flows.clear()
+        self.cookies.clear()
+
+    def get_by_cookie(self, cookie):
+        return self.cookies.get(cookie, {}).values()
+
+    def has_cookie(self, cookie):
+        return cookie in self.cookies
@@ -0,0 +1,246 @@
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+
+import grpc
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+
+from voltha_protos import openolt_pb2
+
+DEFAULT_RPC_TIMEOUT = 30  # seconds
+
+# Requests per streaming or batch call
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# Per method deadlines, overriding the default one
+RPC_TIMEOUTS = {
+    'GetDeviceInfo': 10,
+    'HeartbeatCheck': 5,
+    'Reboot': 60,
+}
+
+
+class OpenOltAsyncStub(object):
+    """
+    Non-blocking wrapper around the Openolt gRPC stub, for use from the
+    reactor thread.
+
+    Unary calls are issued with the stub's future() API and return a Deferred
+    that fires in the reactor with the response, or fails with the
+    grpc.RpcError. Every call has a deadline, from the timeout argument, the
+    per method RPC_TIMEOUTS, or the default timeout, in that order.
+    Cancelling the Deferred cancels the RPC.
+
+        response = yield async_stub.FlowAdd(flow)
+    """
+
+    def __init__(self, stub, default_timeout=DEFAULT_RPC_TIMEOUT,
+                 timeouts=None, metrics=None):
+        self.stub = stub
+        self.default_timeout = default_timeout
+        self.timeouts = dict(RPC_TIMEOUTS)
+        if timeouts is not None:
+            self.timeouts.update(timeouts)
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        method = getattr(self.stub, name)
+
+        def call(request, timeout=None):
+            return self.call(name, method, request, timeout)
+
+        return call
+
+    def call(self, name, method, request, timeout=None):
+        if timeout is None:
+            timeout = self.timeouts.get(name, self.default_timeout)
+
+        start = time.time()
+        future = method.future(request, timeout=timeout)
+
+        def cancel(_):
+            future.cancel()
+
+        d = Deferred(canceller=cancel)
+
+        def fire(error, result):
+            # The Deferred may already have been cancelled
+            if d.called:
+                return
+            self._observe(name, start, error)
+            if error is not None:
+                d.errback(error)
+            else:
+                d.callback(result)
+
+        def done(f):
+            # gRPC runs this callback in one of its own threads
+            if f.cancelled():
+                return
+            error = f.exception()
+            reactor.callFromThread(fire, error,
+                                   f.result() if error is None else None)
+
+        future.add_done_callback(done)
+        return d
+
+    def _observe(self, name, start, error):
+        if self.metrics is None:
+            return
+        self.metrics.observe('rpc_{}_latency'.format(name), time.time() - start)
+        if error is not None:
+            self.metrics.incr('rpc_{}_failed'.format(name))
+
+
+class OpenOltBatchSender(object):
+    """
+    Sends the requests of a unary RPC (e.g. OmciMsgOut) through its client
+    streaming variant (OmciMsgOutStream), batching the requests made within
+    window seconds, up to max_batch of them, into one call.
+
+    Falls back to the unary RPC when disabled (window of 0 or streaming RPC
+    not advertised by the agent), and for good if the agent answers the
+    streaming RPC with UNIMPLEMENTED.
+
+        response = yield sender.send(omci_msg)
+    """
+
+    def __init__(self, log, metrics, async_stub, unary, stream, window,
+                 max_batch, enabled=True):
+        self.log = log
+        self.metrics = metrics
+        self.async_stub = async_stub
+        self.unary = unary
+        self.stream = stream
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.enabled = enabled and window > 0
+        # (request, Deferred) of the pending batch
+        self.batch = []
+        self.timer = None
+
+    def send(self, request):
+        if not self.enabled:
+            return getattr(self.async_stub, self.unary)(request)
+
+        d = Deferred()
+        self.batch.append((request, d))
+        if len(self.batch) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = reactor.callLater(self.window, self.flush)
+        return d
+
+    def flush(self):
+        if self.timer is not None:
+            if self.timer.active():
+                self.timer.cancel()
+            self.timer = None
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+
+        self.metrics.observe('rpc_{}_batch'.format(self.stream), len(batch),
+                             BATCH_BUCKETS)
+        d = self._call([request for (request, _) in batch])
+        d.addCallbacks(self._sent, self._failed, callbackArgs=(batch,),
+                       errbackArgs=(batch,))
+
+    def _call(self, requests):
+        return getattr(self.async_stub, self.stream)(iter(requests))
+
+    def _sent(self, response, batch):
+        for (_, d) in batch:
+            d.callback(response)
+
+    def _failed(self, failure, batch):
+        if failure.check(grpc.RpcError) and \
+                failure.value.code() == grpc.StatusCode.UNIMPLEMENTED:
+            if self.enabled:
+                self.log.warn('batch-rpc-unimplemented', rpc=self.stream,
+                              fallback=self.unary)
+                self.enabled = False
+            for (request, d) in batch:
+                getattr(self.async_stub, self.unary)(request).chainDeferred(d)
+            return
+
+        for (_, d) in batch:
+            d.errback(failure)
+
+
+class OpenOltFlowError(grpc.RpcError):
+    """
+    Failure of a single flow of a FlowAddBatch or FlowRemoveBatch call,
+    raised the way the unary call would have failed.
+    """
+
+    def __init__(self, code, details):
+        super(OpenOltFlowError, self).__init__(code, details)
+        self._code = code
+        self._details = details
+
+    def code(self):
+        return self._code
+
+    def details(self):
+        return self._details
+
+    def __str__(self):
+        return '{}: {}'.format(self._code, self._details)
+
+
+class OpenOltFlowBatchSender(OpenOltBatchSender):
+    """
+    OpenOltBatchSender for FlowAdd and FlowRemove, through FlowAddBatch and
+    FlowRemoveBatch. The flows of a batch succeed or fail independently:
+    each Deferred fires with Empty, as the unary call, or fails with an
+    OpenOltFlowError carrying the status code of its flow.
+
+        yield sender.send(flow)
+    """
+
+    def __init__(self, log, metrics, async_stub, unary, window, max_batch,
+                 enabled=True):
+        super(OpenOltFlowBatchSender, self).__init__(
+            log, metrics, async_stub, unary, unary + 'Batch', window,
+            max_batch, enabled=enabled)
+        self.codes = {code.value[0]: code for code in grpc.StatusCode}
+
+    def _call(self, requests):
+        return getattr(self.async_stub, self.stream)(
+            openolt_pb2.FlowBatch(flows=requests))
+
+    def _sent(self, response, batch):
+        if len(response.results) != len(batch):
+            error = OpenOltFlowError(
+                grpc.StatusCode.INTERNAL,
+                '{} returned {} results for {} flows'.format(
+                    self.stream, len(response.results), len(batch)))
+            for (_, d) in batch:
+                d.errback(error)
+            return
+
+        for ((_, d), result) in zip(batch, response.results):
+            if result.code == grpc.StatusCode.OK.value[0]:
+                d.callback(openolt_pb2.Empty())
+            else:
+                self.metrics.incr('rpc_{}_failed'.format(self.unary))
+                d.errback(OpenOltFlowError(
+                    self.codes.get(result.code, grpc.StatusCode.UNKNOWN),
+                    result.details))
+
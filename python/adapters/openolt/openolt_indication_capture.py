@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Indication stream capture.
+
+A capture file starts with CAPTURE_MAGIC and holds one record per
+indication, in arrival order:
+
+    +-------------------+------------------+------------------------+
+    | arrival (float64) | length (uint32)  | serialized Indication  |
+    +-------------------+------------------+------------------------+
+
+All fields are big endian, arrival is the time.time() at which the adapter
+read the indication from the gRPC stream.
+
+Usage to summarize a capture file:
+
+    openolt_indication_capture.py <capture file>
+
+openolt_indication_replay.py feeds a capture file into a device handler.
+"""
+
+import argparse
+import os
+import struct
+from collections import Counter
+
+from voltha_protos import openolt_pb2
+
+CAPTURE_MAGIC = 'OLTIND\x00\x01'
+RECORD_HEADER = struct.Struct('>dI')
+
+
+class OpenOltIndicationRecorder(object):
+    """
+    Appends indications to a capture file. Called from the indications
+    thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.capture = open(path, 'ab')
+        if new_file:
+            self.capture.write(CAPTURE_MAGIC)
+
+    def record(self, arrival, ind):
+        data = ind.SerializeToString()
+        self.capture.write(RECORD_HEADER.pack(arrival, len(data)))
+        self.capture.write(data)
+
+    def close(self):
+        self.capture.close()
+
+
+def read_indications(path):
+    """
+    Yields the (arrival, Indication) records of a capture file.
+    """
+    with open(path, 'rb') as capture:
+        if capture.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError('not-an-indication-capture: {}'.format(path))
+        while True:
+            header = capture.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            arrival, length = RECORD_HEADER.unpack(header)
+            ind = openolt_pb2.Indication()
+            ind.ParseFromString(capture.read(length))
+            yield arrival, ind
+
+
+def summarize(path):
+    types = Counter()
+    first = last = None
+    for (arrival, ind) in read_indications(path):
+        types[ind.WhichOneof('data')] += 1
+        if first is None:
+            first = arrival
+        last = arrival
+    duration = last - first if first is not None else 0
+    total = sum(types.values())
+    print('indications: {}'.format(total))
+    print('duration:    {:.3f}s'.format(duration))
+    if duration > 0:
+        print('rate:        {:.1f}/s'.format(total / duration))
+    for (ind_type, count) in types.most_common():
+        print('  {:<16} {}'.format(ind_type, count))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Summarize an OpenOLT indication capture file')
+    parser.add_argument('capture', help='capture file')
+    summarize(parser.parse_args().capture)
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Replay of an indication capture into a device handler.
+
+The handler is an OpenoltDevice brought up without an OLT: the core and
+adapter proxies are NullCoreProxy and NullAdapterProxy, the gRPC stub
+answers every call with Empty and the resource manager keeps its KV store in
+memory. The captured indications go through the same indication queue the
+gRPC indications thread feeds, so the replay measures the adapter alone.
+
+Usage:
+
+    openolt_indication_replay.py --speed 0 --pon_ports 16 <capture file>
+
+A speed of 1 replays at the captured pace, 2 twice as fast, and 0 as fast as
+the handler takes the indications.
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from argparse import Namespace
+from collections import Counter
+
+import structlog
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, inlineCallbacks, returnValue, \
+    succeed
+from zope.interface import implementer
+
+from pyvoltha.common.utils.registry import registry, IComponent
+from voltha_protos import openolt_pb2
+from voltha_protos.device_pb2 import Device
+
+from main import defs
+from openolt import OpenOltDefaults
+from openolt_device import OpenoltDevice
+from openolt_flow_bench import BenchStub, CountingKvStore, LOG_LEVELS, \
+    level_filter, mk_resource_mgr
+from openolt_indication_capture import read_indications
+
+DEVICE_ID = 'replay-olt'
+
+
+class NullProxy(object):
+    """
+    Stands in for the core and adapter proxies while replaying: every call
+    succeeds immediately with None, and is counted.
+    """
+
+    def __init__(self):
+        self.calls = Counter()
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls[name] += 1
+            return succeed(None)
+
+        return call
+
+
+class NullCoreProxy(NullProxy):
+    pass
+
+
+class NullAdapterProxy(NullProxy):
+    pass
+
+
+@implementer(IComponent)
+class OpenOltReplayMain(object):
+    """
+    Registered as 'main' for the device handler to find its arguments.
+    """
+
+    def __init__(self, args):
+        self.args = args
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def get_args(self):
+        return self.args
+
+
+class OpenOltReplayDevice(OpenoltDevice):
+    """
+    Device handler connected to a stub instead of an OLT. It has no
+    indications thread, the replayer feeds its indication queue.
+    """
+
+    def __init__(self, device_info, stub, **kwargs):
+        self.replay_device_info = device_info
+        self.replay_stub = stub
+        self.bringup = None
+        super(OpenOltReplayDevice, self).__init__(**kwargs)
+
+    def do_state_init(self, event):
+        self.log.info('openolt-replay-device-created',
+                      device_id=self.device_id)
+
+    def post_init(self, event):
+        pass
+
+    def do_state_connected(self, event):
+        self.async_stub = self.replay_stub
+        self.device_info = self.replay_device_info
+        self.bringup = self.setup_connected_device()
+        self.bringup.addBoth(self._bringup_done)
+
+    def _bringup_done(self, result):
+        self.connect_done.set()
+        return result
+
+
+class OpenOltIndicationReplayer(object):
+    """
+    Feeds a capture file into a device handler, through the same indication
+    queue the gRPC indications thread uses, at the captured pace divided by
+    speed. A speed of 0 replays as fast as the handler takes them.
+
+    The device handler is expected to be connected (managers set up), with
+    its core_proxy and adapter_proxy replaced by NullCoreProxy and
+    NullAdapterProxy when measuring adapter throughput alone.
+    """
+
+    def __init__(self, device, path, speed=1.0):
+        self.device = device
+        self.path = path
+        self.speed = speed
+        self.count = 0
+        self.started = None
+        self.finished = None
+
+    def start(self):
+        """
+        Returns a Deferred firing with the replay summary once every
+        indication has been handed to the device and handled.
+        """
+        d = Deferred()
+        queue = self.device.new_indication_queue()
+        thread = threading.Thread(target=self.replay, args=(queue, d),
+                                  name='indication-replayer')
+        thread.setDaemon(True)
+        thread.start()
+        return d
+
+    def replay(self, queue, d):
+        first = None
+        self.started = time.time()
+        for (arrival, ind) in read_indications(self.path):
+            if first is None:
+                first = arrival
+            if self.speed > 0:
+                delay = self.started + (arrival - first) / self.speed - \
+                        time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            queue.put(ind)
+            self.count += 1
+
+        # Wait for the queue to be drained by the reactor
+        while queue.depth() > 0 or queue.drain_scheduled:
+            time.sleep(0.01)
+        self.finished = time.time()
+        queue.close()
+        reactor.callFromThread(d.callback, self.summary())
+
+    def summary(self):
+        duration = (self.finished or time.time()) - self.started
+        return {
+            'indications': self.count,
+            'duration': duration,
+            'rate': self.count / duration if duration > 0 else None,
+            'metrics': self.device.metrics.snapshot()
+        }
+
+
+def mk_resource_mgr_factory(gemports):
+    def resource_mgr(device_id, host_and_port, extra_args, device_info):
+        return mk_resource_mgr(device_info, CountingKvStore(), gemports)
+
+    return resource_mgr
+
+
+@inlineCallbacks
+def replay(args):
+    registry.register('main', OpenOltReplayMain(Namespace(**dict(
+        defs, indication_capture_dir='', metrics_interval=0))))
+
+    device_info = openolt_pb2.DeviceInfo(
+        vendor='REPLAY', model='replay', hardware_version='1.0',
+        firmware_version='1.0', device_id=DEVICE_ID,
+        device_serial_number='REPLAY00', technology='xgspon',
+        pon_ports=args.pon_ports, onu_id_start=1, onu_id_end=255,
+        alloc_id_start=1024, alloc_id_end=16383,
+        gemport_id_start=1024, gemport_id_end=65535,
+        flow_id_start=1, flow_id_end=16383)
+    support_classes = dict(OpenOltDefaults['support_classes'],
+                           resource_mgr=mk_resource_mgr_factory(1))
+    core_proxy = NullCoreProxy()
+    adapter_proxy = NullAdapterProxy()
+    stub = BenchStub(args.rpc_latency)
+    device = OpenOltReplayDevice(
+        device_info, stub, support_classes=support_classes,
+        core_proxy=core_proxy, adapter_proxy=adapter_proxy,
+        device=Device(id=DEVICE_ID, type='openolt', host_and_port='replay'),
+        device_num=1)
+
+    device.go_state_connected()
+    yield device.bringup
+
+    summary = yield OpenOltIndicationReplayer(device, args.capture,
+                                              args.speed).start()
+    summary['core_calls'] = dict(core_proxy.calls)
+    summary['adapter_calls'] = dict(adapter_proxy.calls)
+    summary['rpc_calls'] = dict(stub.calls)
+    returnValue(summary)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Replay an OpenOLT indication capture into a device '
+                    'handler')
+    parser.add_argument('capture', help='capture file')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='replay speed relative to the capture, 0 for '
+                             'as fast as possible (default: %(default)s)')
+    parser.add_argument('--pon_ports', type=int, default=16,
+                        help='number of PON ports of the replayed OLT '
+                             '(default: %(default)s)')
+    parser.add_argument('--rpc_latency', type=float, default=0,
+                        help='simulated gRPC latency in seconds (default: '
+                             '%(default)s)')
+    parser.add_argument('--log_level', default='error',
+                        choices=sorted(LOG_LEVELS.keys()),
+                        help='adapter log level (default: %(default)s)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    structlog.configure(
+        processors=[level_filter(args.log_level),
+                    structlog.processors.KeyValueRenderer()],
+        logger_factory=structlog.PrintLoggerFactory(sys.stderr))
+
+    def done(summary):
+        print(json.dumps(summary, indent=2, sort_keys=True))
+
+    def failed(failure):
+        failure.printTraceback()
+
+    def start():
+        d = replay(args)
+        d.addCallbacks(done, failed)
+        d.addBoth(lambda _: reactor.stop())
+
+    reactor.callWhenRunning(start)
+    reactor.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,384 @@
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+
+# Lane drop policies, applied when a lane is full
+BLOCK = 'block'              # block the indications thread (never drop)
+DROP_OLDEST = 'drop_oldest'  # drop the oldest queued indication
+DROP_NEWEST = 'drop_newest'  # drop the incoming indication
+COALESCE = 'coalesce'        # replace a queued indication for the same key,
+                             # drop the incoming one otherwise
+DROP_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST, COALESCE)
+
+# Lanes, in priority order
+HIGH_LANE = 'high'
+ALARM_LANE = 'alarm'
+STATS_LANE = 'stats'
+
+DEFAULT_INDICATION_LANES = 'high:10000:block,alarm:2000:drop_oldest,' \
+                           'stats:1000:coalesce'
+DEFAULT_INDICATION_BATCH_SIZE = 100
+
+# Indication type (Indication.data oneof name) to lane. OMCI and packet-in
+# share the high lane with the OLT, interface and ONU state indications so
+# that their relative order is preserved.
+INDICATION_LANES = {
+    'olt_ind': HIGH_LANE,
+    'intf_ind': HIGH_LANE,
+    'intf_oper_ind': HIGH_LANE,
+    'onu_disc_ind': HIGH_LANE,
+    'onu_ind': HIGH_LANE,
+    'omci_ind': HIGH_LANE,
+    'pkt_ind': HIGH_LANE,
+    'alarm_ind': ALARM_LANE,
+    'port_stats': STATS_LANE,
+    'flow_stats': STATS_LANE,
+}
+
+
+def coalesce_key(ind_type, ind):
+    """
+    Indications with the same key supersede each other while queued.
+    """
+    if ind_type == 'port_stats':
+        return ind_type, ind.port_stats.intf_id
+    elif ind_type == 'flow_stats':
+        return ind_type, ind.flow_stats.flow_id
+    return None
+
+
+def parse_lanes(spec):
+    """
+    Parse a lane specification of the form
+    '<name>:<capacity>:<policy>[,<name>:<capacity>:<policy>...]',
+    listed from highest to lowest priority.
+    """
+    lanes = []
+    for lane_spec in spec.split(','):
+        name, capacity, policy = lane_spec.strip().split(':')
+        if policy not in DROP_POLICIES:
+            raise ValueError('invalid-lane-drop-policy: {}'.format(policy))
+        lanes.append((name, int(capacity), policy))
+    return lanes
+
+
+class OpenOltIndicationLane(object):
+
+    def __init__(self, name, capacity, policy):
+        self.name = name
+        self.capacity = capacity
+        self.policy = policy
+        # Coalescing lanes need keyed access to queued entries
+        self.entries = OrderedDict() if policy == COALESCE else deque()
+        self.seq = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def is_full(self):
+        return len(self.entries) >= self.capacity
+
+    def append(self, entry, key=None):
+        if self.policy == COALESCE:
+            if key is None:
+                key = self.seq
+                self.seq += 1
+            self.entries[key] = entry
+        else:
+            self.entries.append(entry)
+
+    def replace(self, key, entry):
+        """
+        Replace a queued entry in place (coalescing lanes only). Returns
+        False if there is nothing queued under this key.
+        """
+        if self.policy != COALESCE or key is None or key not in self.entries:
+            return False
+        self.entries[key] = entry
+        return True
+
+    def popleft(self):
+        if self.policy == COALESCE:
+            return self.entries.popitem(last=False)[1]
+        return self.entries.popleft()
+
+    def clear(self):
+        self.entries.clear()
+
+
+class OpenOltIndicationQueue(object):
+    """
+    Bounded, prioritized handoff between the gRPC indications thread and the
+    reactor.
+
+    Indications are sorted into lanes, each with its own capacity and drop
+    policy. The indications thread only wakes the reactor up when the queue
+    goes from idle to busy. The reactor then drains up to batch_size
+    indications per tick, highest priority lane first, yielding back to the
+    event loop between batches so other OLTs and Kafka keep being served.
+    A full 'block' lane blocks the indications thread, which pushes back on
+    the gRPC stream instead of growing memory without bound.
+    """
+
+    def __init__(self, log, metrics, handler,
+                 lanes=DEFAULT_INDICATION_LANES,
+                 batch_size=DEFAULT_INDICATION_BATCH_SIZE):
+        self.log = log
+        self.metrics = metrics
+        self.handler = handler
+        self.batch_size = batch_size
+        self.lanes = [OpenOltIndicationLane(name, capacity, policy)
+                      for (name, capacity, policy) in parse_lanes(lanes)]
+        self.lanes_by_name = {lane.name: lane for lane in self.lanes}
+        self.cond = threading.Condition(threading.Lock())
+        self.drain_scheduled = False
+        self.closed = False
+
+    def lane_for(self, ind_type):
+        lane = self.lanes_by_name.get(INDICATION_LANES.get(ind_type))
+        # Unknown types and unconfigured lanes go to the highest priority
+        # lane, nothing gets lost by misconfiguration.
+        return lane if lane is not None else self.lanes[0]
+
+    def depth(self):
+        return sum(len(lane) for lane in self.lanes)
+
+    def put(self, ind):
+        """
+        Called from the indications thread. Blocks while a 'block' lane is
+        full.
+        """
+        ind_type = ind.WhichOneof('data')
+        lane = self.lane_for(ind_type)
+        entry = (time.time(), ind_type, ind)
+
+        with self.cond:
+            key = coalesce_key(ind_type, ind) \
+                if lane.policy == COALESCE else None
+
+            if lane.replace(key, entry):
+                self.metrics.incr('indication_lane_{}_coalesced'.format(
+                    lane.name))
+                return
+
+            if lane.is_full():
+                if lane.policy == BLOCK:
+                    self.metrics.incr('indication_lane_{}_full'.format(
+                        lane.name))
+                    while lane.is_full() and not self.closed:
+                        self.cond.wait()
+                elif lane.policy == DROP_OLDEST:
+                    lane.popleft()
+                    self.metrics.incr('indication_lane_{}_dropped'.format(
+                        lane.name))
+                else:
+                    self.metrics.incr('indication_lane_{}_dropped'.format(
+                        lane.name))
+                    return
+
+            if self.closed:
+                return
+
+            lane.append(entry, key)
+            self.metrics.incr('indication_lane_{}_enqueued'.format(lane.name))
+            self.metrics.set_gauge('indication_lane_{}_depth'.format(
+                lane.name), len(lane))
+            wakeup = not self.drain_scheduled
+            self.drain_scheduled = True
+
+        if wakeup:
+            self.metrics.incr('indication_reactor_wakeups')
+            reactor.callFromThread(self.drain)
+
+    def drain(self):
+        """
+        Runs in the reactor. Dispatches at most batch_size indications, in
+        lane priority order, and reschedules itself if more are pending.
+        """
+        start = time.time()
+        batch = []
+        with self.cond:
+            for lane in self.lanes:
+                while len(lane) > 0 and len(batch) < self.batch_size:
+                    batch.append((lane.name, lane.popleft()))
+                self.metrics.set_gauge('indication_lane_{}_depth'.format(
+                    lane.name), len(lane))
+            self.cond.notify_all()
+
+        for (lane_name, (arrival, ind_type, ind)) in batch:
+            self.metrics.incr('indication_lane_{}_dispatched'.format(
+                lane_name))
+            self.metrics.observe('indication_lane_{}_wait'.format(lane_name),
+                                 start - arrival)
+            try:
+                self.handler(ind_type, ind, arrival)
+            except Exception as e:
+                self.log.exception('indication-handler-failed', e=e)
+
+        self.metrics.incr('indication_drain_batches')
+        self.metrics.observe('indication_drain_duration', time.time() - start)
+
+        with self.cond:
+            if self.depth() > 0 and not self.closed:
+                reactor.callLater(0, self.drain)
+            else:
+                self.drain_scheduled = False
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            for lane in self.lanes:
+                lane.clear()
+                self.metrics.set_gauge('indication_lane_{}_depth'.format(
+                    lane.name), 0)
+            self.cond.notify_all()
+
+
+class OpenOltIndicationRouter(object):
+    """
+    Dispatches indications to the handler registered for their type, keyed
+    by the Indication.data oneof name. Handlers are called with the oneof
+    payload (e.g. the OmciIndication of an omci_ind).
+
+    Each type gets a handled/failed counter pair and a latency histogram
+    measured from the indication arrival on the gRPC stream to the handler
+    completion, including any Deferred the handler returns.
+    """
+
+    def __init__(self, log, metrics):
+        self.log = log
+        self.metrics = metrics
+        self.handlers = dict()
+
+    def register(self, ind_type, handler):
+        self.handlers[ind_type] = handler
+
+    def unregister(self, ind_type):
+        self.handlers.pop(ind_type, None)
+
+    def dispatch(self, ind_type, ind, arrival):
+        handler = self.handlers.get(ind_type)
+        if handler is None:
+            self.metrics.incr('indication_unknown')
+            self.log.warn('unknown indication type', ind_type=ind_type)
+            return
+
+        try:
+            result = handler(getattr(ind, ind_type))
+        except Exception:
+            self._done(ind_type, arrival, 'failed')
+            raise
+
+        if isinstance(result, Deferred):
+            result.addCallbacks(
+                lambda r: self._done(ind_type, arrival, 'handled', r),
+                lambda f: self._failed(ind_type, arrival, f))
+        else:
+            self._done(ind_type, arrival, 'handled')
+
+    def _done(self, ind_type, arrival, outcome, result=None):
+        self.metrics.incr('indication_{}_{}'.format(ind_type, outcome))
+        self.metrics.observe('indication_{}_latency'.format(ind_type),
+                             time.time() - arrival)
+        return result
+
+    def _failed(self, ind_type, arrival, failure):
+        self._done(ind_type, arrival, 'failed')
+        self.log.error('indication-handler-failed', ind_type=ind_type,
+                       failure=failure.getErrorMessage())
+
+
+class OpenOltDiscoveryFilter(object):
+    """
+    Coalesces the ONU discovery indications an OLT repeats for an ONU until
+    it is activated. The first indication for a serial number is let
+    through, the following ones are suppressed for ttl seconds, after which
+    the ONU is handled again.
+
+    Entries are kept in first seen order, so expiry and the eviction of the
+    oldest entries beyond max_size are constant time.
+    """
+
+    def __init__(self, log, metrics, ttl, max_size):
+        self.log = log
+        self.metrics = metrics
+        self.ttl = ttl
+        self.max_size = max_size
+        # serial number -> [first seen, suppressed count]
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, serial_number):
+        return serial_number in self.entries
+
+    def seen(self, serial_number, now=None):
+        """
+        Returns True if a discovery indication for serial_number was let
+        through less than ttl seconds ago, in which case this one is
+        suppressed. Records it and returns False otherwise.
+        """
+        if now is None:
+            now = time.time()
+        self.expire(now)
+
+        entry = self.entries.get(serial_number)
+        if entry is not None:
+            entry[1] += 1
+            self.metrics.incr('onu_discovery_suppressed')
+            return True
+
+        self.entries[serial_number] = [now, 0]
+        while len(self.entries) > self.max_size:
+            self._pop_oldest()
+            self.metrics.incr('onu_discovery_evicted')
+        self.metrics.set_gauge('onu_discovery_filter_size', len(self.entries))
+        return False
+
+    def expire(self, now=None):
+        if now is None:
+            now = time.time()
+        while self.entries:
+            first_seen = next(self.entries.itervalues())[0]
+            if now - first_seen < self.ttl:
+                break
+            self._pop_oldest()
+        self.metrics.set_gauge('onu_discovery_filter_size', len(self.entries))
+
+    def discard(self, serial_number):
+        """
+        Lets the next discovery indication for serial_number through.
+        """
+        self.entries.pop(serial_number, None)
+
+    def clear(self):
+        self.entries.clear()
+        self.metrics.set_gauge('onu_discovery_filter_size', 0)
+
+    def _pop_oldest(self):
+        serial_number, (first_seen, suppressed) = \
+            self.entries.popitem(last=False)
+        if suppressed:
+            self.log.debug('onu-discovery-coalesced',
+                           serial_number=serial_number,
+                           suppressed=suppressed)
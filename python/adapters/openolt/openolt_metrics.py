@@ -0,0 +1,128 @@
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import bisect
+import threading
+
+from twisted.internet.task import LoopingCall
+
+# Latency buckets in seconds, from 100us to 10s
+DEFAULT_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                           0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                           10.0)
+
+
+class OpenOltHistogram(object):
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # One extra slot for values above the last bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, pct):
+        """
+        Approximate percentile, reported as the upper bound of the bucket
+        holding the requested rank.
+        """
+        if self.count == 0:
+            return None
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for idx, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count > 0:
+                if idx < len(self.buckets):
+                    return self.buckets[idx]
+                return self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'avg': self.total / self.count if self.count else None,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max
+        }
+
+
+class OpenOltMetrics(object):
+    """
+    Counters, gauges and latency histograms for a single OLT device handler.
+    Updates may come from both the reactor and the indications thread.
+    """
+
+    def __init__(self, log):
+        self.log = log
+        self.lock = threading.Lock()
+        self.counters = dict()
+        self.gauges = dict()
+        self.histograms = dict()
+        self.reporter = None
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def observe(self, name, value, buckets=DEFAULT_LATENCY_BUCKETS):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = OpenOltHistogram(buckets)
+            histogram.observe(value)
+
+    def get_counter(self, name):
+        return self.counters.get(name, 0)
+
+    def get_histogram(self, name):
+        return self.histograms.get(name)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'histograms': {name: h.to_dict() for (name, h)
+                               in self.histograms.iteritems()}
+            }
+
+    def start_reporting(self, interval):
+        if interval <= 0 or self.reporter is not None:
+            return
+        self.reporter = LoopingCall(self.report)
+        self.reporter.start(interval, now=False)
+
+    def stop_reporting(self):
+        if self.reporter is not None and self.reporter.running:
+            self.reporter.stop()
+        self.reporter = None
+
+    def report(self):
+        self.log.info('openolt-metrics', **self.snapshot())
@@ -0,0 +1,592 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Mock OpenOLT agent, standing in for a real OLT when load testing the
+adapter.
+
+It implements the Openolt gRPC service over a simulated OLT with a
+configurable number of PONs, ONUs per PON and UNIs per ONU:
+
+ - EnableIndication streams the OLT and interface indications, then an
+   ONU discovery per ONU, paced at disc_rate. Activated ONUs are reported
+   up, deactivated and deleted ONUs down.
+ - OMCI messages are echoed back as responses (AK set, AR cleared).
+ - Packet-in (EAPOL) indications are emitted from random active UNIs at
+   pkt_in_rate, port statistics every stats_interval.
+ - Every unary call can be given a latency and an error rate, at start or
+   at runtime with set_latency() and set_error_rate().
+ - The streaming OMCI and packet-out RPCs are advertised and served unless
+   streaming is off, in which case they answer UNIMPLEMENTED. Each
+   streamed request is accounted for as a call of its unary RPC.
+ - Likewise for FlowAddBatch and FlowRemoveBatch, unless flow_batch is off.
+   Each flow of a batch is accounted for, and can fail, as a call of its
+   unary RPC, but the latency is that of the batch RPC: the unary latency
+   stands for the round trip to the OLT.
+
+Standalone usage (the adapter then adopts <host>:<port>):
+
+    openolt_mock_agent.py --port 9191 --pon_ports 16 --onus_per_pon 31 \\
+        --latency FlowAdd=0.002 --error_rate FlowAdd=0.001
+
+In-process usage:
+
+    agent = OpenOltMockAgent(pon_ports=2, onus_per_pon=4)
+    port = agent.start()
+    ...
+    agent.stop()
+"""
+
+import argparse
+import binascii
+import random
+import string
+import threading
+import time
+from collections import Counter
+from concurrent import futures
+from Queue import Queue, Empty
+
+import grpc
+import structlog
+
+from voltha_protos import openolt_pb2, openolt_pb2_grpc
+
+from openolt_platform import OpenOltPlatform
+
+log = structlog.get_logger()
+
+# OMCI baseline message type field
+OMCI_MSG_TYPE_OFFSET = 2
+OMCI_AR = 0x40
+OMCI_AK = 0x20
+
+EAPOL_ETHERTYPE = '\x88\x8e'
+EAPOL_GROUP_MAC = '\x01\x80\xc2\x00\x00\x03'
+
+# Highest ONU id the adapter can encode in its port numbers and flow ids
+MAX_ONU_ID = OpenOltPlatform.MAX_ONUS_PER_PON - 1
+
+STREAMING_RPCS = ['OmciMsgOutStream', 'OnuPacketOutStream',
+                  'UplinkPacketOutStream']
+FLOW_BATCH_RPCS = ['FlowAddBatch', 'FlowRemoveBatch']
+
+# Sentinel closing an indication stream
+STREAM_END = object()
+
+
+def parse_method_values(values):
+    """
+    Parse a list of '<method>=<value>' strings into a dict.
+    """
+    result = dict()
+    for value in values or []:
+        method, number = value.split('=')
+        result[method] = float(number)
+    return result
+
+
+class OpenOltMockOnu(object):
+
+    def __init__(self, intf_id, onu_id, serial_number, unis):
+        self.intf_id = intf_id
+        self.onu_id = onu_id
+        self.serial_number = serial_number
+        self.unis = unis
+        self.active = False
+
+    def mac(self, uni_id):
+        return '\x02\x00' + chr(self.intf_id) + chr(self.onu_id >> 8) + \
+            chr(self.onu_id & 0xff) + chr(uni_id)
+
+    def port_no(self, uni_id):
+        # Logical UNI port number, as encoded by OpenOltPlatform
+        return self.intf_id << 11 | self.onu_id << 4 | uni_id
+
+
+class OpenOltMockAgent(openolt_pb2_grpc.OpenoltServicer):
+
+    def __init__(self, pon_ports=16, onus_per_pon=31, unis_per_onu=1,
+                 nni_ports=1, onu_id_start=1, disc_rate=100.0,
+                 pkt_in_rate=0.0, stats_interval=0.0, latency=None,
+                 error_rate=None, seed=None, streaming=True,
+                 flow_batch=True):
+        if onu_id_start + onus_per_pon - 1 > MAX_ONU_ID:
+            raise ValueError('too-many-onus-per-pon: {} from onu id {}, the '
+                             'highest onu id is {}'.format(
+                                 onus_per_pon, onu_id_start, MAX_ONU_ID))
+        self.pon_ports = pon_ports
+        self.streaming = streaming
+        self.flow_batch = flow_batch
+        self.nni_ports = nni_ports
+        self.disc_rate = disc_rate
+        self.pkt_in_rate = pkt_in_rate
+        self.stats_interval = stats_interval
+        self.latency = dict(latency or {})
+        self.error_rate = dict(error_rate or {})
+        self.random = random.Random(seed)
+
+        self.onus = dict()  # (intf_id, onu_id) -> OpenOltMockOnu
+        self.onus_by_serial = dict()
+        for intf_id in xrange(pon_ports):
+            for idx in xrange(onus_per_pon):
+                onu_id = onu_id_start + idx
+                serial_number = openolt_pb2.SerialNumber(
+                    vendor_id='MOCK',
+                    vendor_specific=binascii.unhexlify(
+                        '{:04x}{:04x}'.format(intf_id, onu_id)))
+                onu = OpenOltMockOnu(intf_id, onu_id, serial_number,
+                                     unis_per_onu)
+                self.onus[(intf_id, onu_id)] = onu
+                self.onus_by_serial[serial_number.vendor_specific] = onu
+
+        self.lock = threading.Lock()
+        self.flows = dict()  # (flow_id, flow_type) -> Flow
+        self.tconts = dict()  # (intf_id, onu_id, uni_id) -> Tconts
+        self.calls = Counter()
+        self.enabled = True
+        self.streams = []
+        self.server = None
+        self.generators = []
+        self.running = False
+
+    # Fault injection
+
+    def set_latency(self, method, seconds):
+        self.latency[method] = seconds
+
+    def set_error_rate(self, method, rate):
+        self.error_rate[method] = rate
+
+    def _rpc(self, method, context):
+        """
+        Accounts for and applies the injected latency and errors of a call.
+        """
+        if self._fails(method):
+            context.abort(grpc.StatusCode.INTERNAL,
+                          'injected {} failure'.format(method))
+
+    def _fails(self, method, latency=True):
+        """
+        Accounts for a call, applies its injected latency unless latency is
+        False, and returns whether an error is injected.
+        """
+        with self.lock:
+            self.calls[method] += 1
+        if latency and self.latency.get(method):
+            time.sleep(self.latency[method])
+        if self.random.random() < self.error_rate.get(method, 0):
+            with self.lock:
+                self.calls[method + '_failed'] += 1
+            return True
+        return False
+
+    # Server lifecycle
+
+    def start(self, port=0, address='[::]', workers=32):
+        """
+        Starts serving, returns the bound port (a free one if port is 0).
+        """
+        self.server = grpc.server(futures.ThreadPoolExecutor(
+            max_workers=workers))
+        openolt_pb2_grpc.add_OpenoltServicer_to_server(self, self.server)
+        port = self.server.add_insecure_port('{}:{}'.format(address, port))
+        self.server.start()
+        self.running = True
+        for target in (self.generate_packet_ins, self.generate_stats):
+            thread = threading.Thread(target=target, name=target.__name__)
+            thread.setDaemon(True)
+            thread.start()
+            self.generators.append(thread)
+        log.info('mock-agent-started', port=port, pon_ports=self.pon_ports,
+                 onus=len(self.onus))
+        return port
+
+    def stop(self, grace=None):
+        self.running = False
+        self.indicate(STREAM_END)
+        if self.server is not None:
+            self.server.stop(grace)
+        log.info('mock-agent-stopped', calls=dict(self.calls))
+
+    # Indication streams
+
+    def indicate(self, ind):
+        with self.lock:
+            streams = list(self.streams)
+        for stream in streams:
+            stream.put(ind)
+
+    def EnableIndication(self, request, context):
+        self._rpc('EnableIndication', context)
+        stream = Queue()
+        with self.lock:
+            self.streams.append(stream)
+
+        feeder = threading.Thread(target=self.bring_up, args=(stream,),
+                                  name='bring-up')
+        feeder.setDaemon(True)
+        feeder.start()
+
+        try:
+            while context.is_active():
+                try:
+                    ind = stream.get(timeout=1)
+                except Empty:
+                    continue
+                if ind is STREAM_END:
+                    break
+                yield ind
+        finally:
+            with self.lock:
+                self.streams.remove(stream)
+
+    def bring_up(self, stream):
+        stream.put(openolt_pb2.Indication(
+            olt_ind=openolt_pb2.OltIndication(oper_state='up')))
+        for intf_id in xrange(self.nni_ports):
+            stream.put(openolt_pb2.Indication(
+                intf_oper_ind=openolt_pb2.IntfOperIndication(
+                    type='nni', intf_id=intf_id, oper_state='up')))
+        for intf_id in xrange(self.pon_ports):
+            stream.put(openolt_pb2.Indication(
+                intf_ind=openolt_pb2.IntfIndication(
+                    intf_id=intf_id, oper_state='up')))
+            stream.put(openolt_pb2.Indication(
+                intf_oper_ind=openolt_pb2.IntfOperIndication(
+                    type='pon', intf_id=intf_id, oper_state='up')))
+
+        # Discoveries interleaved across PONs, as ONUs come up in parallel
+        with self.lock:
+            onus = sorted(self.onus.itervalues(),
+                          key=lambda onu: (onu.onu_id, onu.intf_id))
+        for onu in onus:
+            if not self.running:
+                return
+            if onu.active:
+                continue
+            stream.put(openolt_pb2.Indication(
+                onu_disc_ind=openolt_pb2.OnuDiscIndication(
+                    intf_id=onu.intf_id, serial_number=onu.serial_number)))
+            if self.disc_rate > 0:
+                time.sleep(1.0 / self.disc_rate)
+
+    def onu_state(self, onu, oper_state):
+        self.indicate(openolt_pb2.Indication(
+            onu_ind=openolt_pb2.OnuIndication(
+                intf_id=onu.intf_id, onu_id=onu.onu_id,
+                serial_number=onu.serial_number, oper_state=oper_state,
+                admin_state=oper_state)))
+
+    def generate_packet_ins(self):
+        while self.running:
+            if self.pkt_in_rate <= 0:
+                time.sleep(1)
+                continue
+            time.sleep(1.0 / self.pkt_in_rate)
+            with self.lock:
+                active = [onu for onu in self.onus.itervalues()
+                          if onu.active]
+            if not active:
+                continue
+            onu = self.random.choice(active)
+            uni_id = self.random.randrange(onu.unis)
+            self.indicate(openolt_pb2.Indication(
+                pkt_ind=openolt_pb2.PacketIndication(
+                    intf_type='pon', intf_id=onu.intf_id,
+                    port_no=onu.port_no(uni_id),
+                    pkt=EAPOL_GROUP_MAC + onu.mac(uni_id) + EAPOL_ETHERTYPE +
+                    '\x01\x01\x00\x00' + '\x00' * 42)))
+
+    def generate_stats(self):
+        while self.running:
+            if self.stats_interval <= 0:
+                time.sleep(1)
+                continue
+            time.sleep(self.stats_interval)
+            timestamp = int(time.time())
+            for intf_id in xrange(self.pon_ports):
+                self.indicate(openolt_pb2.Indication(
+                    port_stats=openolt_pb2.PortStatistics(
+                        intf_id=intf_id,
+                        rx_packets=self.random.randrange(1 << 20),
+                        tx_packets=self.random.randrange(1 << 20),
+                        timestamp=timestamp)))
+
+    # Openolt service
+
+    def GetDeviceInfo(self, request, context):
+        self._rpc('GetDeviceInfo', context)
+        return openolt_pb2.DeviceInfo(
+            vendor='MOCK', model='mock-olt', hardware_version='1.0',
+            firmware_version='1.0', device_id='mock-olt',
+            device_serial_number='MOCK00000000', pon_ports=self.pon_ports,
+            technology='xgspon', onu_id_start=1, onu_id_end=MAX_ONU_ID,
+            alloc_id_start=1024, alloc_id_end=16383,
+            gemport_id_start=1024, gemport_id_end=65535,
+            flow_id_start=1, flow_id_end=16383,
+            optional_rpcs=(STREAMING_RPCS if self.streaming else []) +
+            (FLOW_BATCH_RPCS if self.flow_batch else []))
+
+    def HeartbeatCheck(self, request, context):
+        self._rpc('HeartbeatCheck', context)
+        return openolt_pb2.Heartbeat(heartbeat_signature=0x4d4f434b)
+
+    def DisableOlt(self, request, context):
+        self._rpc('DisableOlt', context)
+        self.enabled = False
+        self.indicate(openolt_pb2.Indication(
+            olt_ind=openolt_pb2.OltIndication(oper_state='down')))
+        return openolt_pb2.Empty()
+
+    def ReenableOlt(self, request, context):
+        self._rpc('ReenableOlt', context)
+        self.enabled = True
+        self.indicate(openolt_pb2.Indication(
+            olt_ind=openolt_pb2.OltIndication(oper_state='up')))
+        return openolt_pb2.Empty()
+
+    def Reboot(self, request, context):
+        self._rpc('Reboot', context)
+        for onu in self.onus.itervalues():
+            onu.active = False
+        with self.lock:
+            self.flows.clear()
+            self.tconts.clear()
+        self.indicate(STREAM_END)
+        return openolt_pb2.Empty()
+
+    def ActivateOnu(self, request, context):
+        self._rpc('ActivateOnu', context)
+        onu = self.onus_by_serial.get(request.serial_number.vendor_specific)
+        if onu is None:
+            context.abort(grpc.StatusCode.NOT_FOUND, 'unknown onu')
+        # ONU ids are assigned by the adapter
+        with self.lock:
+            if (request.intf_id, request.onu_id) != \
+                    (onu.intf_id, onu.onu_id):
+                del self.onus[(onu.intf_id, onu.onu_id)]
+                onu.intf_id, onu.onu_id = request.intf_id, request.onu_id
+                self.onus[(onu.intf_id, onu.onu_id)] = onu
+        onu.active = True
+        self.onu_state(onu, 'up')
+        return openolt_pb2.Empty()
+
+    def DeactivateOnu(self, request, context):
+        self._rpc('DeactivateOnu', context)
+        onu = self.onus.get((request.intf_id, request.onu_id))
+        if onu is not None and onu.active:
+            onu.active = False
+            self.onu_state(onu, 'down')
+        return openolt_pb2.Empty()
+
+    def DeleteOnu(self, request, context):
+        self._rpc('DeleteOnu', context)
+        return self.DeactivateOnu(request, context)
+
+    def OmciMsgOut(self, request, context):
+        self._rpc('OmciMsgOut', context)
+        pkt = request.pkt
+        # The ONU adapters send OMCI frames hex encoded
+        if len(pkt) % 2 == 0 and all(c in string.hexdigits for c in pkt):
+            pkt = binascii.unhexlify(pkt)
+        if len(pkt) > OMCI_MSG_TYPE_OFFSET:
+            msg_type = ord(pkt[OMCI_MSG_TYPE_OFFSET])
+            msg_type = (msg_type & ~OMCI_AR) | OMCI_AK
+            pkt = pkt[:OMCI_MSG_TYPE_OFFSET] + chr(msg_type) + \
+                pkt[OMCI_MSG_TYPE_OFFSET + 1:]
+        self.indicate(openolt_pb2.Indication(
+            omci_ind=openolt_pb2.OmciIndication(
+                intf_id=request.intf_id, onu_id=request.onu_id, pkt=pkt)))
+        return openolt_pb2.Empty()
+
+    def OnuPacketOut(self, request, context):
+        self._rpc('OnuPacketOut', context)
+        return openolt_pb2.Empty()
+
+    def UplinkPacketOut(self, request, context):
+        self._rpc('UplinkPacketOut', context)
+        return openolt_pb2.Empty()
+
+    def _stream(self, method, unary, request_iterator, context):
+        if not self.streaming:
+            context.abort(grpc.StatusCode.UNIMPLEMENTED,
+                          '{} disabled'.format(method))
+        with self.lock:
+            self.calls[method] += 1
+        for request in request_iterator:
+            unary(request, context)
+        return openolt_pb2.Empty()
+
+    def OmciMsgOutStream(self, request_iterator, context):
+        return self._stream('OmciMsgOutStream', self.OmciMsgOut,
+                            request_iterator, context)
+
+    def OnuPacketOutStream(self, request_iterator, context):
+        return self._stream('OnuPacketOutStream', self.OnuPacketOut,
+                            request_iterator, context)
+
+    def UplinkPacketOutStream(self, request_iterator, context):
+        return self._stream('UplinkPacketOutStream', self.UplinkPacketOut,
+                            request_iterator, context)
+
+    def FlowAdd(self, request, context):
+        self._rpc('FlowAdd', context)
+        code, details = self._flow_add(request)
+        if code != grpc.StatusCode.OK:
+            context.abort(code, details)
+        return openolt_pb2.Empty()
+
+    def FlowRemove(self, request, context):
+        self._rpc('FlowRemove', context)
+        self._flow_remove(request)
+        return openolt_pb2.Empty()
+
+    def _flow_add(self, request):
+        with self.lock:
+            key = (request.flow_id, request.flow_type)
+            if key in self.flows:
+                return grpc.StatusCode.ALREADY_EXISTS, 'flow already exists'
+            self.flows[key] = request
+        return grpc.StatusCode.OK, ''
+
+    def _flow_remove(self, request):
+        with self.lock:
+            self.flows.pop((request.flow_id, request.flow_type), None)
+        return grpc.StatusCode.OK, ''
+
+    def _flow_batch(self, method, unary, apply, request, context):
+        if not self.flow_batch:
+            context.abort(grpc.StatusCode.UNIMPLEMENTED,
+                          '{} disabled'.format(method))
+        self._rpc(method, context)
+        results = openolt_pb2.FlowBatchResult()
+        for flow in request.flows:
+            if self._fails(unary, latency=False):
+                code, details = (grpc.StatusCode.INTERNAL,
+                                 'injected {} failure'.format(unary))
+            else:
+                code, details = apply(flow)
+            results.results.add(flow_id=flow.flow_id,
+                                flow_type=flow.flow_type,
+                                code=code.value[0], details=details)
+        return results
+
+    def FlowAddBatch(self, request, context):
+        return self._flow_batch('FlowAddBatch', 'FlowAdd', self._flow_add,
+                                request, context)
+
+    def FlowRemoveBatch(self, request, context):
+        return self._flow_batch('FlowRemoveBatch', 'FlowRemove',
+                                self._flow_remove, request, context)
+
+    def EnablePonIf(self, request, context):
+        self._rpc('EnablePonIf', context)
+        self.indicate(openolt_pb2.Indication(
+            intf_oper_ind=openolt_pb2.IntfOperIndication(
+                type='pon', intf_id=request.intf_id, oper_state='up')))
+        return openolt_pb2.Empty()
+
+    def DisablePonIf(self, request, context):
+        self._rpc('DisablePonIf', context)
+        self.indicate(openolt_pb2.Indication(
+            intf_oper_ind=openolt_pb2.IntfOperIndication(
+                type='pon', intf_id=request.intf_id, oper_state='down')))
+        return openolt_pb2.Empty()
+
+    def CollectStatistics(self, request, context):
+        self._rpc('CollectStatistics', context)
+        return openolt_pb2.Empty()
+
+    def CreateTconts(self, request, context):
+        self._rpc('CreateTconts', context)
+        with self.lock:
+            self.tconts[(request.intf_id, request.onu_id,
+                         request.uni_id)] = request
+        return openolt_pb2.Empty()
+
+    def RemoveTconts(self, request, context):
+        self._rpc('RemoveTconts', context)
+        with self.lock:
+            self.tconts.pop((request.intf_id, request.onu_id,
+                             request.uni_id), None)
+        return openolt_pb2.Empty()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Mock OpenOLT agent')
+
+    parser.add_argument('--port', type=int, default=9191,
+                        help='gRPC port (default: %(default)s)')
+    parser.add_argument('--pon_ports', type=int, default=16,
+                        help='number of PON ports (default: %(default)s)')
+    parser.add_argument('--onus_per_pon', type=int, default=MAX_ONU_ID,
+                        help='number of ONUs per PON, at most {} (default: '
+                             '%(default)s)'.format(MAX_ONU_ID))
+    parser.add_argument('--unis_per_onu', type=int, default=1,
+                        help='number of UNIs per ONU (default: %(default)s)')
+    parser.add_argument('--disc_rate', type=float, default=100.0,
+                        help='ONU discoveries per second, 0 for no pacing '
+                             '(default: %(default)s)')
+    parser.add_argument('--pkt_in_rate', type=float, default=0.0,
+                        help='packet-ins per second (default: %(default)s)')
+    parser.add_argument('--stats_interval', type=float, default=0.0,
+                        help='seconds between port statistics, 0 to disable '
+                             '(default: %(default)s)')
+    parser.add_argument('--latency', action='append', metavar='METHOD=SECS',
+                        help='latency injected in a gRPC method, repeatable')
+    parser.add_argument('--error_rate', action='append',
+                        metavar='METHOD=RATE',
+                        help='fraction of the calls of a gRPC method failing, '
+                             'repeatable')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='random seed, for reproducible runs')
+    parser.add_argument('--no_streaming', dest='streaming',
+                        action='store_false',
+                        help='do not advertise nor serve the streaming '
+                             'OMCI and packet-out RPCs')
+    parser.add_argument('--no_flow_batch', dest='flow_batch',
+                        action='store_false',
+                        help='do not advertise nor serve FlowAddBatch and '
+                             'FlowRemoveBatch')
+
+    args = parser.parse_args()
+    if not 0 < args.onus_per_pon <= MAX_ONU_ID:
+        parser.error('--onus_per_pon must be between 1 and {}'.format(
+            MAX_ONU_ID))
+    return args
+
+
+def main():
+    args = parse_args()
+    agent = OpenOltMockAgent(
+        pon_ports=args.pon_ports, onus_per_pon=args.onus_per_pon,
+        unis_per_onu=args.unis_per_onu, disc_rate=args.disc_rate,
+        pkt_in_rate=args.pkt_in_rate, stats_interval=args.stats_interval,
+        latency=parse_method_values(args.latency),
+        error_rate=parse_method_values(args.error_rate), seed=args.seed,
+        streaming=args.streaming, flow_batch=args.flow_batch)
+    agent.start(args.port)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        agent.stop()
+
+
+if __name__ == '__main__':
+    main()
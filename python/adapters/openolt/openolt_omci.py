@@ -0,0 +1,311 @@
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import binascii
+import struct
+import time
+from collections import OrderedDict, deque
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, maybeDeferred
+
+from openolt_metrics import OpenOltHistogram
+
+# OMCI frame header: transaction correlation id (2 bytes), message type
+# (1 byte), device identifier (1 byte)
+OMCI_HEADER = struct.Struct('>HBB')
+OMCI_AR = 0x40  # acknowledge request
+OMCI_AK = 0x20  # acknowledgement
+
+# Round trip buckets in seconds, from 1ms to 30s
+OMCI_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                        0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class OmciDropped(Exception):
+    """
+    An OMCI request that was waiting for a window slot was dropped, as its
+    ONU was reset. It was never sent.
+    """
+    pass
+
+
+def omci_header(pkt, hex_encoded=False):
+    """
+    Returns the (transaction correlation id, message type) of an OMCI
+    frame, or (None, None) if it is too short. The frames the ONU adapters
+    send are hex encoded, the ones the OLT indicates are not.
+    """
+    if hex_encoded:
+        if len(pkt) < 2 * OMCI_HEADER.size:
+            return None, None
+        try:
+            pkt = binascii.unhexlify(pkt[:2 * OMCI_HEADER.size])
+        except (TypeError, binascii.Error):
+            return None, None
+    elif len(pkt) < OMCI_HEADER.size:
+        return None, None
+    tci, msg_type, _ = OMCI_HEADER.unpack_from(pkt)
+    return tci, msg_type
+
+
+class OpenOltOmciOnu(object):
+    """
+    OMCI tracking state of a single ONU.
+    """
+
+    def __init__(self, intf_id, onu_id):
+        self.intf_id = intf_id
+        self.onu_id = onu_id
+        # tci -> (sent time, timeout DelayedCall)
+        self.in_flight = OrderedDict()
+        # (tci, send, queued time, Deferred) waiting for a window slot
+        self.waiting = deque()
+        # Whether the ONU is in its PON waiting list
+        self.queued = False
+        self.latency = OpenOltHistogram(OMCI_LATENCY_BUCKETS)
+        self.last_response = None
+        self.requests = 0
+        self.timeouts = 0
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'in_flight': len(self.in_flight),
+            'waiting': len(self.waiting),
+            'timeouts': self.timeouts,
+            'latency': self.latency.to_dict()
+        }
+
+
+class OpenOltOmciTracker(object):
+    """
+    Matches the OMCI requests sent to the ONUs with their responses by
+    transaction correlation id, and bounds how many requests are in flight
+    per ONU (onu_window) and per PON (pon_window). Requests beyond the
+    windows wait in the adapter until a response or a timeout frees a slot.
+
+    Requests without the AR bit, and responses without the AK bit
+    (autonomous ONU notifications), are passed through untracked.
+
+    Exported to the OLT metrics:
+      omci_window_wait     time a request waited for a window slot
+      omci_round_trip      OmciMsgOut to response, through the OLT and ONU
+      omci_onu_adapter     response to the next request of the same ONU,
+                           through the ONU adapter
+      omci_timeout         requests with no response within timeout
+    Per ONU round trip histograms are kept in the tracker, see snapshot().
+    """
+
+    def __init__(self, log, metrics, onu_window, pon_window, timeout):
+        self.log = log
+        self.metrics = metrics
+        self.onu_window = max(1, onu_window)
+        self.pon_window = max(1, pon_window)
+        self.timeout = timeout
+        # intf_id -> onu_id -> OpenOltOmciOnu
+        self.pons = dict()
+        # intf_id -> requests in flight
+        self.pon_in_flight = dict()
+        # intf_id -> ONUs with requests waiting for a slot, in turn order
+        self.pon_waiting = dict()
+        self.in_flight = 0
+        self.waiting = 0
+
+    def onu(self, intf_id, onu_id):
+        onus = self.pons.setdefault(intf_id, dict())
+        onu = onus.get(onu_id)
+        if onu is None:
+            onu = onus[onu_id] = OpenOltOmciOnu(intf_id, onu_id)
+        return onu
+
+    def send(self, intf_id, onu_id, pkt, send):
+        """
+        Sends the hex encoded OMCI frame pkt with send(), a callable
+        returning a Deferred, now or once the windows allow it. Returns a
+        Deferred firing with the result of send(), or failing with
+        OmciDropped if the ONU is reset before the request is sent.
+        """
+        tci, msg_type = omci_header(pkt, hex_encoded=True)
+        if tci is None or not msg_type & OMCI_AR:
+            self.metrics.incr('omci_untracked_sent')
+            return maybeDeferred(send)
+
+        onu = self.onu(intf_id, onu_id)
+        now = time.time()
+        onu.requests += 1
+        if onu.last_response is not None:
+            self.metrics.observe('omci_onu_adapter', now - onu.last_response,
+                                 OMCI_LATENCY_BUCKETS)
+            onu.last_response = None
+
+        if not onu.waiting and self._has_room(onu):
+            self.metrics.observe('omci_window_wait', 0, OMCI_LATENCY_BUCKETS)
+            return self._send(onu, tci, send)
+
+        self.metrics.incr('omci_window_full')
+        d = Deferred()
+        onu.waiting.append((tci, send, now, d))
+        self.waiting += 1
+        if not onu.queued:
+            onu.queued = True
+            self.pon_waiting.setdefault(intf_id, deque()).append(onu)
+        self._update_gauges()
+        return d
+
+    def response(self, intf_id, onu_id, pkt):
+        """
+        Matches an OMCI frame indicated by the OLT with its request.
+        """
+        tci, msg_type = omci_header(pkt)
+        if tci is None or not msg_type & OMCI_AK:
+            self.metrics.incr('omci_autonomous')
+            return
+
+        onu = self.pons.get(intf_id, {}).get(onu_id)
+        entry = onu.in_flight.pop(tci, None) if onu is not None else None
+        if entry is None:
+            self.metrics.incr('omci_unmatched_response')
+            return
+
+        now = time.time()
+        sent, timer = entry
+        if timer.active():
+            timer.cancel()
+        onu.latency.observe(now - sent)
+        onu.last_response = now
+        self.metrics.observe('omci_round_trip', now - sent,
+                             OMCI_LATENCY_BUCKETS)
+        self._release(onu)
+
+    def reset_onu(self, intf_id, onu_id):
+        """
+        Forgets the requests of an ONU that went away, the ones waiting for
+        a slot fail with OmciDropped.
+        """
+        onu = self.pons.get(intf_id, {}).pop(onu_id, None)
+        if onu is None:
+            return
+        self.log.debug('omci-onu-stats', intf_id=intf_id, onu_id=onu_id,
+                       **onu.to_dict())
+        for (sent, timer) in onu.in_flight.itervalues():
+            if timer.active():
+                timer.cancel()
+        self.pon_in_flight[intf_id] = \
+            self.pon_in_flight.get(intf_id, 0) - len(onu.in_flight)
+        self.in_flight -= len(onu.in_flight)
+        onu.in_flight.clear()
+        if onu.queued:
+            self.pon_waiting[intf_id].remove(onu)
+            onu.queued = False
+        self._drop_waiting(onu)
+        self._pump(intf_id)
+        self._update_gauges()
+
+    def reset(self):
+        for intf_id in self.pons.keys():
+            for onu_id in self.pons[intf_id].keys():
+                self.reset_onu(intf_id, onu_id)
+        self.pons.clear()
+        self.pon_in_flight.clear()
+        self.pon_waiting.clear()
+        self._update_gauges()
+
+    def snapshot(self):
+        return {'{}.{}'.format(intf_id, onu_id): onu.to_dict()
+                for (intf_id, onus) in self.pons.iteritems()
+                for (onu_id, onu) in onus.iteritems()}
+
+    def _has_room(self, onu):
+        return len(onu.in_flight) < self.onu_window and \
+            self.pon_in_flight.get(onu.intf_id, 0) < self.pon_window
+
+    def _send(self, onu, tci, send):
+        entry = onu.in_flight.pop(tci, None)
+        if entry is not None:
+            # Retransmission by the ONU adapter, restart the clock
+            if entry[1].active():
+                entry[1].cancel()
+        else:
+            self.pon_in_flight[onu.intf_id] = \
+                self.pon_in_flight.get(onu.intf_id, 0) + 1
+            self.in_flight += 1
+        timer = reactor.callLater(self.timeout, self._timed_out, onu, tci)
+        onu.in_flight[tci] = (time.time(), timer)
+        self._update_gauges()
+
+        d = maybeDeferred(send)
+        d.addErrback(self._send_failed, onu, tci)
+        return d
+
+    def _send_failed(self, failure, onu, tci):
+        entry = onu.in_flight.pop(tci, None)
+        if entry is not None:
+            self._release(onu, entry)
+        return failure
+
+    def _timed_out(self, onu, tci):
+        if onu.in_flight.pop(tci, None) is None:
+            return
+        onu.timeouts += 1
+        self.metrics.incr('omci_timeout')
+        self.log.warn('omci-response-timeout', intf_id=onu.intf_id,
+                      onu_id=onu.onu_id, tci=tci)
+        self._release(onu)
+
+    def _release(self, onu, entry=None):
+        if entry is not None:
+            sent, timer = entry
+            if timer.active():
+                timer.cancel()
+        self.pon_in_flight[onu.intf_id] -= 1
+        self.in_flight -= 1
+        self._pump(onu.intf_id)
+        self._update_gauges()
+
+    def _pump(self, intf_id):
+        """
+        Sends the waiting requests the windows now allow, taking the ONUs of
+        the PON in turn.
+        """
+        onus = self.pon_waiting.get(intf_id)
+        for _ in xrange(len(onus) if onus else 0):
+            if not onus or \
+                    self.pon_in_flight.get(intf_id, 0) >= self.pon_window:
+                return
+            onu = onus.popleft()
+            while onu.waiting and self._has_room(onu):
+                tci, send, queued, d = onu.waiting.popleft()
+                self.waiting -= 1
+                self.metrics.observe('omci_window_wait',
+                                     time.time() - queued,
+                                     OMCI_LATENCY_BUCKETS)
+                self._send(onu, tci, send).chainDeferred(d)
+            if onu.waiting:
+                onus.append(onu)
+            else:
+                onu.queued = False
+
+    def _drop_waiting(self, onu):
+        while onu.waiting:
+            tci, send, queued, d = onu.waiting.popleft()
+            self.waiting -= 1
+            self.metrics.incr('omci_dropped')
+            d.errback(OmciDropped(onu.intf_id, onu.onu_id, tci))
+
+    def _update_gauges(self):
+        self.metrics.set_gauge('omci_in_flight', self.in_flight)
+        self.metrics.set_gauge('omci_waiting', self.waiting)
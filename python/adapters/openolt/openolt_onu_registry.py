@@ -0,0 +1,163 @@
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from twisted.internet.defer import inlineCallbacks, returnValue
+
+from voltha_protos.device_pb2 import Port
+
+
+class OpenOltOnuRegistry(object):
+    """
+    Per OLT cache of the ONU child devices, indexed by serial number, by
+    (intf_id, onu_id) and by device id, so that indications do not need a
+    round trip to the core to find their ONU.
+
+    Entries are the Device messages returned by the core. Their identity
+    (id, type, proxy address) does not change, and their connect status is
+    kept current by the device handler, which sets it from the ONU
+    indications of the OLT. Their oper status is not: the ONU adapter
+    changes it through the core, so the decisions taken on it read the
+    device from the core again, see get_current_child_device. Lookups
+    missing the registry fall back to the core and populate it.
+    """
+
+    def __init__(self, log, metrics, core_proxy, device_id, platform):
+        self.log = log
+        self.metrics = metrics
+        self.core_proxy = core_proxy
+        self.device_id = device_id
+        self.platform = platform
+        self.by_serial_number = dict()
+        self.by_intf_onu = dict()
+        self.by_device_id = dict()
+
+    def __len__(self):
+        return len(self.by_device_id)
+
+    def add(self, onu_device):
+        self.remove(onu_device.id)
+        key = (onu_device.proxy_address.channel_id,
+               onu_device.proxy_address.onu_id)
+        self.by_device_id[onu_device.id] = onu_device
+        self.by_intf_onu[key] = onu_device
+        if onu_device.serial_number:
+            self.by_serial_number[onu_device.serial_number] = onu_device
+        self.metrics.set_gauge('onu_registry_size', len(self.by_device_id))
+
+    def remove(self, device_id):
+        onu_device = self.by_device_id.pop(device_id, None)
+        if onu_device is None:
+            return
+        key = (onu_device.proxy_address.channel_id,
+               onu_device.proxy_address.onu_id)
+        if self.by_intf_onu.get(key) is onu_device:
+            del self.by_intf_onu[key]
+        if self.by_serial_number.get(onu_device.serial_number) is onu_device:
+            del self.by_serial_number[onu_device.serial_number]
+        self.metrics.set_gauge('onu_registry_size', len(self.by_device_id))
+
+    def clear(self):
+        self.by_serial_number.clear()
+        self.by_intf_onu.clear()
+        self.by_device_id.clear()
+        self.metrics.set_gauge('onu_registry_size', 0)
+
+    def get(self, serial_number=None, intf_id=None, onu_id=None,
+            device_id=None):
+        """
+        Registry only lookup, returns None on a miss.
+        """
+        if device_id is not None:
+            return self.by_device_id.get(device_id)
+        if serial_number is not None:
+            return self.by_serial_number.get(serial_number)
+        return self.by_intf_onu.get((intf_id, onu_id))
+
+    @inlineCallbacks
+    def get_child_device(self, serial_number=None, intf_id=None,
+                         onu_id=None):
+        """
+        Returns the ONU device with the given serial number, or the given
+        onu_id on intf_id, from the registry or else from the core.
+        """
+        onu_device = self.get(serial_number=serial_number, intf_id=intf_id,
+                              onu_id=onu_id)
+        if onu_device is not None:
+            self.metrics.incr('onu_registry_hit')
+            returnValue(onu_device)
+
+        self.metrics.incr('onu_registry_miss')
+        if serial_number is not None:
+            onu_device = yield self.core_proxy.get_child_device(
+                self.device_id, serial_number=serial_number)
+        else:
+            onu_device = yield self.core_proxy.get_child_device(
+                self.device_id, onu_id=onu_id,
+                parent_port_no=self.platform.intf_id_to_port_no(
+                    intf_id, Port.PON_OLT))
+
+        if onu_device is not None:
+            self.add(onu_device)
+        returnValue(onu_device)
+
+    @inlineCallbacks
+    def get_current_child_device(self, serial_number=None, intf_id=None,
+                                 onu_id=None):
+        """
+        Like get_child_device, but always reads the ONU device from the core,
+        for its current state, and refreshes the registry entry with it.
+        """
+        onu_device = self.get(serial_number=serial_number, intf_id=intf_id,
+                              onu_id=onu_id)
+        if onu_device is None:
+            onu_device = yield self.get_child_device(
+                serial_number=serial_number, intf_id=intf_id, onu_id=onu_id)
+            returnValue(onu_device)
+
+        self.metrics.incr('onu_registry_refresh')
+        current = yield self.core_proxy.get_device(onu_device.id)
+        if current is not None:
+            self.add(current)
+        else:
+            self.remove(onu_device.id)
+        returnValue(current)
+
+    @inlineCallbacks
+    def get_device(self, device_id):
+        """
+        Returns the ONU device with the given device id, from the registry
+        or else from the core. Used on the OMCI request path, its hits and
+        misses are counted apart.
+        """
+        onu_device = self.by_device_id.get(device_id)
+        if onu_device is not None:
+            self.metrics.incr('onu_registry_device_hit')
+            returnValue(onu_device)
+
+        self.metrics.incr('onu_registry_device_miss')
+        onu_device = yield self.core_proxy.get_device(device_id)
+        if onu_device is not None and onu_device.parent_id == self.device_id:
+            self.add(onu_device)
+        returnValue(onu_device)
+
+    def update_connect_status(self, device_id, connect_status):
+        onu_device = self.by_device_id.get(device_id)
+        if onu_device is not None:
+            onu_device.connect_status = connect_status
+
+    def update_all_connect_status(self, connect_status):
+        for onu_device in self.by_device_id.itervalues():
+            onu_device.connect_status = connect_status
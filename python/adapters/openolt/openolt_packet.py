@@ -0,0 +1,234 @@
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import binascii
+import struct
+import time
+from collections import Counter
+
+from twisted.internet.task import LoopingCall
+
+from voltha_protos.device_pb2 import Port
+from voltha_protos import openolt_pb2
+
+# Ethernet header offsets
+ETH_TYPE_OFFSET = 12          # after the destination and source MACs
+VLAN_TAG_LEN = 4              # TPID and TCI
+ETH_TYPE_DOT1Q = 0x8100
+ETH_TYPE_DOT1AD = 0x88a8
+VLAN_TPIDS = (ETH_TYPE_DOT1Q, ETH_TYPE_DOT1AD)
+
+TPID = struct.Struct('>H')
+
+# Packet-in classes, by ethertype of the (untagged) payload
+PACKET_IN_CLASSES = {
+    0x888e: 'eapol',
+    0x88cc: 'lldp',
+    0x0800: 'ipv4',
+    0x86dd: 'ipv6',
+    0x0806: 'arp',
+}
+DEFAULT_PACKET_IN_CLASS = 'default'
+
+# <class>:<packets per second>:<burst>, per logical port
+DEFAULT_PACKET_IN_RATES = 'eapol:20:50,lldp:5:10,ipv4:50:200,ipv6:50:200,' \
+                          'arp:20:50,default:20:50'
+
+
+class HexDump(object):
+    """
+    Hex encodes a packet only when a log line holding it is rendered, so
+    that packets logged at debug level cost nothing when debug is off.
+    """
+
+    __slots__ = ('pkt',)
+
+    def __init__(self, pkt):
+        self.pkt = pkt
+
+    def __str__(self):
+        return binascii.hexlify(self.pkt)
+
+    __repr__ = __str__
+
+
+def strip_outer_tag(pkt):
+    """
+    Returns the Ethernet frame pkt without its outer 802.1Q tag if it is
+    double tagged, pkt itself otherwise.
+    """
+    if len(pkt) < ETH_TYPE_OFFSET + 2 * VLAN_TAG_LEN + 2:
+        return pkt
+    (outer_tpid,) = TPID.unpack_from(pkt, ETH_TYPE_OFFSET)
+    if outer_tpid != ETH_TYPE_DOT1Q:
+        return pkt
+    (inner_tpid,) = TPID.unpack_from(pkt, ETH_TYPE_OFFSET + VLAN_TAG_LEN)
+    if inner_tpid != ETH_TYPE_DOT1Q:
+        return pkt
+    return pkt[:ETH_TYPE_OFFSET] + pkt[ETH_TYPE_OFFSET + VLAN_TAG_LEN:]
+
+
+def packet_in_class(pkt):
+    """
+    Returns the packet-in class of an Ethernet frame, from the ethertype
+    following its VLAN tags.
+    """
+    offset = ETH_TYPE_OFFSET
+    while len(pkt) >= offset + 2:
+        (eth_type,) = TPID.unpack_from(pkt, offset)
+        if eth_type not in VLAN_TPIDS:
+            return PACKET_IN_CLASSES.get(eth_type, DEFAULT_PACKET_IN_CLASS)
+        offset += VLAN_TAG_LEN
+    return DEFAULT_PACKET_IN_CLASS
+
+
+def parse_packet_in_rates(spec):
+    """
+    Parse a packet-in rate specification of the form
+    '<class>:<rate>:<burst>[,<class>:<rate>:<burst>...]'. A class without
+    a rate, or with a rate of 0, is not limited.
+    """
+    rates = dict()
+    for rate_spec in spec.split(','):
+        if not rate_spec.strip():
+            continue
+        name, rate, burst = rate_spec.strip().split(':')
+        if name != DEFAULT_PACKET_IN_CLASS and \
+                name not in PACKET_IN_CLASSES.values():
+            raise ValueError('invalid-packet-in-class: {}'.format(name))
+        rates[name] = (float(rate), float(burst))
+    return rates
+
+
+class OpenOltPacketInLimiter(object):
+    """
+    Token buckets limiting the packet-ins forwarded to the core, per logical
+    port and packet-in class, so that a single flooding subscriber cannot
+    starve the reactor or the Kafka bus.
+
+    The packets dropped per class are counted in the OLT metrics, the ports
+    dropping the most are logged every report interval.
+    """
+
+    def __init__(self, log, metrics, rates=DEFAULT_PACKET_IN_RATES,
+                 top_talkers=10):
+        self.log = log
+        self.metrics = metrics
+        self.rates = parse_packet_in_rates(rates)
+        self.top_talkers = top_talkers
+        # (port, class) -> [tokens, last refill]
+        self.buckets = dict()
+        # (port, class) -> packets dropped since the last report
+        self.dropped = Counter()
+        self.reporter = None
+
+    def allow(self, port_no, pkt, now=None):
+        """
+        Returns whether a packet-in from logical port port_no is forwarded.
+        """
+        pkt_class = packet_in_class(pkt)
+        rate = self.rates.get(pkt_class)
+        if rate is None:
+            rate = self.rates.get(DEFAULT_PACKET_IN_CLASS)
+        if rate is None or rate[0] <= 0:
+            return True
+
+        if now is None:
+            now = time.time()
+        key = (port_no, pkt_class)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [rate[1], now]
+        else:
+            bucket[0] = min(rate[1], bucket[0] + (now - bucket[1]) * rate[0])
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return True
+
+        self.dropped[key] += 1
+        self.metrics.incr('packet_in_dropped_{}'.format(pkt_class))
+        return False
+
+    def start_reporting(self, interval):
+        if interval <= 0 or self.reporter is not None:
+            return
+        self.reporter = LoopingCall(self.report)
+        self.reporter.start(interval, now=False)
+
+    def stop_reporting(self):
+        if self.reporter is not None and self.reporter.running:
+            self.reporter.stop()
+        self.reporter = None
+
+    def report(self):
+        if not self.dropped:
+            return
+        self.log.warn('packet-in-top-talkers', dropped=[
+            {'port_no': port_no, 'class': pkt_class, 'dropped': dropped}
+            for ((port_no, pkt_class), dropped)
+            in self.dropped.most_common(self.top_talkers)])
+        self.dropped.clear()
+
+
+class OpenOltPacketOutEncoder(object):
+    """
+    Turns the packet-outs received from the core into the OnuPacket or
+    UplinkPacket to send to the OLT, working on the frame bytes directly.
+
+    The egress port type and interface ids are derived once per egress port
+    and cached.
+    """
+
+    def __init__(self, platform):
+        self.platform = platform
+        # egress port -> (port type, intf_id, onu_id, uni_id)
+        self.egress_ports = dict()
+
+    def classify(self, egress_port):
+        egress = self.egress_ports.get(egress_port)
+        if egress is None:
+            port_type = self.platform.intf_id_to_port_type_name(egress_port)
+            if port_type == Port.ETHERNET_UNI:
+                egress = (port_type,
+                          self.platform.intf_id_from_uni_port_num(egress_port),
+                          self.platform.onu_id_from_port_num(egress_port),
+                          self.platform.uni_id_from_port_num(egress_port))
+            elif port_type == Port.ETHERNET_NNI:
+                egress = (port_type,
+                          self.platform.intf_id_from_nni_port_num(egress_port),
+                          None, None)
+            else:
+                egress = (port_type, None, None, None)
+            self.egress_ports[egress_port] = egress
+        return egress
+
+    def encode(self, egress_port, pkt):
+        """
+        Returns the egress port type and the message to send to the OLT, or
+        None for a port type packets cannot be sent to. The outer tag of
+        double tagged packets to an ONU is removed.
+        """
+        port_type, intf_id, onu_id, _ = self.classify(egress_port)
+        if port_type == Port.ETHERNET_UNI:
+            return port_type, openolt_pb2.OnuPacket(
+                intf_id=intf_id, onu_id=onu_id, port_no=egress_port,
+                pkt=strip_outer_tag(pkt))
+        elif port_type == Port.ETHERNET_NNI:
+            return port_type, openolt_pb2.UplinkPacket(intf_id=intf_id,
+                                                       pkt=pkt)
+        return port_type, None
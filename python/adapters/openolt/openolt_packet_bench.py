@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Packet-out encoding microbenchmark.
+
+Compares the scapy based packet-out encoding the device handler used to do
+with OpenOltPacketOutEncoder, for the packets the controller sends out:
+
+ - EAPOL to an ONU, untagged
+ - DHCP to an ONU, double tagged (the outer tag is removed)
+ - DHCP to the uplink, single tagged
+
+Both paths log at debug level, as packet_out does, through a logger
+filtering at --log_level. The OLT RPC is not part of the measure.
+
+Usage:
+
+    openolt_packet_bench.py --iterations 20000
+"""
+
+import argparse
+import binascii
+import sys
+import time
+
+import structlog
+from scapy.layers.inet import IP, UDP
+from scapy.layers.l2 import Ether, Dot1Q, EAPOL
+
+from voltha_protos import openolt_pb2
+from voltha_protos.device_pb2 import Port
+
+from openolt_flow_bench import LOG_LEVELS, level_filter
+from openolt_packet import HexDump, OpenOltPacketOutEncoder
+from openolt_platform import OpenOltPlatform
+
+UNI_PORT_NO = 3 << 11 | 5 << 4
+NNI_PORT_NO = 1 << 16
+ONU_MAC = '00:11:22:33:44:55'
+BNG_MAC = '00:aa:bb:cc:dd:ee'
+
+
+def mk_packets():
+    eapol = Ether(src=BNG_MAC, dst=ONU_MAC) / EAPOL(version=2, type=0)
+    dhcp = IP(src='10.0.0.1', dst='10.0.0.2') / \
+        UDP(sport=67, dport=68) / ('\x00' * 300)
+    return [
+        ('eapol-to-onu', UNI_PORT_NO, str(eapol)),
+        ('dhcp-to-onu-double-tagged', UNI_PORT_NO,
+         str(Ether(src=BNG_MAC, dst=ONU_MAC) / Dot1Q(vlan=100) /
+             Dot1Q(vlan=10) / dhcp)),
+        ('dhcp-to-uplink', NNI_PORT_NO,
+         str(Ether(src=ONU_MAC, dst=BNG_MAC) / Dot1Q(vlan=10) / dhcp)),
+    ]
+
+
+def scapy_packet_out(log, platform, egress_port, msg):
+    """
+    The packet-out encoding of the device handler before
+    OpenOltPacketOutEncoder.
+    """
+    pkt = Ether(msg)
+    log.debug('packet out', egress_port=egress_port,
+              packet=str(pkt).encode("HEX"))
+
+    egress_port_type = platform.intf_id_to_port_type_name(egress_port)
+    if egress_port_type == Port.ETHERNET_UNI:
+
+        if pkt.haslayer(Dot1Q):
+            outer_shim = pkt.getlayer(Dot1Q)
+            if isinstance(outer_shim.payload, Dot1Q):
+                # If double tag, remove the outer tag
+                payload = (
+                        Ether(src=pkt.src, dst=pkt.dst,
+                              type=outer_shim.type) /
+                        outer_shim.payload
+                )
+            else:
+                payload = pkt
+        else:
+            payload = pkt
+
+        send_pkt = binascii.unhexlify(str(payload).encode("HEX"))
+
+        log.debug(
+            'sending-packet-to-ONU', egress_port=egress_port,
+            intf_id=platform.intf_id_from_uni_port_num(egress_port),
+            onu_id=platform.onu_id_from_port_num(egress_port),
+            uni_id=platform.uni_id_from_port_num(egress_port),
+            port_no=egress_port,
+            packet=str(payload).encode("HEX"))
+
+        return openolt_pb2.OnuPacket(
+            intf_id=platform.intf_id_from_uni_port_num(egress_port),
+            onu_id=platform.onu_id_from_port_num(egress_port),
+            port_no=egress_port,
+            pkt=send_pkt)
+
+    elif egress_port_type == Port.ETHERNET_NNI:
+        log.debug('sending-packet-to-uplink', egress_port=egress_port,
+                  packet=str(pkt).encode("HEX"))
+
+        send_pkt = binascii.unhexlify(str(pkt).encode("HEX"))
+
+        return openolt_pb2.UplinkPacket(
+            intf_id=platform.intf_id_from_nni_port_num(egress_port),
+            pkt=send_pkt)
+
+
+def encoder_packet_out(log, encoder, egress_port, msg):
+    """
+    The packet-out encoding of the device handler.
+    """
+    log.debug('packet out', egress_port=egress_port, packet=HexDump(msg))
+    egress_port_type, packet = encoder.encode(egress_port, msg)
+    if egress_port_type == Port.ETHERNET_UNI:
+        log.debug('sending-packet-to-ONU', egress_port=egress_port,
+                  intf_id=packet.intf_id, onu_id=packet.onu_id,
+                  port_no=egress_port, packet=HexDump(packet.pkt))
+    elif egress_port_type == Port.ETHERNET_NNI:
+        log.debug('sending-packet-to-uplink', egress_port=egress_port,
+                  packet=HexDump(packet.pkt))
+    return packet
+
+
+def measure(fn, iterations):
+    start = time.time()
+    for _ in xrange(iterations):
+        fn()
+    return (time.time() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='OpenOLT packet-out encoding microbenchmark')
+    parser.add_argument('--iterations', type=int, default=20000,
+                        help='packets encoded per case and path '
+                             '(default: %(default)s)')
+    parser.add_argument('--log_level', default='error',
+                        choices=sorted(LOG_LEVELS.keys()),
+                        help='packet-out log level (default: %(default)s)')
+    args = parser.parse_args()
+
+    log = structlog.wrap_logger(
+        structlog.PrintLogger(sys.stderr),
+        processors=[level_filter(args.log_level),
+                    structlog.processors.KeyValueRenderer()])
+    platform = OpenOltPlatform(log, None)
+    encoder = OpenOltPacketOutEncoder(platform)
+
+    print('{:<28} {:>12} {:>12} {:>8}'.format('case', 'scapy_us',
+                                              'encoder_us', 'speedup'))
+    for (name, egress_port, msg) in mk_packets():
+        expected = scapy_packet_out(log, platform, egress_port, msg)
+        actual = encoder_packet_out(log, encoder, egress_port, msg)
+        if expected != actual:
+            raise AssertionError('encodings differ for {}'.format(name))
+
+        scapy_time = measure(
+            lambda: scapy_packet_out(log, platform, egress_port, msg),
+            args.iterations)
+        encoder_time = measure(
+            lambda: encoder_packet_out(log, encoder, egress_port, msg),
+            args.iterations)
+        print('{:<28} {:>12.2f} {:>12.2f} {:>7.1f}x'.format(
+            name, scapy_time * 1e6, encoder_time * 1e6,
+            scapy_time / encoder_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Request facade waiting on the Deferreds returned by the adapter.
+
+The pyvoltha facade replies (status, value) synchronously, so an adapter
+method returning a Deferred makes the reply be sent before the work is done,
+or not at all when the Deferred cannot be packed in the response. Here the
+reply waits for the Deferred and a failure is reported to the core.
+"""
+
+import structlog
+from twisted.internet.defer import Deferred, inlineCallbacks, returnValue
+
+from pyvoltha.adapters.kafka.adapter_request_facade import \
+    AdapterRequestFacade
+from voltha_protos.inter_container_pb2 import Error
+
+log = structlog.get_logger()
+
+
+def waits_for_adapter(rpc):
+    facade_method = getattr(AdapterRequestFacade, rpc)
+
+    @inlineCallbacks
+    def wait(self, *args, **kwargs):
+        try:
+            result = facade_method(self, *args, **kwargs)
+            if isinstance(result, Deferred):
+                result = yield result
+            elif isinstance(result, tuple) and len(result) == 2 \
+                    and isinstance(result[1], Deferred):
+                status, value = result
+                value = yield value
+                result = (status, value)
+        except Exception as e:
+            log.exception('adapter-request-failed', rpc=rpc, e=e)
+            result = (False, Error(reason=str(e)))
+        returnValue(result)
+
+    wait.__name__ = rpc
+    wait.__doc__ = facade_method.__doc__
+    return wait
+
+
+class OpenOltRequestFacade(AdapterRequestFacade):
+    """
+    AdapterRequestFacade replying only once the adapter work is done.
+    """
+
+    get_ofp_device_info = waits_for_adapter('get_ofp_device_info')
+    get_ofp_port_info = waits_for_adapter('get_ofp_port_info')
+    adopt_device = waits_for_adapter('adopt_device')
+    disable_device = waits_for_adapter('disable_device')
+    reenable_device = waits_for_adapter('reenable_device')
+    reboot_device = waits_for_adapter('reboot_device')
+    delete_device = waits_for_adapter('delete_device')
+    update_flows_bulk = waits_for_adapter('update_flows_bulk')
+    update_flows_incrementally = waits_for_adapter(
+        'update_flows_incrementally')
+    process_inter_adapter_message = waits_for_adapter(
+        'process_inter_adapter_message')
+    receive_packet_out = waits_for_adapter('receive_packet_out')
+    simulate_alarm = waits_for_adapter('simulate_alarm')
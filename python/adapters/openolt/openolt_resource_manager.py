@@ -21,11 +21,32 @@ from pyvoltha.common.utils.registry import registry
 from pyvoltha.common.config.config_backend import ConsulStore
 from pyvoltha.common.config.config_backend import EtcdStore
 from openolt_flow_mgr import *
+from openolt_flow_mgr import is_legacy_flow_store_cookie
 
 from voltha_protos import openolt_pb2
 from openolt_platform import OpenOltPlatform
 
 
+class OpenOltFlowKvCache(object):
+    """
+    The flow ids and flow id info of the UNIs touched by the flow updates in
+    progress, read from the KV store once and written back to it each time
+    one of them ends. The flow ids they free go back to their pools then.
+    """
+
+    def __init__(self):
+        # (pon_intf_id, onu_id, uni_id) -> flow ids, as loaded and current
+        self.loaded_flow_ids = dict()
+        self.flow_ids = dict()
+        # ((pon_intf_id, onu_id, uni_id), flow_id) -> flow info, None if
+        # there is none
+        self.flow_infos = dict()
+        # the flow infos to write back
+        self.changed_flow_infos = set()
+        # pon_intf_id -> flow ids to free
+        self.freed_flow_ids = dict()
+
+
 class OpenOltResourceMgr(object):
     BASE_PATH_KV_STORE = "service/voltha/openolt/{}"  # service/voltha/openolt/<device_id>
 
@@ -37,6 +58,13 @@ class OpenOltResourceMgr(object):
         self.extra_args = extra_args
         self.device_info = device_info
         self.args = registry('main').get_args()
+        # (pon_port, gemport) -> (onu_id, uni_id), in memory copy of the
+        # KV store map, for the packet-in path
+        self.gemport_to_onu_uni = dict()
+        # OpenOltFlowKvCache of the flow updates in progress, see
+        # begin_flow_update
+        self.flow_cache = None
+        self.flow_updates = 0
 
         # KV store's IP Address and PORT
         if self.args.backend == 'etcd':
@@ -141,11 +169,17 @@ class OpenOltResourceMgr(object):
         return onu_id
 
     def get_flow_id(self, pon_intf_id, onu_id, uni_id, flow_store_cookie,
-                    flow_category=None):
+                    flow_category=None, legacy_flow_store_cookie=None):
+        """
+        legacy_flow_store_cookie returns the cookie previous releases stored
+        for the flow. A stored flow with that cookie is migrated to
+        flow_store_cookie, and its flow id returned.
+        """
         pon_intf_onu_id = (pon_intf_id, onu_id, uni_id)
+        legacy_cookie = None
         try:
-            flow_ids = self.resource_mgrs[pon_intf_id]. \
-                get_current_flow_ids_for_onu(pon_intf_onu_id)
+            flow_ids = self.get_current_flow_ids_for_uni(pon_intf_id, onu_id,
+                                                         uni_id)
             if flow_ids is not None:
                 for flow_id in flow_ids:
                     flows = self.get_flow_id_info(pon_intf_id, onu_id, uni_id, flow_id)
@@ -158,30 +192,157 @@ class OpenOltResourceMgr(object):
                             return flow_id
                         if flow['flow_store_cookie'] == flow_store_cookie:
                             return flow_id
+                        if legacy_flow_store_cookie is not None and \
+                                is_legacy_flow_store_cookie(
+                                    flow['flow_store_cookie']):
+                            if legacy_cookie is None:
+                                legacy_cookie = legacy_flow_store_cookie()
+                            if flow['flow_store_cookie'] == legacy_cookie:
+                                flow['flow_store_cookie'] = flow_store_cookie
+                                self.update_flow_id_info_for_uni(
+                                    pon_intf_id, onu_id, uni_id, flow_id,
+                                    flows)
+                                self.log.debug('flow-store-cookie-migrated',
+                                               flow_id=flow_id,
+                                               legacy_cookie=legacy_cookie,
+                                               cookie=flow_store_cookie)
+                                return flow_id
         except Exception as e:
             self.log.error("error-retrieving-flow-info", e=e)
 
         flow_id = self.resource_mgrs[pon_intf_id].get_resource_id(
             pon_intf_onu_id[0], PONResourceManager.FLOW_ID)
         if flow_id is not None:
-            self.resource_mgrs[pon_intf_id].update_flow_id_for_onu(
-                pon_intf_onu_id, flow_id
-            )
+            self.update_flow_id_for_uni(pon_intf_id, onu_id, uni_id, flow_id)
 
         return flow_id
 
     def get_flow_id_info(self, pon_intf_id, onu_id, uni_id, flow_id):
         pon_intf_onu_id = (pon_intf_id, onu_id, uni_id)
-        return self.resource_mgrs[pon_intf_id].get_flow_id_info(pon_intf_onu_id, flow_id)
+        if self.flow_cache is None:
+            return self.resource_mgrs[pon_intf_id].get_flow_id_info(pon_intf_onu_id, flow_id)
+        key = (pon_intf_onu_id, flow_id)
+        if key not in self.flow_cache.flow_infos:
+            self.flow_cache.flow_infos[key] = self.resource_mgrs[pon_intf_id]. \
+                get_flow_id_info(pon_intf_onu_id, flow_id)
+        flow_info = self.flow_cache.flow_infos[key]
+        # Callers update the flow info they get before writing it back
+        return list(flow_info) if flow_info is not None else None
 
     def get_current_flow_ids_for_uni(self, pon_intf_id, onu_id, uni_id):
         pon_intf_onu_id = (pon_intf_id, onu_id, uni_id)
-        return self.resource_mgrs[pon_intf_id].get_current_flow_ids_for_onu(pon_intf_onu_id)
+        if self.flow_cache is None:
+            return self.resource_mgrs[pon_intf_id].get_current_flow_ids_for_onu(pon_intf_onu_id)
+        flow_ids = self._get_cached_flow_ids(pon_intf_onu_id)
+        return list(flow_ids) if flow_ids else None
+
+    def update_flow_id_for_uni(self, pon_intf_id, onu_id, uni_id, flow_id,
+                               add=True):
+        pon_intf_onu_id = (pon_intf_id, onu_id, uni_id)
+        if self.flow_cache is None:
+            return self.resource_mgrs[pon_intf_id].update_flow_id_for_onu(
+                pon_intf_onu_id, flow_id, add)
+        flow_ids = self._get_cached_flow_ids(pon_intf_onu_id)
+        if add:
+            if flow_id not in flow_ids:
+                flow_ids.append(flow_id)
+        elif flow_id in flow_ids:
+            flow_ids.remove(flow_id)
 
     def update_flow_id_info_for_uni(self, pon_intf_id, onu_id, uni_id, flow_id, flow_data):
         pon_intf_onu_id = (pon_intf_id, onu_id, uni_id)
-        return self.resource_mgrs[pon_intf_id].update_flow_id_info_for_onu(
-            pon_intf_onu_id, flow_id, flow_data)
+        if self.flow_cache is None:
+            return self.resource_mgrs[pon_intf_id].update_flow_id_info_for_onu(
+                pon_intf_onu_id, flow_id, flow_data)
+        key = (pon_intf_onu_id, flow_id)
+        self.flow_cache.flow_infos[key] = flow_data
+        self.flow_cache.changed_flow_infos.add(key)
+
+    def begin_flow_update(self):
+        """
+        Keeps the flow ids and flow id info the flow updates read and write
+        in memory. Each end_flow_update writes back what changed, once per
+        KV key, so that an update is stored when it ends even if others are
+        still in progress. The memory copy is dropped once
+        end_flow_update has been called as many times as begin_flow_update.
+        """
+        if self.flow_cache is None:
+            self.flow_cache = OpenOltFlowKvCache()
+        self.flow_updates += 1
+
+    def end_flow_update(self):
+        self.flow_updates -= 1
+        try:
+            self._flush_flow_cache()
+        finally:
+            if self.flow_updates == 0:
+                self.flow_cache = None
+
+    def _flush_flow_cache(self):
+        flow_cache = self.flow_cache
+
+        for (pon_intf_onu_id, flow_ids) in flow_cache.flow_ids.iteritems():
+            loaded_flow_ids = flow_cache.loaded_flow_ids[pon_intf_onu_id]
+            if flow_ids == loaded_flow_ids:
+                continue
+            resource_mgr = self.resource_mgrs[pon_intf_onu_id[0]]
+            # PONResourceManager updates the flow id list of a UNI one flow
+            # id at a time
+            for flow_id in loaded_flow_ids:
+                if flow_id not in flow_ids:
+                    resource_mgr.update_flow_id_for_onu(pon_intf_onu_id,
+                                                        flow_id, False)
+            for flow_id in flow_ids:
+                if flow_id not in loaded_flow_ids:
+                    resource_mgr.update_flow_id_for_onu(pon_intf_onu_id,
+                                                        flow_id)
+            flow_cache.loaded_flow_ids[pon_intf_onu_id] = list(flow_ids)
+
+        for key in flow_cache.changed_flow_infos:
+            (pon_intf_onu_id, flow_id) = key
+            resource_mgr = self.resource_mgrs[pon_intf_onu_id[0]]
+            flow_info = flow_cache.flow_infos[key]
+            if flow_info is None:
+                resource_mgr.remove_flow_id_info(pon_intf_onu_id, flow_id)
+            else:
+                resource_mgr.update_flow_id_info_for_onu(pon_intf_onu_id,
+                                                         flow_id, flow_info)
+        flow_cache.changed_flow_infos.clear()
+
+        for (pon_intf_id, flow_ids) in flow_cache.freed_flow_ids.iteritems():
+            self.resource_mgrs[pon_intf_id].free_resource_id(
+                pon_intf_id, PONResourceManager.FLOW_ID, flow_ids)
+        flow_cache.freed_flow_ids.clear()
+
+    def _forget_onu_flows(self, pon_intf_id, onu_id):
+        """
+        Writes back the flow updates in progress and drops the memory copy
+        of the flows of an ONU whose resources are freed, so that they are
+        not written back over the freeing. The updates still in progress
+        for the ONU read the KV store again.
+        """
+        flow_cache = self.flow_cache
+        if flow_cache is None:
+            return
+        self._flush_flow_cache()
+        onu = (pon_intf_id, onu_id)
+        for pon_intf_onu_id in flow_cache.flow_ids.keys():
+            if pon_intf_onu_id[:2] == onu:
+                del flow_cache.flow_ids[pon_intf_onu_id]
+                del flow_cache.loaded_flow_ids[pon_intf_onu_id]
+        for key in flow_cache.flow_infos.keys():
+            if key[0][:2] == onu:
+                del flow_cache.flow_infos[key]
+
+    def _get_cached_flow_ids(self, pon_intf_onu_id):
+        flow_ids = self.flow_cache.flow_ids.get(pon_intf_onu_id)
+        if flow_ids is None:
+            loaded_flow_ids = self.resource_mgrs[pon_intf_onu_id[0]]. \
+                get_current_flow_ids_for_onu(pon_intf_onu_id) or []
+            self.flow_cache.loaded_flow_ids[pon_intf_onu_id] = loaded_flow_ids
+            flow_ids = self.flow_cache.flow_ids[pon_intf_onu_id] = \
+                list(loaded_flow_ids)
+        return flow_ids
 
     def get_alloc_id(self, pon_intf_onu_id):
         # Derive the pon_intf from the pon_intf_onu_id tuple
@@ -230,10 +391,16 @@ class OpenOltResourceMgr(object):
             # we need to derive the ONU Id for which the packet arrived based
             # on the pon_intf and gemport available in the packet_indication
             self.kv_store[str(pon_intf_gemport)] = ' '.join(map(str, (onu_id, uni_id)))
+            self.gemport_to_onu_uni[pon_intf_gemport] = (onu_id, uni_id)
 
     def get_onu_uni_from_ponport_gemport(self, pon_port, gemport):
         pon_intf_gemport = (pon_port, gemport)
-        return tuple(map(int, self.kv_store[str(pon_intf_gemport)].split(' ')))
+        onu_id_uni_id = self.gemport_to_onu_uni.get(pon_intf_gemport)
+        if onu_id_uni_id is None:
+            # Written by a previous instance of the adapter
+            onu_id_uni_id = tuple(map(int, self.kv_store[str(pon_intf_gemport)].split(' ')))
+            self.gemport_to_onu_uni[pon_intf_gemport] = onu_id_uni_id
+        return onu_id_uni_id
 
     def get_gemport_id(self, pon_intf_onu_id, num_of_id=1):
         # Derive the pon_intf and onu_id from the pon_intf_onu_id tuple
@@ -267,6 +434,7 @@ class OpenOltResourceMgr(object):
         return gemport_id_list
 
     def free_onu_id(self, pon_intf_id, onu_id):
+        self._forget_onu_flows(pon_intf_id, onu_id)
         _ = self.resource_mgrs[pon_intf_id].free_resource_id(
             pon_intf_id, PONResourceManager.ONU_ID, onu_id)
 
@@ -275,6 +443,16 @@ class OpenOltResourceMgr(object):
             pon_intf_onu_id)
 
     def free_flow_id_for_uni(self, pon_intf_id, onu_id, uni_id, flow_id):
+        if self.flow_cache is not None:
+            pon_intf_onu_id = (pon_intf_id, onu_id, uni_id)
+            self.flow_cache.freed_flow_ids.setdefault(pon_intf_id,
+                                                      []).append(flow_id)
+            self.update_flow_id_for_uni(pon_intf_id, onu_id, uni_id, flow_id,
+                                        False)
+            key = (pon_intf_onu_id, flow_id)
+            self.flow_cache.flow_infos[key] = None
+            self.flow_cache.changed_flow_infos.add(key)
+            return
         self.resource_mgrs[pon_intf_id].free_resource_id(
             pon_intf_id, PONResourceManager.FLOW_ID, flow_id)
         pon_intf_onu_id = (pon_intf_id, onu_id, uni_id)
@@ -287,6 +465,7 @@ class OpenOltResourceMgr(object):
 
         pon_intf_id = pon_intf_id_onu_id[0]
         onu_id = pon_intf_id_onu_id[1]
+        self._forget_onu_flows(pon_intf_id, onu_id)
         alloc_ids = \
             self.resource_mgrs[pon_intf_id].get_current_alloc_ids_for_onu(pon_intf_id_onu_id)
         self.resource_mgrs[pon_intf_id].free_resource_id(pon_intf_id,
@@ -315,6 +494,7 @@ class OpenOltResourceMgr(object):
         # Clear the ONU Id associated with the (pon_intf_id, gemport_id) tuple.
         for gemport_id in gemport_ids:
             del self.kv_store[str((pon_intf_id, gemport_id))]
+            self.gemport_to_onu_uni.pop((pon_intf_id, gemport_id), None)
 
     def initialize_device_resource_range_and_pool(self, resource_mgr, global_resource_mgr, arange):
         self.log.info("resource-range-pool-init", technology=resource_mgr.technology)
@@ -0,0 +1,343 @@
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Multi-process sharding of OLT device handlers.
+
+In sharded mode the adapter process started by the core is a thin router
+(OpenoltShardedAdapter). It spawns one worker process per shard, each running
+its own reactor and a regular OpenoltAdapter, and forwards every device
+specific call to the worker owning the device. Devices are assigned to
+workers by consistent hashing of the device id.
+
+Workers talk to the core and to the other adapters on their own Kafka
+topic (<adapter name>_shard_<index>), so the responses to their requests
+do not go through the router. Requests from the core and inter-adapter
+messages still arrive on the adapter topic and get forwarded.
+
+Router and workers exchange length-prefixed pickled frames over two pipes,
+mapped on the worker file descriptors REQUEST_FD and RESPONSE_FD:
+
+    request:  (request_id, method, args, kwargs)
+    response: (request_id, succeeded, result or error message)
+"""
+
+import cPickle
+import os
+import struct
+import sys
+import threading
+
+import structlog
+from hash_ring import HashRing
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, DeferredList, \
+    inlineCallbacks, maybeDeferred, returnValue
+from twisted.internet.protocol import ProcessProtocol
+
+from openolt import OpenoltAdapter
+from openolt_device import OpenoltDevice
+
+log = structlog.get_logger()
+
+REQUEST_FD = 3
+RESPONSE_FD = 4
+FRAME_HEADER = struct.Struct('>I')
+
+FIND_LOGICAL_DEVICE = '_find_logical_device'
+
+
+def encode_frame(obj):
+    payload = cPickle.dumps(obj, cPickle.HIGHEST_PROTOCOL)
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def decode_frames(buf):
+    """
+    Returns the complete frames found in buf and the remaining bytes.
+    """
+    frames = []
+    while len(buf) >= FRAME_HEADER.size:
+        (length,) = FRAME_HEADER.unpack_from(buf)
+        end = FRAME_HEADER.size + length
+        if len(buf) < end:
+            break
+        frames.append(cPickle.loads(buf[FRAME_HEADER.size:end]))
+        buf = buf[end:]
+    return frames, buf
+
+
+def shard_topic(name, index):
+    return '{}_shard_{}'.format(name, index)
+
+
+class ShardCallError(Exception):
+    pass
+
+
+class OpenOltShardProcess(ProcessProtocol):
+    """
+    Router side of a worker process.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.buf = ''
+        self.next_request_id = 0
+        self.pending = dict()  # request_id -> Deferred
+        self.running = False
+
+    def connectionMade(self):
+        self.running = True
+        log.info('shard-worker-started', shard=self.name,
+                 pid=self.transport.pid)
+
+    def call(self, method, *args, **kwargs):
+        if not self.running:
+            raise ShardCallError('shard {} is not running'.format(self.name))
+        request_id = self.next_request_id
+        self.next_request_id += 1
+        d = Deferred()
+        self.pending[request_id] = d
+        self.transport.writeToChild(
+            REQUEST_FD, encode_frame((request_id, method, args, kwargs)))
+        return d
+
+    def childDataReceived(self, childFD, data):
+        if childFD != RESPONSE_FD:
+            return
+        frames, self.buf = decode_frames(self.buf + data)
+        for (request_id, succeeded, result) in frames:
+            d = self.pending.pop(request_id, None)
+            if d is None:
+                continue
+            if succeeded:
+                d.callback(result)
+            else:
+                d.errback(ShardCallError(result))
+
+    def processEnded(self, reason):
+        self.running = False
+        log.error('shard-worker-ended', shard=self.name,
+                  reason=reason.getErrorMessage())
+        pending, self.pending = self.pending, dict()
+        for d in pending.itervalues():
+            d.errback(ShardCallError('shard {} ended'.format(self.name)))
+
+    def stop(self):
+        if self.running:
+            self.transport.signalProcess('TERM')
+
+
+class OpenoltShardedAdapter(OpenoltAdapter):
+    """
+    Router adapter, forwarding device calls to the owning worker process.
+    """
+
+    def __init__(self, core_proxy, adapter_proxy, config, shards, argv):
+        super(OpenoltShardedAdapter, self).__init__(core_proxy, adapter_proxy,
+                                                    config)
+        self.shards = dict()  # shard name -> OpenOltShardProcess
+        for index in range(shards):
+            name = 'shard-{}'.format(index)
+            self.shards[name] = OpenOltShardProcess(name)
+        self.ring = HashRing(sorted(self.shards.keys()))
+        self.argv = argv
+        self.switch_capabilities = dict()  # device id -> SwitchCapability
+
+    def start(self):
+        main_py = os.path.abspath(sys.argv[0])
+        for index, name in enumerate(sorted(self.shards.keys())):
+            args = [sys.executable, main_py] + self.argv + \
+                   ['--shard_index', str(index), '--no-banner',
+                    '--no-heartbeat']
+            reactor.spawnProcess(self.shards[name], sys.executable, args,
+                                 env=os.environ,
+                                 childFDs={1: 1, 2: 2, REQUEST_FD: 'w',
+                                           RESPONSE_FD: 'r'})
+        log.info('started', interface=self.interface,
+                 shards=len(self.shards))
+
+    def stop(self):
+        for shard in self.shards.itervalues():
+            shard.stop()
+        log.info('stopped', interface=self.interface)
+
+    def owner(self, device_id):
+        return self.shards[self.ring.get_node(device_id)]
+
+    def forward(self, device_id, method, *args, **kwargs):
+        shard = self.owner(device_id)
+        log.debug('forward-to-shard', shard=shard.name, device_id=device_id,
+                  method=method)
+        return shard.call(method, *args, **kwargs)
+
+    def get_ofp_device_info(self, device):
+        # Answered from the router once the worker gave it, the facade waits
+        # on the Deferred of the first call
+        switch_capability = self.switch_capabilities.get(device.id)
+        if switch_capability is not None:
+            return switch_capability
+
+        def cache(switch_capability):
+            self.switch_capabilities[device.id] = switch_capability
+            return switch_capability
+
+        d = self.forward(device.id, 'get_ofp_device_info', device)
+        d.addCallback(cache)
+        return d
+
+    def get_ofp_port_info(self, device, port_no):
+        log.info('get_ofp_port_info', port_no=port_no, device_id=device.id)
+        return OpenoltDevice.ofp_port_capability(device, port_no)
+
+    def adopt_device(self, device):
+        log.info('adopt-device', device_id=device.id)
+        return self.forward(device.id, 'adopt_device', device)
+
+    def reconcile_device(self, device):
+        log.info('reconcile-device', device_id=device.id)
+        self.switch_capabilities.pop(device.id, None)
+        return self.forward(device.id, 'reconcile_device', device)
+
+    def disable_device(self, device):
+        return self.forward(device.id, 'disable_device', device)
+
+    def reenable_device(self, device):
+        return self.forward(device.id, 'reenable_device', device)
+
+    def reboot_device(self, device):
+        return self.forward(device.id, 'reboot_device', device)
+
+    def delete_device(self, device):
+        self.logical_device_id_to_root_device_id.pop(device.parent_id, None)
+        self.switch_capabilities.pop(device.id, None)
+        return self.forward(device.id, 'delete_device', device)
+
+    def update_flows_bulk(self, device, flows, groups):
+        return self.forward(device.id, 'update_flows_bulk', device, flows,
+                            groups)
+
+    def update_logical_flows(self, device_id, flows_to_add, flows_to_remove,
+                             groups, device_rules_map):
+        return self.forward(device_id, 'update_logical_flows', device_id,
+                            flows_to_add, flows_to_remove, groups,
+                            device_rules_map)
+
+    def send_proxied_message(self, proxy_address, msg):
+        return self.forward(proxy_address.device_id, 'send_proxied_message',
+                            proxy_address, msg)
+
+    @inlineCallbacks
+    def receive_packet_out(self, logical_device_id, egress_port_no, msg):
+        try:
+            device_id = yield self.find_logical_device(logical_device_id)
+            if device_id is None:
+                log.error('packet-out:no-owner',
+                          logical_device_id=logical_device_id)
+                return
+            yield self.forward(device_id, 'receive_packet_out',
+                               logical_device_id, egress_port_no, msg)
+        except Exception as e:
+            log.error('packet-out:exception', e=e.message)
+
+    @inlineCallbacks
+    def find_logical_device(self, logical_device_id):
+        device_id = self.logical_device_id_to_root_device_id.get(
+            logical_device_id)
+        if device_id is not None:
+            returnValue(device_id)
+
+        # Ask every worker, only once per logical device
+        results = yield DeferredList(
+            [shard.call(FIND_LOGICAL_DEVICE, logical_device_id)
+             for shard in self.shards.itervalues()], consumeErrors=True)
+        for (succeeded, result) in results:
+            if succeeded and result is not None:
+                self.logical_device_id_to_root_device_id[logical_device_id] \
+                    = result
+                returnValue(result)
+        returnValue(None)
+
+    def process_inter_adapter_message(self, msg):
+        device_id = msg.header.proxy_device_id or msg.header.to_device_id
+        return self.forward(device_id, 'process_inter_adapter_message', msg)
+
+    def delete_child_device(self, parent_device_id, child_device):
+        return self.forward(parent_device_id, 'delete_child_device',
+                            parent_device_id, child_device)
+
+    def collect_stats(self, device_id):
+        return self.forward(device_id, 'collect_stats', device_id)
+
+    def simulate_alarm(self, device, request):
+        return self.forward(device.id, 'simulate_alarm', device, request)
+
+
+class OpenOltShardWorker(object):
+    """
+    Worker side: reads forwarded calls from the router and runs them against
+    the local OpenoltAdapter in the reactor.
+    """
+
+    def __init__(self, adapter):
+        self.adapter = adapter
+        self.write_lock = threading.Lock()
+        self.reader = None
+
+    def start(self):
+        self.reader = threading.Thread(target=self.read_requests,
+                                       name='shard-reader')
+        self.reader.setDaemon(True)
+        self.reader.start()
+
+    def read_requests(self):
+        buf = ''
+        while True:
+            data = os.read(REQUEST_FD, 65536)
+            if not data:
+                log.error('shard-router-gone')
+                reactor.callFromThread(reactor.stop)
+                return
+            frames, buf = decode_frames(buf + data)
+            for request in frames:
+                reactor.callFromThread(self.dispatch, *request)
+
+    def dispatch(self, request_id, method, args, kwargs):
+        if method == FIND_LOGICAL_DEVICE:
+            d = maybeDeferred(self.find_logical_device, *args)
+        else:
+            d = maybeDeferred(getattr(self.adapter, method), *args, **kwargs)
+        d.addCallbacks(lambda result: self.respond(request_id, True, result),
+                       lambda failure: self.respond(
+                           request_id, False, failure.getErrorMessage()))
+
+    def find_logical_device(self, logical_device_id):
+        for device_id, handler in self.adapter.devices.iteritems():
+            if getattr(handler, 'logical_device_id', None) == \
+                    logical_device_id:
+                return device_id
+        return None
+
+    def respond(self, request_id, succeeded, result):
+        try:
+            frame = encode_frame((request_id, succeeded, result))
+        except Exception as e:
+            # Results that cannot be pickled are not needed by the router
+            log.debug('shard-result-not-serializable', e=e)
+            frame = encode_frame((request_id, succeeded, None))
+        with self.write_lock:
+            os.write(RESPONSE_FD, frame)
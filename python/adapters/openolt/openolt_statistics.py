@@ -77,6 +77,10 @@ class OpenOltStatisticsMgr(object):
             except Exception as e:
                 self.log.exception('pm-setup', e=e)
 
+    def register_indication_handlers(self, router):
+        router.register('port_stats', self.port_statistics_indication)
+        router.register('flow_stats', self.flow_statistics_indication)
+
     def port_statistics_indication(self, port_stats):
         # self.log.info('port-stats-collected', stats=port_stats)
         self.ports_statistics_kpis(port_stats)
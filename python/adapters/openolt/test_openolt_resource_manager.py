@@ -0,0 +1,233 @@
+#
+# Copyright 2018 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Unit tests of the flow id bookkeeping of OpenOltResourceMgr, against the
+in-memory PON resource manager and KV store of the flow bench.
+
+Run from this directory:
+
+    python -m unittest discover -p 'test_*.py'
+"""
+
+import json
+import unittest
+
+from voltha_protos import openolt_pb2
+
+from openolt_flow_bench import CountingKvStore, mk_resource_mgr
+
+UNI = (0, 1, 0)
+COOKIE = '0,1,,2048,,,,,,,,single_tag,1024'
+LEGACY_COOKIE = '5d41402abc4b'
+
+
+def mk_device_info():
+    return openolt_pb2.DeviceInfo(
+        technology='xgspon', pon_ports=2, onu_id_start=1, onu_id_end=31,
+        alloc_id_start=1024, alloc_id_end=16383,
+        gemport_id_start=1024, gemport_id_end=65535,
+        flow_id_start=1, flow_id_end=16383)
+
+
+def flow_info(cookie, flow_type='upstream'):
+    return {'flow_store_cookie': cookie, 'flow_type': flow_type}
+
+
+class LegacyCookie(object):
+    """
+    legacy_flow_store_cookie callable, counting its calls.
+    """
+
+    def __init__(self, cookie):
+        self.cookie = cookie
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.cookie
+
+
+class OpenOltResourceMgrTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.kv_store = CountingKvStore()
+        self.resource_mgr = mk_resource_mgr(mk_device_info(), self.kv_store,
+                                            1)
+        self.pon_resource_mgr = self.resource_mgr.resource_mgrs[0]
+
+    def store_flow(self, uni, flow_id, *infos):
+        self.pon_resource_mgr.update_flow_id_for_onu(uni, flow_id)
+        self.pon_resource_mgr.update_flow_id_info_for_onu(uni, flow_id,
+                                                          list(infos))
+
+    def stored_flow_ids(self, uni):
+        return self.pon_resource_mgr.get_current_flow_ids_for_onu(uni)
+
+    def stored_flow_info(self, uni, flow_id):
+        return self.pon_resource_mgr.get_flow_id_info(uni, flow_id)
+
+    def free_flow_ids(self):
+        pool = self.kv_store.data.get('{}/flow_id_pool/0'.format(
+            self.resource_mgr.device_id))
+        return json.loads(pool)['free'] if pool is not None else []
+
+
+class TestLegacyCookieMigration(OpenOltResourceMgrTestCase):
+
+    def test_legacy_cookie_is_migrated_and_keeps_its_flow_id(self):
+        self.store_flow(UNI, 7, flow_info(LEGACY_COOKIE))
+        legacy_cookie = LegacyCookie(LEGACY_COOKIE)
+
+        flow_id = self.resource_mgr.get_flow_id(
+            *UNI, flow_store_cookie=COOKIE,
+            legacy_flow_store_cookie=legacy_cookie)
+
+        self.assertEqual(flow_id, 7)
+        self.assertEqual(self.stored_flow_info(UNI, 7),
+                         [flow_info(COOKIE)])
+        self.assertEqual(self.stored_flow_ids(UNI), [7])
+        self.assertEqual(legacy_cookie.calls, 1)
+
+    def test_legacy_cookie_is_migrated_once(self):
+        self.store_flow(UNI, 7, flow_info(LEGACY_COOKIE))
+        legacy_cookie = LegacyCookie(LEGACY_COOKIE)
+        self.resource_mgr.get_flow_id(*UNI, flow_store_cookie=COOKIE,
+                                      legacy_flow_store_cookie=legacy_cookie)
+        writes = self.kv_store.ops['write']
+
+        flow_id = self.resource_mgr.get_flow_id(
+            *UNI, flow_store_cookie=COOKIE,
+            legacy_flow_store_cookie=legacy_cookie)
+
+        self.assertEqual(flow_id, 7)
+        self.assertEqual(legacy_cookie.calls, 1)
+        self.assertEqual(self.kv_store.ops['write'], writes)
+
+    def test_legacy_cookie_of_another_flow_is_left_alone(self):
+        self.store_flow(UNI, 7, flow_info(LEGACY_COOKIE))
+        legacy_cookie = LegacyCookie('0123456789ab')
+
+        flow_id = self.resource_mgr.get_flow_id(
+            *UNI, flow_store_cookie=COOKIE,
+            legacy_flow_store_cookie=legacy_cookie)
+
+        self.assertNotEqual(flow_id, 7)
+        self.assertEqual(self.stored_flow_info(UNI, 7),
+                         [flow_info(LEGACY_COOKIE)])
+        self.assertEqual(sorted(self.stored_flow_ids(UNI)),
+                         sorted([7, flow_id]))
+
+    def test_legacy_cookie_is_migrated_during_a_flow_update(self):
+        self.store_flow(UNI, 7, flow_info(LEGACY_COOKIE))
+        self.resource_mgr.begin_flow_update()
+
+        flow_id = self.resource_mgr.get_flow_id(
+            *UNI, flow_store_cookie=COOKIE,
+            legacy_flow_store_cookie=LegacyCookie(LEGACY_COOKIE))
+        self.assertEqual(self.stored_flow_info(UNI, 7),
+                         [flow_info(LEGACY_COOKIE)])
+        self.resource_mgr.end_flow_update()
+
+        self.assertEqual(flow_id, 7)
+        self.assertEqual(self.stored_flow_info(UNI, 7),
+                         [flow_info(COOKIE)])
+
+
+class TestFlowUpdates(OpenOltResourceMgrTestCase):
+
+    def add_flow(self, uni, cookie, flow_type='upstream'):
+        flow_id = self.resource_mgr.get_flow_id(*uni,
+                                                flow_store_cookie=cookie)
+        self.resource_mgr.update_flow_id_info_for_uni(
+            uni[0], uni[1], uni[2], flow_id, [flow_info(cookie, flow_type)])
+        return flow_id
+
+    def test_update_writes_back_when_it_ends(self):
+        self.resource_mgr.begin_flow_update()
+        flow_id = self.add_flow(UNI, COOKIE)
+        self.assertIsNone(self.stored_flow_ids(UNI))
+
+        self.resource_mgr.end_flow_update()
+
+        self.assertEqual(self.stored_flow_ids(UNI), [flow_id])
+        self.assertEqual(self.stored_flow_info(UNI, flow_id),
+                         [flow_info(COOKIE)])
+        self.assertIsNone(self.resource_mgr.flow_cache)
+
+    def test_overlapping_updates_each_write_back_when_they_end(self):
+        other_uni = (0, 2, 0)
+        self.resource_mgr.begin_flow_update()
+        self.resource_mgr.begin_flow_update()
+        flow_id = self.add_flow(UNI, COOKIE)
+
+        self.resource_mgr.end_flow_update()
+
+        self.assertEqual(self.stored_flow_ids(UNI), [flow_id])
+        self.assertEqual(self.stored_flow_info(UNI, flow_id),
+                         [flow_info(COOKIE)])
+
+        other_flow_id = self.add_flow(other_uni, COOKIE)
+        self.assertIsNone(self.stored_flow_ids(other_uni))
+        writes = self.kv_store.ops['write']
+
+        self.resource_mgr.end_flow_update()
+
+        self.assertEqual(self.stored_flow_ids(other_uni), [other_flow_id])
+        self.assertEqual(self.stored_flow_ids(UNI), [flow_id])
+        # Only the flow ids and flow info of the second update's UNI
+        self.assertEqual(self.kv_store.ops['write'] - writes, 2)
+        self.assertIsNone(self.resource_mgr.flow_cache)
+
+    def test_freed_flow_id_goes_back_to_its_pool_when_the_update_ends(self):
+        flow_id = self.add_flow(UNI, COOKIE)
+        self.resource_mgr.begin_flow_update()
+
+        self.resource_mgr.free_flow_id_for_uni(*UNI, flow_id=flow_id)
+        self.assertEqual(self.free_flow_ids(), [])
+        self.resource_mgr.end_flow_update()
+
+        self.assertEqual(self.free_flow_ids(), [flow_id])
+        self.assertEqual(self.stored_flow_ids(UNI), [])
+        self.assertIsNone(self.stored_flow_info(UNI, flow_id))
+
+    def test_onu_freed_during_an_update_is_not_written_back(self):
+        other_uni = (0, 2, 0)
+        self.pon_resource_mgr.init_resource_map(UNI)
+        self.pon_resource_mgr.update_gemport_ids_for_onu(UNI, [1024])
+        self.resource_mgr.gemport_to_onu_uni[(0, 1024)] = (1, 0)
+        self.kv_store[str((0, 1024))] = '1 0'
+        flow_id = self.add_flow(UNI, COOKIE)
+        self.resource_mgr.begin_flow_update()
+        self.add_flow(UNI, COOKIE, flow_type='downstream')
+        other_flow_id = self.add_flow(other_uni, COOKIE)
+
+        self.resource_mgr.free_pon_resources_for_onu(UNI)
+
+        self.assertIsNone(self.stored_flow_ids(UNI))
+        self.assertIsNone(self.stored_flow_info(UNI, flow_id))
+        self.assertEqual(self.free_flow_ids().count(flow_id), 1)
+
+        self.resource_mgr.end_flow_update()
+
+        self.assertIsNone(self.stored_flow_ids(UNI))
+        self.assertIsNone(self.stored_flow_info(UNI, flow_id))
+        # The other ONU's update is written back
+        self.assertEqual(self.stored_flow_ids(other_uni), [other_flow_id])
+
+
+if __name__ == '__main__':
+    unittest.main()